@@ -46,7 +46,7 @@ _sata_io = [
 # SATATestSoC --------------------------------------------------------------------------------------
 
 class SATATestSoC(SoCMini):
-    def __init__(self, platform, gen="gen3", data_width=16, with_analyzer=False):
+    def __init__(self, platform, gen="gen3", data_width=16, with_analyzer=False, with_workload=False):
         assert gen in ["gen1", "gen2", "gen3"]
         sys_clk_freq = int(200e6)
 
@@ -76,7 +76,7 @@ class SATATestSoC(SoCMini):
         self.submodules.sata_crossbar = LiteSATACrossbar(self.sata_core)
 
         # BIST
-        self.submodules.sata_bist = LiteSATABIST(self.sata_crossbar, with_csr=True)
+        self.submodules.sata_bist = LiteSATABIST(self.sata_crossbar, with_csr=True, with_workload=with_workload)
         self.add_csr("sata_bist")
 
         # Timing constraints
@@ -135,11 +135,12 @@ def main():
     parser.add_argument("--load",          action="store_true", help="Load bitstream (to SRAM)")
     parser.add_argument("--gen",           default="3",         help="SATA Gen: 1, 2 or 3 (default)")
     parser.add_argument("--with-analyzer", action="store_true", help="Add LiteScope Analyzer")
+    parser.add_argument("--with-workload", action="store_true", help="Add BIST Workload (mixed IOPS/latency tests)")
     args = parser.parse_args()
 
     platform = genesys2.Platform()
     platform.add_extension(_sata_io)
-    soc = SATATestSoC(platform, "gen" + args.gen, with_analyzer=args.with_analyzer)
+    soc = SATATestSoC(platform, "gen" + args.gen, with_analyzer=args.with_analyzer, with_workload=args.with_workload)
     builder = Builder(soc, csr_csv="csr.csv")
     builder.build(run=args.build)
 
@@ -77,7 +77,7 @@ class _CRG(Module):
 # SATATestSoC --------------------------------------------------------------------------------------
 
 class SATATestSoC(SoCMini):
-    def __init__(self, platform, connector="fmc", gen="gen3", data_width=16, with_analyzer=False):
+    def __init__(self, platform, connector="fmc", gen="gen3", data_width=16, with_analyzer=False, with_workload=False):
         assert connector in ["fmc", "sfp", "pcie"]
         assert gen in ["gen1", "gen2", "gen3"]
         sys_clk_freq = int(200e6)
@@ -121,7 +121,7 @@ class SATATestSoC(SoCMini):
         self.submodules.sata_crossbar = LiteSATACrossbar(self.sata_core)
 
         # BIST
-        self.submodules.sata_bist = LiteSATABIST(self.sata_crossbar, with_csr=True)
+        self.submodules.sata_bist = LiteSATABIST(self.sata_crossbar, with_csr=True, with_workload=with_workload)
         self.add_csr("sata_bist")
 
         # Block2Mem DMA
@@ -187,11 +187,12 @@ def main():
     parser.add_argument("--gen",           default="3",         help="SATA Gen: 1, 2 or 3 (default)")
     parser.add_argument("--connector",     default="fmc",       help="SATA Connector: fmc (default) , sfp or pcie")
     parser.add_argument("--with-analyzer", action="store_true", help="Add LiteScope Analyzer")
+    parser.add_argument("--with-workload", action="store_true", help="Add BIST Workload (mixed IOPS/latency tests)")
     args = parser.parse_args()
 
     platform = kc705.Platform()
     platform.add_extension(_sata_io)
-    soc = SATATestSoC(platform, args.connector, "gen" + args.gen, with_analyzer=args.with_analyzer)
+    soc = SATATestSoC(platform, args.connector, "gen" + args.gen, with_analyzer=args.with_analyzer, with_workload=args.with_workload)
     builder = Builder(soc, csr_csv="csr.csv")
     builder.build(run=args.build)
 
@@ -83,6 +83,43 @@ class LiteSATABISTCheckerDriver(LiteSATABISTUnitDriver):
     def __init__(self, regs, constants, name):
         LiteSATABISTUnitDriver.__init__(self, regs, constants,name + "_checker")
 
+# Workload Driver ----------------------------------------------------------------------------------
+
+class LiteSATABISTWorkloadDriver(LiteSATABISTUnitDriver):
+    def __init__(self, regs, constants, name):
+        LiteSATABISTUnitDriver.__init__(self, regs, constants, name + "_workload")
+        for s in ["span", "write_ratio", "sizes",
+                  "rd_commands", "rd_bytes", "rd_cycles",
+                  "wr_commands", "wr_bytes", "wr_cycles"]:
+            setattr(self, s, getattr(regs, self.name + "_" + s))
+
+    def run(self, sector, span, count, sizes, write_ratio, random, blocking=True):
+        self.span.write(span)
+        self.write_ratio.write(write_ratio)
+        self.sizes.write(sum(size << 16*i for i, size in enumerate(sizes)))
+        self.sector.write(sector)
+        self.count.write(count)
+        self.loops.write(1) # rd_*/wr_* statistics are reset on each workload start.
+        self.random.write(random)
+        self.start.write(1)
+        if blocking:
+            while (self.done.read() == 0):
+                pass
+        aborted = self.aborted.read()
+        errors  = self.errors.read()
+        self.time = self.cycles.read()/self.frequency
+        results = OrderedDict()
+        for direction in ["rd", "wr"]:
+            commands = getattr(self, direction + "_commands").read()
+            nbytes   = getattr(self, direction + "_bytes").read()
+            cycles   = getattr(self, direction + "_cycles").read()
+            results[direction] = {
+                "iops"    : commands/self.time,
+                "speed"   : nbytes/self.time,
+                "latency" : cycles/(commands*self.frequency) if commands else 0,
+            }
+        return (aborted, errors, results)
+
 # Identify Driver ----------------------------------------------------------------------------------
 
 class LiteSATABISTIdentifyDriver:
@@ -160,6 +197,10 @@ def _get_args():
     parser.add_argument("-t", "--software_timer",    action="store_true", help="Use software timer")
     parser.add_argument("-a", "--random_addressing", action="store_true", help="Use random addressing")
     parser.add_argument("-d", "--delayed_read",      action="store_true", help="Read after total length has been written")
+    parser.add_argument("-w", "--workload",          action="store_true", help="Run a mixed workload (IOPS/latency, bench built with --with-workload)")
+    parser.add_argument("--workload_commands",       default=4096,        help="Number of commands of the workload (up to 65535)")
+    parser.add_argument("--workload_sizes",          default="4,4,4,32",  help="Workload transfer sizes (4 sizes in KiB, powers of 2)")
+    parser.add_argument("--workload_write_ratio",    default=50,          help="Workload write ratio (in %%)")
     return parser.parse_args()
 
 if __name__ == "__main__":
@@ -176,7 +217,21 @@ if __name__ == "__main__":
     identify.run()
     identify.hdd_info()
 
-    if not int(args.identify):
+    if args.workload:
+        workload    = LiteSATABISTWorkloadDriver(wb.regs, wb.constants, "sata_bist")
+        sizes       = [int(size)*kb//logical_sector_size for size in args.workload_sizes.split(",")]
+        span        = 2**(int(args.total_length)*mb//logical_sector_size).bit_length()//2
+        write_ratio = min(int(args.workload_write_ratio)*256//100, 255)
+        aborted, errors, results = workload.run(0, span, int(args.workload_commands), sizes,
+            write_ratio, int(args.random_addressing))
+        for direction, name in [("rd", "reads"), ("wr", "writes")]:
+            print("{:6s}: {:9.1f} IOPS {:7.2f}MiB/s latency:{:8.1f}us".format(
+                name,
+                results[direction]["iops"],
+                results[direction]["speed"]/mb,
+                results[direction]["latency"]*1e6))
+        print("errors:{:d} aborted:{:d}".format(errors, aborted))
+    elif not int(args.identify):
         count             = int(args.transfer_size)*kb//logical_sector_size
         loops             = int(args.loops)
         length            = int(args.total_length)*mb
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+#
+# This file is part of LiteSATA.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+import argparse
+
+from litex import RemoteClient
+
+# Percentiles --------------------------------------------------------------------------------------
+
+def percentiles(buckets, ps):
+    """Return the upper bound (in cycles) of the log2 bucket reaching each percentile of ps."""
+    total = sum(buckets)
+    r     = []
+    for p in ps:
+        if total == 0:
+            r.append(0)
+            continue
+        target = p*total/100
+        acc    = 0
+        for n, value in enumerate(buckets):
+            acc += value
+            if acc >= target:
+                break
+        r.append(2**(n + 1) - 1)
+    return r
+
+# Latency Monitor Driver ---------------------------------------------------------------------------
+
+class LiteSATALatencyMonitorDriver:
+    def __init__(self, regs, constants, name):
+        self.regs      = regs
+        self.name      = name
+        self.frequency = constants.config_clock_frequency
+        for s in ["clear", "bucket", "bucket_value", "count", "max"]:
+            setattr(self, s, getattr(regs, name + "_" + s))
+        self.nbuckets = 32
+
+    def reset(self):
+        self.clear.write(1)
+
+    def read_buckets(self):
+        buckets = []
+        for n in range(self.nbuckets):
+            self.bucket.write(n)
+            buckets.append(self.bucket_value.read())
+        return buckets
+
+    def report(self, ps=[50, 99, 99.9]):
+        buckets = self.read_buckets()
+        print("commands: {:d}".format(self.count.read()))
+        for p, cycles in zip(ps, percentiles(buckets, ps)):
+            print("p{:<5}: < {:10.2f}us ({:d} cycles)".format(p, cycles*1e6/self.frequency, cycles))
+        latency = self.max.read()
+        print("max   : {:12.2f}us ({:d} cycles)".format(latency*1e6/self.frequency, latency))
+
+# Run ----------------------------------------------------------------------------------------------
+
+def _get_args():
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
+        description="""LiteSATA bench latency utility.""")
+    parser.add_argument("-n", "--name",  default="sata_latency", help="Latency monitor CSR name")
+    parser.add_argument("-c", "--clear", action="store_true",    help="Clear histogram (after report)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = _get_args()
+    wb   = RemoteClient()
+    wb.open()
+
+    # # #
+
+    monitor = LiteSATALatencyMonitorDriver(wb.regs, wb.constants, args.name)
+    monitor.report()
+    if args.clear:
+        monitor.reset()
+
+    # # #
+
+    wb.close()
@@ -95,11 +95,13 @@ class _RisingEdge(Module):
 fis_max_dwords = 2048
 
 fis_types = {
-    "REG_H2D":          0x27,
-    "REG_D2H":          0x34,
-    "DMA_ACTIVATE_D2H": 0x39,
-    "PIO_SETUP_D2H":    0x5f,
-    "DATA":             0x46
+    "REG_H2D":             0x27,
+    "REG_D2H":             0x34,
+    "DMA_ACTIVATE_D2H":    0x39,
+    "PIO_SETUP_D2H":       0x5f,
+    "DMA_SETUP":           0x41,
+    "SET_DEVICE_BITS_D2H": 0xa1,
+    "DATA":                0x46
 }
 
 fis_reg_h2d_header_length = 5
@@ -173,6 +175,40 @@ fis_pio_setup_d2h_header = Header(fis_pio_setup_d2h_header_fields,
                                   fis_pio_setup_d2h_header_length,
                                   swap_field_bytes=False)
 
+fis_dma_setup_header_length = 7
+fis_dma_setup_header_fields = {
+    "type":               HeaderField(0*4,  0, 8),
+    "pm_port":            HeaderField(0*4,  8, 4),
+    "d":                  HeaderField(0*4, 13, 1),
+    "i":                  HeaderField(0*4, 14, 1),
+    "a":                  HeaderField(0*4, 15, 1),
+
+    "dma_buffer_id_lsb":  HeaderField(1*4, 0, 32),
+
+    "dma_buffer_id_msb":  HeaderField(2*4, 0, 32),
+
+    "dma_buffer_offset":  HeaderField(4*4, 0, 32),
+
+    "dma_transfer_count": HeaderField(5*4, 0, 32),
+}
+fis_dma_setup_header = Header(fis_dma_setup_header_fields,
+                              fis_dma_setup_header_length,
+                              swap_field_bytes=False)
+
+fis_set_device_bits_d2h_header_length = 2
+fis_set_device_bits_d2h_header_fields = {
+    "type":    HeaderField(0*4,  0, 8),
+    "pm_port": HeaderField(0*4,  8, 4),
+    "i":       HeaderField(0*4, 14, 1),
+    "status":  HeaderField(0*4, 16, 8), # bits 3 (drq) and 7 (bsy) are reserved.
+    "errors":  HeaderField(0*4, 24, 8),
+
+    "sactive": HeaderField(1*4, 0, 32),
+}
+fis_set_device_bits_d2h_header = Header(fis_set_device_bits_d2h_header_fields,
+                                        fis_set_device_bits_d2h_header_length,
+                                        swap_field_bytes=False)
+
 fis_data_header_length = 1
 fis_data_header_fields = {
     "type": HeaderField(0,  0, 8)
@@ -200,18 +236,23 @@ def transport_tx_description(dw):
 
 def transport_rx_description(dw):
     param_layout = [
-        ("type",            8),
-        ("pm_port",         4),
-        ("r",               1),
-        ("d",               1),
-        ("i",               1),
-        ("status",          8),
-        ("errors",          8),
-        ("lba",            48),
-        ("device",          8),
-        ("count",          16),
-        ("transfer_count", 16),
-        ("error",           1)
+        ("type",                8),
+        ("pm_port",             4),
+        ("r",                   1),
+        ("d",                   1),
+        ("i",                   1),
+        ("a",                   1),
+        ("status",              8),
+        ("errors",              8),
+        ("lba",                48),
+        ("device",              8),
+        ("count",              16),
+        ("transfer_count",     16),
+        ("dma_buffer_id",      64),
+        ("dma_buffer_offset",  32),
+        ("dma_transfer_count", 32),
+        ("sactive",            32),
+        ("error",               1)
     ]
     payload_layout = [("data", dw)]
     return EndpointDescription(payload_layout, param_layout)
@@ -220,11 +261,36 @@ def transport_rx_description(dw):
 # Command Layer ------------------------------------------------------------------------------------
 
 regs = {
-    "WRITE_DMA_EXT":   0x35,
-    "READ_DMA_EXT":    0x25,
-    "IDENTIFY_DEVICE": 0xec
+    "WRITE_DMA_EXT":       0x35,
+    "READ_DMA_EXT":        0x25,
+    "WRITE_FPDMA_QUEUED":  0x61,
+    "READ_FPDMA_QUEUED":   0x60,
+    "IDENTIFY_DEVICE":     0xec,
+    "DATA_SET_MANAGEMENT": 0x06,
+    "FLUSH_CACHE_EXT":     0xea,
+    "SET_FEATURES":        0xef
+}
+
+set_features = {
+    "ENABLE_WRITE_CACHE":  0x02,
+    "DISABLE_WRITE_CACHE": 0x82
 }
 
+ncq_max_depth = 32
+
+# Device Control register (Device Control FIS: REG H2D with C=0). SRST is held for
+# srst_hold_cycles (> 5us up to a 200MHz system clk) before being cleared.
+device_control = {
+    "srst": 0x04
+}
+srst_hold_cycles = 1024
+
+# DATA SET MANAGEMENT: TRIM bit in features, 512-byte blocks of 64-bit range entries (LBA in
+# bits 0-47, number of sectors in bits 48-63, 0 for unused entries).
+dsm_trim              = 0x01
+dsm_entries_per_block = 64
+dsm_max_range_count   = 2**16 - 1
+
 reg_d2h_status = {
     "bsy":  7,
     "drdy": 6,
@@ -238,13 +304,18 @@ reg_d2h_status = {
     "err":  0
 }
 
-def command_tx_description(dw):
+def command_tx_description(dw, count_width=16):
     param_layout = [
-        ("write",    1),
-        ("read",     1),
-        ("identify", 1),
-        ("sector",  48),
-        ("count",   16)
+        ("write",        1),
+        ("read",         1),
+        ("identify",     1),
+        ("ncq",          1),
+        ("trim",         1),
+        ("flush",        1),
+        ("set_features", 1),
+        ("features",     8),
+        ("sector",      48),
+        ("count",       count_width)
     ]
     payload_layout = [("data", dw)]
     return EndpointDescription(payload_layout, param_layout)
@@ -255,6 +326,8 @@ def command_rx_description(dw):
         ("write",    1),
         ("read",     1),
         ("identify", 1),
+        ("ncq",      1),
+        ("tag",      5),
         ("end",      1),
         ("failed",   1)
     ]
@@ -267,6 +340,8 @@ def command_rx_cmd_description(dw):
         ("write",    1),
         ("read",     1),
         ("identify", 1),
+        ("ncq",      1),
+        ("tag",      5),
         ("end",      1),
         ("failed",   1)
     ]
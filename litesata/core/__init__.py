@@ -5,15 +5,38 @@
 # SPDX-License-Identifier: BSD-2-Clause
 
 from litesata.common import *
+
+from litex.soc.interconnect.csr import AutoCSR
+
 from litesata.core.link import LiteSATALink
 from litesata.core.transport import LiteSATATransport
-from litesata.core.command import LiteSATACommand
+from litesata.core.command import LiteSATACommand, LiteSATACommandRXSplitter
 
 # LiteSATA Core ------------------------------------------------------------------------------------
 
-class LiteSATACore(Module):
-    def __init__(self, phy):
-        self.submodules.link      = LiteSATALink(phy)
+class LiteSATACore(Module, AutoCSR):
+    """SATA core
+
+    Link, transport and command layers of the SATA stack.
+
+    The core datapath is 32 bits wide (one dword per sys_clk cycle), so sys_clk must be at least
+    37.5/75/150MHz for Gen1/Gen2/Gen3 line rate. Wider user ports are provided by the crossbar
+    (crossbar.get_port(dw)) but do not lower this requirement. CRCEngine/LiteSATACRC and Scrambler
+    can process 2 or 4 dwords per cycle. They are the building blocks of a 64/128 bits link layer
+    but the link, transport and command layers do not handle wider beats yet (primitives and
+    partial last beats), so they are only instantiated at 32 bits here.
+    """
+    def __init__(self, phy, with_ncq=False, ncq_depth=ncq_max_depth,
+        rx_buffer_depth=128, rx_hold_threshold=None, with_split_source=False, command_timeout=None):
+        self.submodules.link      = LiteSATALink(phy, rx_buffer_depth, rx_hold_threshold)
         self.submodules.transport = LiteSATATransport(self.link)
-        self.submodules.command   = LiteSATACommand(self.transport)
-        self.sink, self.source = self.command.sink, self.command.source
+        self.submodules.command   = LiteSATACommand(self.transport, with_ncq, ncq_depth, command_timeout)
+        self.sink = self.command.sink
+
+        # Separate status/data sources (see LiteSATACommandRXSplitter) or single source.
+        if with_split_source:
+            self.submodules.splitter = LiteSATACommandRXSplitter(len(self.command.source.data))
+            self.comb += self.command.source.connect(self.splitter.sink)
+            self.status, self.data = self.splitter.status, self.splitter.data
+        else:
+            self.source = self.command.source
@@ -7,69 +7,189 @@
 
 from litesata.common import *
 
+from litex.soc.interconnect.csr import *
+
 # Layouts ------------------------------------------------------------------------------------------
 
 tx_to_rx = [
     ("write",    1),
     ("read",     1),
     ("identify", 1),
-    ("count",    16)
+    ("non_data", 1),
+    ("count",    16),
+    ("ncq",      1),
+    ("tag",      5)
 ]
 
 rx_to_tx = [
     ("dma_activate", 1),
-    ("d2h_error",    1)
+    ("d2h_error",    1),
+    ("ncq_release",  1),
+    ("ncq_done",     1),
+    ("ncq_done_tag", 5)
 ]
 
+# LiteSATA Command Tag Allocator -------------------------------------------------------------------
+
+class LiteSATACommandTagAllocator(Module):
+    """SATA NCQ tag allocator
+
+    Keep track of the NCQ tags in use and provide the lowest free tag.
+
+    Parameters
+    ----------
+    depth : int
+        Number of tags that can be outstanding (up to 32).
+
+    Attributes
+    ----------
+    tag : out
+        Lowest free tag (valid when available is set).
+    available : out
+        At least one tag is free.
+    idle : out
+        All tags are free (no queued command outstanding).
+    alloc : in
+        Mark alloc_tag as used.
+    release : in
+        Mark release_tag as free.
+    """
+    def __init__(self, depth=ncq_max_depth):
+        assert depth <= ncq_max_depth
+        self.tag         = Signal(5)
+        self.available   = Signal()
+        self.idle        = Signal()
+        self.alloc       = Signal()
+        self.alloc_tag   = Signal(5)
+        self.release     = Signal()
+        self.release_tag = Signal(5)
+
+        # # #
+
+        used = Signal(depth)
+        for i in range(depth):
+            self.sync += \
+                If(self.alloc & (self.alloc_tag == i),
+                    used[i].eq(1)
+                ).Elif(self.release & (self.release_tag == i),
+                    used[i].eq(0)
+                )
+        for i in reversed(range(depth)):
+            self.comb += If(~used[i], self.tag.eq(i))
+        self.comb += [
+            self.available.eq(used != (2**depth - 1)),
+            self.idle.eq(used == 0)
+        ]
+
 # LiteSATA Command TX ------------------------------------------------------------------------------
 
 class LiteSATACommandTX(Module):
-    def __init__(self, transport):
+    def __init__(self, transport, with_ncq=False, ncq_depth=ncq_max_depth):
         self.sink    = sink    = stream.Endpoint(command_tx_description(32))
         self.to_rx   = to_rx   = stream.Endpoint(tx_to_rx)
         self.from_rx = from_rx = stream.Endpoint(rx_to_tx)
 
+        # Recovery (see LiteSATACommandWatchdog)
+        self.hold      = Signal() # Do not start new commands.
+        self.abort     = Signal() # Abort the command waiting for the device.
+        self.srst      = Signal() # Send a soft reset.
+        self.srst_done = Signal()
+        self.busy      = Signal()
+        self.waiting   = Signal() # Busy and not waiting for the user.
+
         # # #
 
+        is_write        = Signal()
+        is_read         = Signal()
+        is_identify     = Signal()
+        is_ncq          = Signal()
+        is_trim         = Signal()
+        is_flush        = Signal()
+        is_set_features = Signal()
+        tag             = Signal(5)
+        can_send        = Signal(reset=1)
+        dwords_counter  = Signal(max=fis_max_dwords)
+
         self.comb += [
             transport.sink.pm_port.eq(0),
-            transport.sink.features.eq(0),
             transport.sink.lba.eq(sink.sector),
-            transport.sink.device.eq(0xe0),
-            transport.sink.count.eq(sink.count),
+            If(is_ncq,
+                # FPDMA QUEUED: sector count in features, tag in count[7:3].
+                transport.sink.features.eq(sink.count),
+                transport.sink.device.eq(0x40),
+                transport.sink.count.eq(tag << 3)
+            ).Elif(is_trim,
+                # DATA SET MANAGEMENT: TRIM bit in features, number of range blocks in count.
+                transport.sink.features.eq(dsm_trim),
+                transport.sink.device.eq(0x40),
+                transport.sink.count.eq(sink.count)
+            ).Elif(is_set_features,
+                # SET FEATURES: subcommand in features.
+                transport.sink.features.eq(sink.features),
+                transport.sink.device.eq(0xe0),
+                transport.sink.count.eq(0)
+            ).Else(
+                transport.sink.features.eq(0),
+                transport.sink.device.eq(0xe0),
+                transport.sink.count.eq(sink.count)
+            ),
             transport.sink.icc.eq(0),
-            transport.sink.control.eq(0),
             transport.sink.data.eq(sink.data)
         ]
 
-        is_write       = Signal()
-        is_read        = Signal()
-        is_identify    = Signal()
-        dwords_counter = Signal(max=fis_max_dwords)
+        if with_ncq:
+            self.submodules.tags = tags = LiteSATACommandTagAllocator(ncq_depth)
+            self.comb += [
+                # Queued and non-queued commands can't be mixed on the device.
+                can_send.eq(Mux(sink.ncq, tags.available, tags.idle)),
+                tags.release.eq(from_rx.ncq_done),
+                tags.release_tag.eq(from_rx.ncq_done_tag)
+            ]
 
         self.fsm = fsm = FSM(reset_state="IDLE")
         self.submodules += fsm
         fsm.act("IDLE",
             sink.ready.eq(0),
-            If(sink.valid,
-                NextState("SEND_CMD")
+            If(self.srst,
+                NextState("SEND_SRST")
+            ).Elif(sink.valid,
+                If(can_send & ~self.hold,
+                    NextState("SEND_CMD")
+                )
             ).Else(
                 sink.ready.eq(1)
             )
         )
+        self.comb += [
+            self.busy.eq(~fsm.ongoing("IDLE")),
+            self.waiting.eq(self.busy & ~fsm.ongoing("FLUSH") &
+                ~((fsm.ongoing("SEND_CMD") | fsm.ongoing("SEND_DATA")) & ~sink.valid))
+        ]
         self.sync += \
             If(fsm.ongoing("IDLE"),
                 is_write.eq(sink.write),
                 is_read.eq(sink.read),
                 is_identify.eq(sink.identify),
+                is_trim.eq(sink.trim),
+                is_flush.eq(sink.flush),
+                is_set_features.eq(sink.set_features)
             )
+        if with_ncq:
+            self.sync += \
+                If(fsm.ongoing("IDLE"),
+                    is_ncq.eq(sink.ncq),
+                    tag.eq(tags.tag)
+                )
 
         fsm.act("SEND_CMD",
             transport.sink.valid.eq(sink.valid),
             transport.sink.last.eq(1),
             transport.sink.c.eq(1),
             If(transport.sink.valid & transport.sink.ready,
-                If(is_write,
+                If(is_ncq,
+                    sink.ready.eq(~is_write),
+                    NextState("WAIT_NCQ_RELEASE")
+                ).Elif(is_write | is_trim,
                     NextState("WAIT_DMA_ACTIVATE")
                 ).Else(
                     sink.ready.eq(1),
@@ -77,6 +197,35 @@ class LiteSATACommandTX(Module):
                 )
             )
         )
+        if with_ncq:
+            self.comb += [
+                tags.alloc.eq(fsm.ongoing("SEND_CMD") &
+                              is_ncq &
+                              transport.sink.valid &
+                              transport.sink.ready),
+                tags.alloc_tag.eq(tag)
+            ]
+        # Device releases the bus with a REG D2H before accepting another command.
+        fsm.act("WAIT_NCQ_RELEASE",
+            If(from_rx.ncq_release,
+                If(is_write,
+                    If(from_rx.d2h_error,
+                        sink.ready.eq(1),
+                        NextState("IDLE")
+                    ).Else(
+                        NextState("WAIT_DMA_ACTIVATE")
+                    )
+                ).Else(
+                    NextState("IDLE")
+                )
+            ).Elif(self.abort,
+                If(is_write,
+                    NextState("FLUSH")
+                ).Else(
+                    NextState("IDLE")
+                )
+            )
+        )
         fsm.act("WAIT_DMA_ACTIVATE",
             NextValue(dwords_counter, 0),
             If(from_rx.dma_activate,
@@ -84,6 +233,40 @@ class LiteSATACommandTX(Module):
             ).Elif(from_rx.d2h_error,
                 sink.ready.eq(1),
                 NextState("IDLE")
+            ).Elif(self.abort,
+                NextState("FLUSH")
+            )
+        )
+        # Aborted write: discard the remaining data.
+        fsm.act("FLUSH",
+            sink.ready.eq(1),
+            If(sink.valid & sink.last,
+                NextState("IDLE")
+            )
+        )
+        # Soft reset: Device Control FIS with SRST set, held, then cleared.
+        srst_timer = Signal(max=srst_hold_cycles + 1)
+        fsm.act("SEND_SRST",
+            NextValue(srst_timer, 0),
+            transport.sink.valid.eq(1),
+            transport.sink.last.eq(1),
+            transport.sink.control.eq(device_control["srst"]),
+            If(transport.sink.ready,
+                NextState("HOLD_SRST")
+            )
+        )
+        fsm.act("HOLD_SRST",
+            NextValue(srst_timer, srst_timer + 1),
+            If(srst_timer == srst_hold_cycles,
+                NextState("CLEAR_SRST")
+            )
+        )
+        fsm.act("CLEAR_SRST",
+            transport.sink.valid.eq(1),
+            transport.sink.last.eq(1),
+            If(transport.sink.ready,
+                self.srst_done.eq(1),
+                NextState("IDLE")
             )
         )
         fsm.act("SEND_DATA",
@@ -97,34 +280,76 @@ class LiteSATACommandTX(Module):
                 ).Elif(dwords_counter == (fis_max_dwords-1),
                     NextState("WAIT_DMA_ACTIVATE")
                 )
+            ).Elif(self.abort,
+                NextState("ABORT_DATA")
+            )
+        )
+        # Aborted write during a DATA FIS: terminate the FIS and discard the remaining data.
+        fsm.act("ABORT_DATA",
+            transport.sink.valid.eq(1),
+            transport.sink.last.eq(1),
+            If(transport.sink.ready,
+                NextState("FLUSH")
             )
         )
         self.comb += \
-            If(fsm.ongoing("SEND_DATA"),
+            If(fsm.ongoing("SEND_DATA") | fsm.ongoing("ABORT_DATA"),
                 transport.sink.type.eq(fis_types["DATA"]),
             ).Else(
                 transport.sink.type.eq(fis_types["REG_H2D"]),
-                If(is_write,
+                If(is_ncq,
+                    If(is_write,
+                        transport.sink.command.eq(regs["WRITE_FPDMA_QUEUED"])
+                    ).Else(
+                        transport.sink.command.eq(regs["READ_FPDMA_QUEUED"])
+                    )
+                ).Elif(is_write,
                     transport.sink.command.eq(regs["WRITE_DMA_EXT"])
+                ).Elif(is_trim,
+                    transport.sink.command.eq(regs["DATA_SET_MANAGEMENT"])
+                ).Elif(is_flush,
+                    transport.sink.command.eq(regs["FLUSH_CACHE_EXT"])
+                ).Elif(is_set_features,
+                    transport.sink.command.eq(regs["SET_FEATURES"])
                 ).Elif(is_read,
                     transport.sink.command.eq(regs["READ_DMA_EXT"]),
                 ).Else(
                     transport.sink.command.eq(regs["IDENTIFY_DEVICE"]),
                 )
             )
-        self.comb += [
-            If(sink.valid,
-                to_rx.write.eq(sink.write),
-                to_rx.read.eq(sink.read),
-                to_rx.identify.eq(sink.identify),
-                to_rx.count.eq(sink.count)
-            )
-        ]
+        if with_ncq:
+            # Queued commands are only reported to RX once sent (RX has to keep
+            # servicing the other tags until then).
+            self.comb += [
+                If(tags.alloc,
+                    to_rx.write.eq(is_write),
+                    to_rx.read.eq(is_read),
+                    to_rx.ncq.eq(1),
+                    to_rx.tag.eq(tag)
+                ).Elif(sink.valid & ~sink.ncq & ~self.hold,
+                    # TRIM follows the write protocol (DMA data-out).
+                    to_rx.write.eq(sink.write | sink.trim),
+                    to_rx.read.eq(sink.read),
+                    to_rx.identify.eq(sink.identify),
+                    to_rx.non_data.eq(sink.flush | sink.set_features),
+                    to_rx.count.eq(sink.count)
+                )
+            ]
+        else:
+            self.comb += [
+                If(sink.valid & ~self.hold,
+                    to_rx.write.eq(sink.write | sink.trim),
+                    to_rx.read.eq(sink.read),
+                    to_rx.identify.eq(sink.identify),
+                    to_rx.non_data.eq(sink.flush | sink.set_features),
+                    to_rx.count.eq(sink.count)
+                )
+            ]
 
 # LiteSATA Command RX ------------------------------------------------------------------------------
 
 class LiteSATACommandRX(Module):
-    def __init__(self, transport):
+    def __init__(self, transport, with_ncq=False, ncq_depth=ncq_max_depth):
         self.source  = source  = stream.Endpoint(command_rx_description(32))
         self.to_tx   = to_tx   = stream.Endpoint(rx_to_tx)
         self.from_tx = from_tx = stream.Endpoint(tx_to_rx)
@@ -133,11 +358,18 @@ class LiteSATACommandRX(Module):
         self.d2h_status = Signal(8)
         self.d2h_errors = Signal(8)
 
+        # Recovery (see LiteSATACommandWatchdog)
+        self.abort   = Signal() # Abort the commands waiting for the device.
+        self.busy    = Signal()
+        self.waiting = Signal() # Busy and not waiting for the user.
+
         # # #
 
         def test_type(name):
             return transport.source.type == fis_types[name]
 
+        is_write        = Signal()
+        is_read         = Signal()
         is_identify     = Signal()
         is_dma_activate = Signal()
         read_ndwords    = Signal(max=sectors2dwords(2**16))
@@ -177,6 +409,9 @@ class LiteSATACommandRX(Module):
                 self.d2h_errors.eq(transport.source.errors)
             )
 
+        ncq_busy   = Signal()
+        ncq_reject = Signal()
+
         self.fsm = fsm = FSM(reset_state="IDLE")
         self.submodules += fsm
         fsm.act("IDLE",
@@ -184,18 +419,28 @@ class LiteSATACommandRX(Module):
             transport.source.ready.eq(1),
             clr_d2h_error.eq(1),
             clr_read_error.eq(1),
-            If(from_tx.write,
-                NextState("WAIT_WRITE_ACTIVATE_OR_REG_D2H")
-            ).Elif(from_tx.read,
-                NextState("WAIT_READ_DATA_OR_REG_D2H"),
-            ).Elif(from_tx.identify,
-                NextState("WAIT_PIO_SETUP_D2H"),
+            If(~ncq_busy & ~from_tx.ncq,
+                If(from_tx.write,
+                    NextState("WAIT_WRITE_ACTIVATE_OR_REG_D2H")
+                ).Elif(from_tx.read,
+                    NextState("WAIT_READ_DATA_OR_REG_D2H"),
+                ).Elif(from_tx.identify,
+                    NextState("WAIT_PIO_SETUP_D2H"),
+                ).Elif(from_tx.non_data,
+                    NextState("WAIT_NON_DATA_REG_D2H"),
+                )
             )
         )
         self.sync += \
             If(fsm.ongoing("IDLE"),
+                is_write.eq(from_tx.write),
+                is_read.eq(from_tx.read),
                 is_identify.eq(from_tx.identify)
             )
+        self.comb += [
+            self.busy.eq(~fsm.ongoing("IDLE") | ncq_busy),
+            self.waiting.eq(self.busy & ~(source.valid & ~source.ready))
+        ]
         fsm.act("WAIT_WRITE_ACTIVATE_OR_REG_D2H",
             transport.source.ready.eq(1),
             If(transport.source.valid,
@@ -206,6 +451,8 @@ class LiteSATACommandRX(Module):
                     set_d2h_error.eq(transport.source.status[reg_d2h_status["err"]]),
                     NextState("PRESENT_WRITE_RESPONSE")
                 )
+            ).Elif(self.abort,
+                NextState("PRESENT_TIMEOUT_RESPONSE")
             )
         )
         fsm.act("PRESENT_WRITE_RESPONSE",
@@ -218,6 +465,27 @@ class LiteSATACommandRX(Module):
                 NextState("IDLE")
             )
         )
+        fsm.act("WAIT_NON_DATA_REG_D2H",
+            transport.source.ready.eq(1),
+            If(transport.source.valid,
+                If(test_type("REG_D2H"),
+                    update_d2h.eq(1),
+                    set_d2h_error.eq(transport.source.status[reg_d2h_status["err"]]),
+                    NextState("PRESENT_NON_DATA_RESPONSE")
+                )
+            ).Elif(self.abort,
+                NextState("PRESENT_TIMEOUT_RESPONSE")
+            )
+        )
+        fsm.act("PRESENT_NON_DATA_RESPONSE",
+            source.valid.eq(1),
+            source.last.eq(1),
+            source.end.eq(1),
+            source.failed.eq(transport.source.error | d2h_error),
+            If(source.valid & source.ready,
+                NextState("IDLE")
+            )
+        )
         fsm.act("WAIT_READ_DATA_OR_REG_D2H",
             transport.source.ready.eq(1),
             If(transport.source.valid,
@@ -229,6 +497,8 @@ class LiteSATACommandRX(Module):
                     set_d2h_error.eq(transport.source.status[reg_d2h_status["err"]]),
                     NextState("PRESENT_READ_RESPONSE")
                 )
+            ).Elif(self.abort,
+                NextState("PRESENT_TIMEOUT_RESPONSE")
             )
         )
         fsm.act("WAIT_PIO_SETUP_D2H",
@@ -240,12 +510,16 @@ class LiteSATACommandRX(Module):
                 ).Else(
                     NextState("FLUSH")
                 )
+            ).Elif(self.abort,
+                NextState("PRESENT_TIMEOUT_RESPONSE")
             )
         )
         fsm.act("PRESENT_PIO_SETUP_D2H",
             transport.source.ready.eq(1),
             If(transport.source.valid & transport.source.last,
                 NextState("WAIT_READ_DATA_OR_REG_D2H")
+            ).Elif(~transport.source.valid & self.abort,
+                NextState("PRESENT_TIMEOUT_RESPONSE")
             )
         )
 
@@ -268,6 +542,8 @@ class LiteSATACommandRX(Module):
                         NextState("WAIT_READ_DATA_OR_REG_D2H")
                     )
                 )
+            ).Elif(~transport.source.valid & self.abort,
+                NextState("PRESENT_TIMEOUT_RESPONSE")
             )
         )
 
@@ -282,25 +558,327 @@ class LiteSATACommandRX(Module):
             )
         )
 
+        fsm.act("PRESENT_TIMEOUT_RESPONSE",
+            source.valid.eq(1),
+            source.last.eq(1),
+            source.write.eq(is_write),
+            source.read.eq(is_read),
+            source.identify.eq(is_identify),
+            source.end.eq(1),
+            source.failed.eq(1),
+            If(source.valid & source.ready,
+                NextState("IDLE")
+            )
+        )
+
         fsm.act("FLUSH",
             transport.source.ready.eq(1),
             If(transport.source.valid & transport.source.last,
                NextState("WAIT_PIO_SETUP_D2H")
+            ).Elif(~transport.source.valid & self.abort,
+                NextState("PRESENT_TIMEOUT_RESPONSE")
             )
         )
         self.comb += [
             to_tx.dma_activate.eq(is_dma_activate),
-            to_tx.d2h_error.eq(d2h_error)
+            to_tx.d2h_error.eq(d2h_error | ncq_reject)
+        ]
+
+        # Native Command Queuing -------------------------------------------------------------------
+        #
+        # Queued commands are acknowledged by the device with a REG D2H (bus release) and then
+        # serviced in any order: a DMA Setup FIS selects the tag, DATA FISes follow (reads) or
+        # are requested through DMA Activate (writes), and completions are reported per tag
+        # through Set Device Bits FISes. For each queued command, the source presents:
+        # - an acknowledge (ncq, tag, end=0) once the command is accepted by the device.
+        # - the read data (ncq, tag, end=0).
+        # - a response (ncq, tag, end=1, failed) once the device completes it.
+        # Data transfers are expected to use a zero DMA buffer offset.
+        if with_ncq:
+            ncq_tag         = Signal(5) # Tag selected by the last DMA Setup.
+            ncq_cmd_tag     = Signal(5) # Tag of the command waiting for bus release.
+            ncq_cmd_pending = Signal()
+            ncq_release     = Signal()
+            ncq_outstanding = Signal(ncq_depth)
+            ncq_write       = Signal(ncq_depth)
+            ncq_completed   = Signal(ncq_depth)
+            ncq_failed      = Signal(ncq_depth)
+            ncq_complete    = Signal(ncq_depth)
+            ncq_fail        = Signal(ncq_depth)
+            ncq_clear       = Signal(ncq_depth)
+            ncq_resp_tag    = Signal(5)
+
+            self.sync += [
+                If(from_tx.ncq,
+                    ncq_cmd_pending.eq(1),
+                    ncq_cmd_tag.eq(from_tx.tag),
+                    ncq_write.eq((ncq_write & ~(1 << from_tx.tag)) | (from_tx.write << from_tx.tag))
+                ).Elif(ncq_release,
+                    ncq_cmd_pending.eq(0)
+                ),
+                ncq_outstanding.eq((ncq_outstanding | Mux(from_tx.ncq, 1 << from_tx.tag, 0)) & ~ncq_clear),
+                ncq_completed.eq((ncq_completed | ncq_complete) & ~ncq_clear),
+                ncq_failed.eq((ncq_failed | ncq_fail) & ~ncq_clear)
+            ]
+            self.comb += ncq_busy.eq(ncq_cmd_pending | (ncq_outstanding != 0))
+
+            for i in reversed(range(ncq_depth)):
+                self.comb += If(ncq_completed[i], ncq_resp_tag.eq(i))
+            ncq_write_array  = Array(ncq_write[i]  for i in range(ncq_depth))
+            ncq_failed_array = Array(ncq_failed[i] for i in range(ncq_depth))
+
+            fsm.act("IDLE",
+                If(transport.source.valid,
+                    If(test_type("REG_D2H") & ncq_cmd_pending,
+                        update_d2h.eq(1),
+                        ncq_release.eq(1),
+                        If(transport.source.status[reg_d2h_status["err"]],
+                            ncq_reject.eq(1),
+                            ncq_complete.eq(1 << ncq_cmd_tag),
+                            ncq_fail.eq(1 << ncq_cmd_tag)
+                        ),
+                        NextState("PRESENT_NCQ_ACK")
+                    ).Elif(test_type("DMA_SETUP"),
+                        NextValue(ncq_tag, transport.source.dma_buffer_id[:5]),
+                        If(~transport.source.d & transport.source.a,
+                            is_dma_activate.eq(1)
+                        )
+                    ).Elif(test_type("DMA_ACTIVATE_D2H"),
+                        is_dma_activate.eq(1)
+                    ).Elif(test_type("SET_DEVICE_BITS_D2H"),
+                        update_d2h.eq(1),
+                        If(transport.source.status[reg_d2h_status["err"]],
+                            # Device aborts all outstanding commands on error.
+                            ncq_complete.eq(ncq_outstanding),
+                            ncq_fail.eq(ncq_outstanding)
+                        ).Else(
+                            ncq_complete.eq(transport.source.sactive & ncq_outstanding)
+                        )
+                    ).Elif(test_type("DATA") & ncq_busy,
+                        transport.source.ready.eq(0),
+                        NextState("PRESENT_NCQ_READ_DATA")
+                    )
+                ).Elif(ncq_completed != 0,
+                    NextState("PRESENT_NCQ_RESPONSE")
+                )
+            )
+            # Aborted: report all the outstanding commands as failed.
+            fsm.act("IDLE",
+                If(self.abort,
+                    ncq_release.eq(ncq_cmd_pending),
+                    ncq_complete.eq(ncq_outstanding),
+                    ncq_fail.eq(ncq_outstanding)
+                )
+            )
+            fsm.act("PRESENT_NCQ_ACK",
+                source.valid.eq(1),
+                source.last.eq(1),
+                source.write.eq(ncq_write_array[ncq_cmd_tag]),
+                source.read.eq(~ncq_write_array[ncq_cmd_tag]),
+                source.ncq.eq(1),
+                source.tag.eq(ncq_cmd_tag),
+                If(source.valid & source.ready,
+                    NextState("IDLE")
+                )
+            )
+            fsm.act("PRESENT_NCQ_READ_DATA",
+                source.valid.eq(transport.source.valid),
+                source.last.eq(transport.source.last),
+                source.read.eq(1),
+                source.ncq.eq(1),
+                source.tag.eq(ncq_tag),
+                source.failed.eq(transport.source.error),
+                source.data.eq(transport.source.data),
+                transport.source.ready.eq(source.ready),
+                If(source.valid & source.ready,
+                    If(transport.source.error,
+                        ncq_fail.eq(1 << ncq_tag)
+                    ),
+                    If(source.last,
+                        NextState("IDLE")
+                    )
+                )
+            )
+            fsm.act("PRESENT_NCQ_RESPONSE",
+                source.valid.eq(1),
+                source.last.eq(1),
+                source.write.eq(ncq_write_array[ncq_resp_tag]),
+                source.read.eq(~ncq_write_array[ncq_resp_tag]),
+                source.ncq.eq(1),
+                source.tag.eq(ncq_resp_tag),
+                source.end.eq(1),
+                source.failed.eq(ncq_failed_array[ncq_resp_tag]),
+                If(source.valid & source.ready,
+                    ncq_clear.eq(1 << ncq_resp_tag),
+                    to_tx.ncq_done.eq(1),
+                    NextState("IDLE")
+                )
+            )
+            self.comb += [
+                to_tx.ncq_release.eq(ncq_release),
+                to_tx.ncq_done_tag.eq(ncq_resp_tag)
+            ]
+
+# LiteSATA Command RX Splitter ---------------------------------------------------------------------
+
+class LiteSATACommandRXSplitter(Module):
+    """SATA Command RX Splitter
+
+    Split a command_rx stream in a status stream (command_rx_cmd_description) and a data stream
+    (command_rx_data_description), so that the data of a read can be forwarded downstream as soon
+    as it is received and committed on its status:
+        - read data (and NCQ read data) is presented on data, with last at the end of each DATA FIS.
+        - identify data is presented on data, followed by an identify status (end=1, failed) once
+          the last dword is accepted.
+        - responses (end=1) and NCQ acknowledges (single beat, end=0) are presented on status.
+
+    Beats are split in order: the consumer has to accept both streams.
+    """
+    def __init__(self, dw):
+        self.sink   = sink   = stream.Endpoint(command_rx_description(dw))
+        self.status = status = stream.Endpoint(command_rx_cmd_description(dw))
+        self.data   = data   = stream.Endpoint(command_rx_data_description(dw))
+
+        # # #
+
+        first           = Signal(reset=1)
+        is_data         = Signal()
+        identify_failed = Signal()
+        identify_status = Signal()
+        self.comb += is_data.eq(sink.identify | (sink.read & ~sink.end & ~(sink.ncq & first & sink.last)))
+        self.sync += [
+            If(sink.valid & sink.ready,
+                first.eq(sink.last)
+            ),
+            If(status.valid & status.ready,
+                identify_failed.eq(0),
+                identify_status.eq(0)
+            ).Elif(data.valid & data.ready & sink.identify,
+                identify_failed.eq(identify_failed | sink.failed),
+                identify_status.eq(sink.last)
+            )
         ]
+        self.comb += [
+            If(identify_status,
+                status.valid.eq(1),
+                status.last.eq(1),
+                status.identify.eq(1),
+                status.end.eq(1),
+                status.failed.eq(identify_failed)
+            ).Elif(is_data,
+                data.valid.eq(sink.valid),
+                data.last.eq(sink.last),
+                data.data.eq(sink.data),
+                sink.ready.eq(data.ready)
+            ).Else(
+                sink.connect(status, omit={"data"})
+            )
+        ]
+
+# LiteSATA Command Watchdog ------------------------------------------------------------------------
+
+class LiteSATACommandWatchdog(Module, AutoCSR):
+    """SATA Command Watchdog
+
+    Recover from a device that stops responding without resetting the link: when a command makes
+    no progress for more than timeout cycles (no FIS/data dword exchanged with the transport while
+    the command layer is busy, cycles spent waiting for the user are not counted), including in
+    the middle of a DATA FIS:
+        - the command waiting for the device is aborted (remaining write data discarded) and
+          reported as failed (with all the outstanding queued commands).
+        - the device is reset with a soft reset (SRST) and its signature (REG D2H) is awaited
+          (for up to timeout cycles).
+    New commands are held during the recovery and resumed once it is done.
+
+    recoveries counts the recoveries, recovery_cycles reports the duration of the last one and
+    recovery_cycles_max the longest one.
+    """
+    def __init__(self, transport, tx, rx, timeout):
+        self.recoveries          = CSRStatus(32)
+        self.recovery_cycles     = CSRStatus(32)
+        self.recovery_cycles_max = CSRStatus(32)
+
+        # # #
+
+        timer      = Signal(max=timeout + 1)
+        timer_ce   = Signal()
+        timer_done = Signal()
+        cycles     = Signal(32)
+        self.comb += timer_done.eq(timer == timeout)
+        self.sync += \
+            If(timer_ce,
+                timer.eq(timer + 1)
+            ).Else(
+                timer.eq(0)
+            )
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        self.sync += \
+            If(fsm.ongoing("IDLE"),
+                cycles.eq(0)
+            ).Else(
+                cycles.eq(cycles + 1)
+            )
+        progress = Signal()
+        self.comb += progress.eq(
+            (transport.sink.valid   & transport.sink.ready) |
+            (transport.source.valid & transport.source.ready))
+        fsm.act("IDLE",
+            # Count while a command is busy (timer cleared on progress or when waiting for the user).
+            timer_ce.eq((tx.waiting | (rx.waiting & ~tx.busy)) & ~progress),
+            If(timer_done,
+                NextState("TX-ABORT")
+            )
+        )
+        fsm.act("TX-ABORT",
+            tx.hold.eq(1),
+            tx.abort.eq(1),
+            If(~tx.busy,
+                NextState("RX-ABORT")
+            )
+        )
+        fsm.act("RX-ABORT",
+            tx.hold.eq(1),
+            rx.abort.eq(1),
+            If(~rx.busy,
+                NextState("SOFT-RESET")
+            )
+        )
+        fsm.act("SOFT-RESET",
+            tx.hold.eq(1),
+            tx.srst.eq(1),
+            If(tx.srst_done,
+                NextState("WAIT-SIGNATURE")
+            )
+        )
+        fsm.act("WAIT-SIGNATURE",
+            tx.hold.eq(1),
+            timer_ce.eq(1),
+            If((transport.source.valid & (transport.source.type == fis_types["REG_D2H"])) | timer_done,
+                NextState("DONE")
+            )
+        )
+        fsm.act("DONE",
+            NextValue(self.recoveries.status, self.recoveries.status + 1),
+            NextValue(self.recovery_cycles.status, cycles),
+            If(cycles > self.recovery_cycles_max.status,
+                NextValue(self.recovery_cycles_max.status, cycles)
+            ),
+            NextState("IDLE")
+        )
 
 # LiteSATA Command ---------------------------------------------------------------------------------
 
-class LiteSATACommand(Module):
-    def __init__(self, transport):
-        self.submodules.tx = LiteSATACommandTX(transport)
-        self.submodules.rx = LiteSATACommandRX(transport)
+class LiteSATACommand(Module, AutoCSR):
+    def __init__(self, transport, with_ncq=False, ncq_depth=ncq_max_depth, timeout=None):
+        self.submodules.tx = LiteSATACommandTX(transport, with_ncq, ncq_depth)
+        self.submodules.rx = LiteSATACommandRX(transport, with_ncq, ncq_depth)
         self.comb += [
             self.rx.to_tx.connect(self.tx.from_rx),
             self.tx.to_rx.connect(self.rx.from_tx)
         ]
         self.sink, self.source = self.tx.sink, self.rx.source
+
+        # Optional command timeout with soft reset recovery.
+        if timeout is not None:
+            self.submodules.watchdog = LiteSATACommandWatchdog(transport, self.tx, self.rx, timeout)
@@ -22,9 +22,12 @@ class CRCEngine(Module):
     Parameters
     ----------
     width : int
-        Width of the data bus and CRC.
+        Width of the CRC.
     polynom : int
         Polynom of the CRC (ex: 0x04C11DB7 for IEEE 802.3 CRC)
+    data_width : int
+        Width of the data bus (multiple of width, defaults to width). Data is processed
+        in words of width bits, lower word first.
 
     Attributes
     ----------
@@ -35,8 +38,10 @@ class CRCEngine(Module):
     next :
         next CRC value.
     """
-    def __init__(self, width, polynom):
-        self.data = Signal(width)
+    def __init__(self, width, polynom, data_width=None):
+        data_width = width if data_width is None else data_width
+        assert data_width%width == 0
+        self.data = Signal(data_width)
         self.last = Signal(width)
         self.next = Signal(width)
 
@@ -59,26 +64,28 @@ class CRCEngine(Module):
                     r.append(k)
             return r
 
-        new = Signal(32)
-        self.comb += new.eq(self.last ^ self.data)
-
         # compute and optimize the parallel implementation of the CRC's LFSR
         taps = [x for x in range(width) if (1 << x) & polynom]
-        curval = [[("new", i)] for i in range(width)]
-        for i in range(width):
-            feedback = curval.pop()
-            for j in range(width-1):
-                if j + 1 in taps:
-                    curval[j] += feedback
-                curval[j] = _optimize_xors(curval[j])
-            curval.insert(0, feedback)
+        curval = [[("last", i)] for i in range(width)]
+        for n in range(data_width//width):
+            for i in range(width):
+                curval[i] = curval[i] + [("data", n*width + i)]
+            for i in range(width):
+                feedback = curval.pop()
+                for j in range(width-1):
+                    if j + 1 in taps:
+                        curval[j] = curval[j] + feedback
+                    curval[j] = _optimize_xors(curval[j])
+                curval.insert(0, feedback)
 
         # implement logic
         for i in range(width):
             xors = []
             for t, n in curval[i]:
-                if t == "new":
-                    xors += [new[n]]
+                if t == "last":
+                    xors += [self.last[n]]
+                elif t == "data":
+                    xors += [self.data[n]]
             self.comb += self.next[i].eq(reduce(xor, xors))
 
 
@@ -101,14 +108,14 @@ class LiteSATACRC(Module):
     init    = 0x52325032
     check   = 0x00000000
 
-    def __init__(self):
-        self.data  = Signal(self.width)
+    def __init__(self, dw=32):
+        self.data  = Signal(dw)
         self.value = Signal(self.width)
         self.error = Signal()
 
         # # #
 
-        engine = CRCEngine(self.width, self.polynom)
+        engine = CRCEngine(self.width, self.polynom, dw)
         self.submodules += engine
         reg_i = Signal(self.width, reset=self.init)
         self.sync += reg_i.eq(engine.next)
@@ -260,62 +267,44 @@ class LiteSATACRCChecker(Module):
 class Scrambler(Module):
     """SATA Scrambler
 
-    Implement a SATA Scrambler
+    Implement a SATA Scrambler (G(x) = x^16 + x^15 + x^13 + x^4 + 1)
+
+    Parameters
+    ----------
+    dw : int
+        Width of the scrambled value (multiple of 32), dw/32 dwords are generated per cycle,
+        lower dword first.
 
     Attributes
     ----------
     value : out
         Scrambled value.
     """
-    def __init__(self):
-        self.value = Signal(32)
+    polynom = 0xa011
+    init    = 0xf0f6
 
-        # # #
+    def __init__(self, dw=32):
+        assert dw%32 == 0
+        self.value = Signal(dw)
 
-        context    = Signal(16, reset=0xf0f6)
-        next_value = Signal(32)
-        self.sync += context.eq(next_value[16:32])
-
-        # XXX: from SATA specification, replace it with
-        # a generic implementation using polynoms.
-        lfsr_coefs = (
-            (15, 13, 4, 0),  # 0
-            (15, 14, 13, 5, 4, 1, 0),
-            (14, 13, 6, 5, 4, 2, 1, 0),
-            (15, 14, 7, 6, 5, 3, 2, 1),
-            (13, 8, 7, 6, 3, 2, 0),
-            (14, 9, 8, 7, 4, 3, 1),
-            (15, 10, 9, 8, 5, 4, 2),
-            (15, 13, 11, 10, 9, 6, 5, 4, 3, 0),
-            (15, 14, 13, 12, 11, 10, 7, 6, 5, 1, 0),
-            (14, 12, 11, 8, 7, 6, 4, 2, 1, 0),
-            (15, 13, 12, 9, 8, 7, 5, 3, 2, 1),
-            (15, 14, 10, 9, 8, 6, 3, 2, 0),
-            (13, 11, 10, 9, 7, 3, 1, 0),
-            (14, 12, 11, 10, 8, 4, 2, 1),
-            (15, 13, 12, 11, 9, 5, 3, 2),
-            (15, 14, 12, 10, 6, 3, 0),
-
-            (11, 7, 1, 0),  # 16
-            (12, 8, 2, 1),
-            (13, 9, 3, 2),
-            (14, 10, 4, 3),
-            (15, 11, 5, 4),
-            (15, 13, 12, 6, 5, 4, 0),
-            (15, 14, 7, 6, 5, 4, 1, 0),
-            (13, 8, 7, 6, 5, 4, 2, 1, 0),
-            (14, 9, 8, 7, 6, 5, 3, 2, 1),
-            (15, 10, 9, 8, 7, 6, 4, 3, 2),
-            (15, 13, 11, 10, 9, 8, 7, 5, 3, 0),
-            (15, 14, 13, 12, 11, 10, 9, 8, 6, 1, 0),
-            (14, 12, 11, 10, 9, 7, 4, 2, 1, 0),
-            (15, 13, 12, 11, 10, 8, 5, 3, 2, 1),
-            (15, 14, 12, 11, 9, 6, 3, 2, 0),
-            (12, 10, 7, 3, 1, 0),
-        )
+        # # #
 
-        for n, coefs in enumerate(lfsr_coefs):
-            eq = [context[i] for i in coefs]
+        context    = Signal(16, reset=self.init)
+        next_value = Signal(dw)
+        self.sync += context.eq(next_value[dw-16:dw])
+
+        # Each generated bit is the XOR of the previous 16 bits selected by the polynom taps,
+        # the context holds the last 16 generated bits.
+        taps = [i for i in range(16) if (1 << i) & self.polynom]
+        bits = [{("context", i)} for i in range(16)]
+        for n in range(dw):
+            bit = set()
+            for t in taps:
+                bit ^= bits[n + t]
+            bits.append(bit)
+
+        for n in range(dw):
+            eq = [context[i] for t, i in sorted(bits[16 + n], key=lambda e: e[1], reverse=True)]
             self.comb += next_value[n].eq(reduce(xor, eq))
 
         self.comb += self.value.eq(next_value)
@@ -703,16 +692,15 @@ class LiteSATALinkRX(Module):
         fsm.act("COPY",
             pipeline.sink.valid.eq(data_valid),
             insert.eq(primitives["R_IP"]),
-            If(primitive_valid,
-                If(primitive == primitives["HOLD"],
-                    insert.eq(primitives["HOLDA"])
-                ).Elif(primitive == primitives["EOF"],
-                    # 1 clock cycle latency
-                    pipeline.sink.valid.eq(1),
-                    pipeline.sink.last.eq(1),
-                    NextState("WTRM")
-                )
+            If(primitive_valid & (primitive == primitives["HOLD"]),
+                insert.eq(primitives["HOLDA"])
+            ).Elif(primitive_valid & (primitive == primitives["EOF"]),
+                # 1 clock cycle latency
+                pipeline.sink.valid.eq(1),
+                pipeline.sink.last.eq(1),
+                NextState("WTRM")
             ).Elif(self.hold,
+                # Keep holding while the device answers with HOLDA.
                 insert.eq(primitives["HOLD"])
             )
         )
@@ -759,7 +747,27 @@ class LiteSATALinkRX(Module):
 # Link ---------------------------------------------------------------------------------------------
 
 class LiteSATALink(Module):
-    def __init__(self, phy):
+    """SATA Link
+
+    Received data is streamed cut-through: the dwords of a FIS are forwarded as soon as they are
+    descrambled, before the CRC (only known at EOF) is checked. The CRC result is reported with
+    error on the last dword of the FIS (propagated by the command layer to failed), so consumers
+    must not commit data of a FIS before its last dword.
+
+    Parameters
+    ----------
+    rx_buffer_depth : int
+        Depth (in dwords) of the RX buffer absorbing the device's data while holding.
+    rx_hold_threshold : int
+        RX buffer level above which HOLD is sent to the device (defaults to rx_buffer_depth/2).
+        Device can still send up to ~20 dwords once HOLD is sent, so rx_buffer_depth should keep
+        a margin of at least 32 dwords above the threshold.
+    """
+    def __init__(self, phy, rx_buffer_depth=128, rx_hold_threshold=None):
+        if rx_hold_threshold is None:
+            rx_hold_threshold = rx_buffer_depth//2
+        assert rx_buffer_depth - rx_hold_threshold >= 32
+
         # TX ---------------------------------------------------------------------------------------
         self.submodules.tx = BufferizeEndpoints({"source": DIR_SOURCE})(LiteSATALinkTX())
         self.submodules.tx_align = LiteSATAALIGNInserter(phy_description(32))
@@ -769,7 +777,7 @@ class LiteSATALink(Module):
         self.submodules.rx_align = LiteSATAALIGNRemover(phy_description(32))
         self.submodules.rx_cont = LiteSATACONTRemover(phy_description(32))
         self.submodules.rx = BufferizeEndpoints({"sink": DIR_SINK})(LiteSATALinkRX())
-        self.submodules.rx_buffer = stream.SyncFIFO(link_description(32), 128)
+        self.submodules.rx_buffer = stream.SyncFIFO(link_description(32), rx_buffer_depth)
         self.submodules.rx_pipeline = Pipeline(phy, self.rx_align, self.rx_cont, self.rx, self.rx_buffer)
 
         # RX --> TX --------------------------------------------------------------------------------
@@ -778,4 +786,4 @@ class LiteSATALink(Module):
         self.sink, self.source = self.tx_pipeline.sink, self.rx_pipeline.source
 
         # Hold -------------------------------------------------------------------------------------
-        self.comb += self.rx.hold.eq(self.rx_buffer.level > 64)
+        self.comb += self.rx.hold.eq(self.rx_buffer.level > rx_hold_threshold)
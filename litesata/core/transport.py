@@ -123,6 +123,8 @@ class LiteSATATransportRX(Module):
         cmd_ndwords = max(fis_reg_d2h_header.length,
                           fis_dma_activate_d2h_header.length,
                           fis_pio_setup_d2h_header.length,
+                          fis_dma_setup_header.length,
+                          fis_set_device_bits_d2h_header.length,
                           fis_data_header.length)
         encoded_cmd = Signal(cmd_ndwords*32)
 
@@ -163,6 +165,10 @@ class LiteSATATransportRX(Module):
                     NextState("RECEIVE_CTRL_CMD")
                 ).Elif(test_type_rx("PIO_SETUP_D2H"),
                     NextState("RECEIVE_CTRL_CMD")
+                ).Elif(test_type_rx("DMA_SETUP"),
+                    NextState("RECEIVE_CTRL_CMD")
+                ).Elif(test_type_rx("SET_DEVICE_BITS_D2H"),
+                    NextState("RECEIVE_CTRL_CMD")
                 ).Elif(test_type_rx("DATA"),
                     NextState("RECEIVE_DATA_CMD"),
                 ).Else(
@@ -180,6 +186,10 @@ class LiteSATATransportRX(Module):
                 cmd_len.eq(fis_reg_d2h_header.length-1)
             ).Elif(test_type("DMA_ACTIVATE_D2H", fis_type),
                 cmd_len.eq(fis_dma_activate_d2h_header.length-1)
+            ).Elif(test_type("DMA_SETUP", fis_type),
+                cmd_len.eq(fis_dma_setup_header.length-1)
+            ).Elif(test_type("SET_DEVICE_BITS_D2H", fis_type),
+                cmd_len.eq(fis_set_device_bits_d2h_header.length-1)
             ).Else(
                 cmd_len.eq(fis_pio_setup_d2h_header.length-1)
             ),
@@ -196,6 +206,10 @@ class LiteSATATransportRX(Module):
                 fis_reg_d2h_header.decode(encoded_cmd, source)
             ).Elif(test_type("DMA_ACTIVATE_D2H", fis_type),
                 fis_dma_activate_d2h_header.decode(encoded_cmd, source)
+            ).Elif(test_type("DMA_SETUP", fis_type),
+                fis_dma_setup_header.decode(encoded_cmd, source)
+            ).Elif(test_type("SET_DEVICE_BITS_D2H", fis_type),
+                fis_set_device_bits_d2h_header.decode(encoded_cmd, source)
             ).Else(
                 fis_pio_setup_d2h_header.decode(encoded_cmd, source)
             ),
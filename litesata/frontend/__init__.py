@@ -1,4 +1,12 @@
 from litesata.common import *
 from litesata.frontend.arbitration import LiteSATAArbiter, LiteSATACrossbar
-from litesata.frontend.raid import LiteSATAStriping, LiteSATAMirroring
+from litesata.frontend.raid import LiteSATAStriping, LiteSATAChunkedStriping, LiteSATAMirroring, LiteSATAMirroredVolume, LiteSATARAID5
 from litesata.frontend.bist import LiteSATABIST
+from litesata.frontend.splitter import LiteSATASplitter
+from litesata.frontend.monitor import LiteSATALatencyMonitor
+from litesata.frontend.cache import LiteSATACache
+from litesata.frontend.prefetch import LiteSATAPrefetcher
+from litesata.frontend.coalescer import LiteSATAWriteCoalescer
+from litesata.frontend.streaming import LiteSATAStreamRecorder, LiteSATAStreamPlayer
+from litesata.frontend.trim import LiteSATATrim
+from litesata.frontend.identify import LiteSATAIdentify
@@ -5,8 +5,8 @@
 # SPDX-License-Identifier: BSD-2-Clause
 
 from litesata.common import *
-
-from migen.genlib.roundrobin import *
+from litesata.core.command import LiteSATACommandRXSplitter
+from litesata.frontend.splitter import LiteSATASplitter
 
 # LiteSATAMasterPort -------------------------------------------------------------------------------
 
@@ -57,18 +57,46 @@ class LiteSATAUserPort(LiteSATASlavePort):
         self.controller_dw = dw if controller_dw is None else controller_dw
         LiteSATASlavePort.__init__(self, dw)
 
+# LiteSATASplitUserPort ----------------------------------------------------------------------------
+
+class LiteSATASplitUserPort:
+    """SATA split user port
+
+    A split user port is a user port with separate status and data sources (see
+    LiteSATACommandRXSplitter): the sink is used to send commands to the device and write data,
+    status to receive the responses and data to receive the read/identify data.
+    """
+    def __init__(self, dw, controller_dw=None):
+        self.dw            = dw
+        self.controller_dw = dw if controller_dw is None else controller_dw
+        self.sink          = stream.Endpoint(command_tx_description(dw))
+        self.status        = stream.Endpoint(command_rx_cmd_description(dw))
+        self.data          = stream.Endpoint(command_rx_data_description(dw))
+
 # LiteSATAArbiter ----------------------------------------------------------------------------------
 
 class LiteSATAArbiter(Module):
     """SATA arbiter
 
-    Round robin arbiter between SATA user ports.
+    Arbiter between SATA user ports. The grant is held until the end of the command of the granted
+    port, the next port is then selected:
+        - by strict priority: ports with the highest priority are served first.
+        - by weighted round robin between ports of the same priority: in a round, a port of weight
+          W is granted up to W commands.
+
+    With the default priorities/weights, this is a plain round robin.
     """
-    def __init__(self, users, master):
-        self.rr = RoundRobin(len(users))
-        self.submodules += self.rr
-        self.grant = self.rr.grant
-        cases = {}
+    def __init__(self, users, master, priorities=None, weights=None):
+        n          = len(users)
+        priorities = [0]*n if priorities is None else priorities
+        weights    = [1]*n if weights    is None else weights
+        self.grant = Signal(max=max(n, 2))
+
+        # # #
+
+        requests = Signal(n)
+        dones    = Signal(n)
+        cases    = {}
         for i, slave in enumerate(users):
             sink, source = slave.sink, slave.source
             done    = Signal()
@@ -80,10 +108,56 @@ class LiteSATAArbiter(Module):
                 ).Elif(sink.valid,
                     ongoing.eq(1)
                 )
-            self.comb += self.rr.request[i].eq((sink.valid | ongoing) & ~done)
+            self.comb += [
+                requests[i].eq(sink.valid | ongoing),
+                dones[i].eq(done)
+            ]
             cases[i] = [users[i].connect(master)]
         self.comb += Case(self.grant, cases)
 
+        # Credits of the ports in the current weighted round.
+        credits    = [Signal(max=w + 1, reset=w) for w in weights]
+        has_credit = Signal(n)
+        self.comb += [has_credit[i].eq(credits[i] != 0) for i in range(n)]
+
+        # Next grant: highest priority first, then ports with credits, then round robin order.
+        next_grant = Signal(max=max(n, 2))
+        reload     = Signal()
+        selection  = {}
+        for g in range(n):
+            candidates = []
+            for priority in sorted(set(priorities), reverse=True):
+                for with_credit in [True, False]:
+                    for k in range(1, n + 1):
+                        i = (g + k) % n
+                        if priorities[i] == priority:
+                            candidates.append((i, with_credit))
+            selection[g] = [next_grant.eq(g)]
+            for i, with_credit in reversed(candidates):
+                selection[g].append(If(requests[i] & (has_credit[i] if with_credit else 1),
+                    next_grant.eq(i),
+                    reload.eq(~has_credit[i])
+                ))
+        self.comb += Case(self.grant, selection)
+
+        # Re-arbitrate at the end of the command of the granted port (or when it is idle).
+        release     = Signal()
+        grant_event = Signal()
+        self.comb += [
+            release.eq(~(requests >> self.grant)[0] | (dones >> self.grant)[0]),
+            grant_event.eq(release & (requests >> next_grant)[0])
+        ]
+        self.sync += If(release, self.grant.eq(next_grant))
+        for i in range(n):
+            self.sync += \
+                If(grant_event,
+                    If(reload,
+                        credits[i].eq(weights[i] - (next_grant == i))
+                    ).Elif(next_grant == i,
+                        credits[i].eq(credits[i] - 1)
+                    )
+                )
+
 # LiteSATACrossbar ---------------------------------------------------------------------------------
 
 class LiteSATACrossbar(Module):
@@ -93,17 +167,25 @@ class LiteSATACrossbar(Module):
     and user ports requested with the get_port method.
 
     The controller be a PHY but also a RAID (Striping, Mirroring) module.
+
+    Each port can be given a priority and a weight (see LiteSATAArbiter) and a max_count quantum:
+    commands of the port are then split in commands of up to max_count sectors, re-arbitrated
+    in between, which bounds the time the other ports wait for a long transfer of this port.
+
+    With split=True, get_port returns a LiteSATASplitUserPort (separate status/data sources).
     """
     def __init__(self, controller):
-        self.dw     = len(controller.sink.data)
-        self.users  = []
-        self.master = LiteSATAMasterPort(self.dw)
+        self.dw         = len(controller.sink.data)
+        self.users      = []
+        self.priorities = []
+        self.weights    = []
+        self.master     = LiteSATAMasterPort(self.dw)
         self.comb += [
             self.master.source.connect(controller.sink),
             controller.source.connect(self.master.sink)
         ]
 
-    def get_port(self, dw=None):
+    def get_port(self, dw=None, priority=0, weight=1, max_count=None, split=False):
         dw = self.dw if dw is None else dw
         user_port     = LiteSATAUserPort(dw, self.dw)
         internal_port = LiteSATAUserPort(self.dw, self.dw)
@@ -127,19 +209,45 @@ class LiteSATACrossbar(Module):
                 converter.source.connect(user_port.source)
             ]
 
-            self.users += [internal_port]
+            port = internal_port
         else:
-            self.users += [user_port]
+            port = user_port
+
+        if max_count is not None:
+            arbiter_port = LiteSATAUserPort(self.dw, self.dw)
+            splitter     = LiteSATASplitter(arbiter_port, max_count)
+            self.submodules += splitter
+            self.comb += [
+                port.sink.connect(splitter.sink),
+                splitter.source.connect(port.source)
+            ]
+            port = arbiter_port
+
+        self.users      += [port]
+        self.priorities += [priority]
+        self.weights    += [weight]
+
+        if split:
+            split_port = LiteSATASplitUserPort(dw, self.dw)
+            splitter   = LiteSATACommandRXSplitter(dw)
+            self.submodules += splitter
+            self.comb += [
+                split_port.sink.connect(user_port.sink),
+                user_port.source.connect(splitter.sink),
+                splitter.status.connect(split_port.status),
+                splitter.data.connect(split_port.data)
+            ]
+            return split_port
 
         return user_port
 
-    def get_ports(self, n, dw=None):
+    def get_ports(self, n, dw=None, priority=0, weight=1, max_count=None, split=False):
         dw    = self.dw if dw is None else dw
         ports = []
         for i in range(n):
-            ports.append(self.get_port(dw))
+            ports.append(self.get_port(dw, priority, weight, max_count, split))
         return ports
 
     def do_finalize(self):
-        arbiter = LiteSATAArbiter(self.users, self.master)
+        arbiter = LiteSATAArbiter(self.users, self.master, self.priorities, self.weights)
         self.submodules += arbiter
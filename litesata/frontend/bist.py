@@ -202,6 +202,149 @@ class LiteSATABISTChecker(Module):
                 self.aborted.eq(self.aborted | sink.failed)
             )
 
+# LiteSATABISTWorkload -----------------------------------------------------------------------------
+
+class LiteSATABISTWorkload(Module):
+    """SATA BIST workload
+
+    Issue count commands (IOPS/mixed workloads measurement), each command being:
+    - a write with a probability of write_ratio/256, a read otherwise.
+    - of sizes[n] sectors, n being uniformly selected in the 4 entries of sizes (16-bit each,
+      ex: 8, 8, 8, 64 for 75% of 4KB and 25% of 32KB transfers).
+    - at a random (random=1) or sequential (random=0) LBA in [sector, sector + span), aligned on
+      its size.
+    span and sizes should be powers of 2 (and sizes <= span). Data of the reads is not checked.
+
+    Completed commands, bytes and cycles (from command issue to response) are reported for the
+    reads (rd_*) and writes (wr_*), failed commands in errors.
+    """
+    def __init__(self, user_port, counter_width=32):
+        self.start       = Signal()
+        self.sector      = Signal(48)
+        self.count       = Signal(16)
+        self.random      = Signal()
+        self.span        = Signal(48)
+        self.write_ratio = Signal(8)
+        self.sizes       = Signal(4*16)
+
+        self.done    = Signal()
+        self.aborted = Signal()
+        self.errors  = Signal(counter_width)
+
+        self.rd_commands = Signal(counter_width)
+        self.rd_bytes    = Signal(64)
+        self.rd_cycles   = Signal(64)
+        self.wr_commands = Signal(counter_width)
+        self.wr_bytes    = Signal(64)
+        self.wr_cycles   = Signal(64)
+
+        # # #
+
+        n          = user_port.dw//32
+        count_mult = user_port.dw//user_port.controller_dw
+        if count_mult == 0:
+            raise ValueError
+
+        source, sink = user_port.sink, user_port.source
+
+        # Random numbers: [0:48] LBA, [48:56] read/write, [56:58] size.
+        scrambler = Scrambler(64)
+        self.submodules += scrambler
+
+        sizes    = Array(self.sizes[16*i:16*(i+1)] for i in range(4))
+        commands = Signal(16)
+        offset   = Signal(48)
+        is_write = Signal()
+        size     = Signal(16)
+        sector   = Signal(48)
+        counter  = Signal(counter_width)
+        cycles   = Signal(64)
+
+        cycles_reset = Signal()
+        self.sync += \
+            If(cycles_reset,
+                cycles.eq(0)
+            ).Else(
+                cycles.eq(cycles + 1)
+            )
+
+        self.fsm = fsm = FSM(reset_state="IDLE")
+        self.submodules += fsm
+        fsm.act("IDLE",
+            self.done.eq(1),
+            If(self.start,
+                NextValue(commands, 0),
+                NextValue(offset,   0),
+                NextValue(self.errors,      0),
+                NextValue(self.rd_commands, 0),
+                NextValue(self.rd_bytes,    0),
+                NextValue(self.rd_cycles,   0),
+                NextValue(self.wr_commands, 0),
+                NextValue(self.wr_bytes,    0),
+                NextValue(self.wr_cycles,   0),
+                NextState("GEN_CMD")
+            )
+        )
+        _size   = sizes[scrambler.value[56:58]]
+        _offset = Mux(self.random, scrambler.value[:48], offset)
+        fsm.act("GEN_CMD",
+            scrambler.ce.eq(1),
+            NextValue(is_write, scrambler.value[48:56] < self.write_ratio),
+            NextValue(size,     _size),
+            NextValue(sector,   self.sector + (_offset & (self.span - 1) & ((2**48 - 1) ^ (_size - 1)))),
+            NextValue(offset,   offset + _size),
+            NextValue(counter,  0),
+            cycles_reset.eq(1),
+            If(commands == self.count,
+                NextState("IDLE")
+            ).Else(
+                NextState("SEND_CMD")
+            )
+        )
+        self.comb += [
+            source.write.eq(is_write),
+            source.read.eq(~is_write),
+            source.sector.eq(sector),
+            source.count.eq(size*count_mult),
+            source.data.eq(Replicate(counter, n))
+        ]
+        fsm.act("SEND_CMD",
+            source.valid.eq(1),
+            source.last.eq(~is_write | (counter == (logical_sector_size//4*size)-1)),
+            If(source.valid & source.ready,
+                NextValue(counter, counter + 1),
+                If(source.last,
+                    NextState("WAIT_RESPONSE")
+                )
+            )
+        )
+        fsm.act("WAIT_RESPONSE",
+            sink.ready.eq(1),
+            If(sink.valid & sink.end,
+                NextValue(commands, commands + 1),
+                If(sink.failed,
+                    NextValue(self.errors, self.errors + 1)
+                ),
+                If(is_write,
+                    NextValue(self.wr_commands, self.wr_commands + 1),
+                    NextValue(self.wr_bytes,    self.wr_bytes + size*logical_sector_size),
+                    NextValue(self.wr_cycles,   self.wr_cycles + cycles)
+                ).Else(
+                    NextValue(self.rd_commands, self.rd_commands + 1),
+                    NextValue(self.rd_bytes,    self.rd_bytes + size*logical_sector_size),
+                    NextValue(self.rd_cycles,   self.rd_cycles + cycles)
+                ),
+                NextState("GEN_CMD")
+            )
+        )
+
+        self.sync += \
+            If(self.start,
+                self.aborted.eq(0)
+            ).Elif(sink.valid & sink.ready,
+                self.aborted.eq(self.aborted | sink.failed)
+            )
+
 # LiteSATABISTUnitCSR ------------------------------------------------------------------------------
 
 class LiteSATABISTUnitCSR(Module, AutoCSR):
@@ -234,6 +377,31 @@ class LiteSATABISTUnitCSR(Module, AutoCSR):
             self._errors.status.eq(bist_unit.errors)
         ]
 
+        if isinstance(bist_unit, LiteSATABISTWorkload):
+            self._span        = CSRStorage(48)
+            self._write_ratio = CSRStorage(8)
+            self._sizes       = CSRStorage(4*16)
+
+            self._rd_commands = CSRStatus(32)
+            self._rd_bytes    = CSRStatus(64)
+            self._rd_cycles   = CSRStatus(64)
+            self._wr_commands = CSRStatus(32)
+            self._wr_bytes    = CSRStatus(64)
+            self._wr_cycles   = CSRStatus(64)
+
+            self.comb += [
+                bist_unit.span.eq(self._span.storage),
+                bist_unit.write_ratio.eq(self._write_ratio.storage),
+                bist_unit.sizes.eq(self._sizes.storage),
+
+                self._rd_commands.status.eq(bist_unit.rd_commands),
+                self._rd_bytes.status.eq(bist_unit.rd_bytes),
+                self._rd_cycles.status.eq(bist_unit.rd_cycles),
+                self._wr_commands.status.eq(bist_unit.wr_commands),
+                self._wr_bytes.status.eq(bist_unit.wr_bytes),
+                self._wr_cycles.status.eq(bist_unit.wr_cycles)
+            ]
+
         self.fsm = fsm = FSM(reset_state="IDLE")
         self.submodules += fsm
         loop_counter       = Signal(8)
@@ -364,7 +532,7 @@ class LiteSATABISTIdentifyCSR(Module, AutoCSR):
 # LiteSATABIST --------------------------------------------------------------------------
 
 class LiteSATABIST(Module, AutoCSR):
-    def __init__(self, crossbar, with_csr=False, counter_width=32):
+    def __init__(self, crossbar, with_csr=False, counter_width=32, with_workload=False):
         generator = LiteSATABISTGenerator(crossbar.get_port(), counter_width)
         checker   = LiteSATABISTChecker(crossbar.get_port(), counter_width)
         identify  = LiteSATABISTIdentify(crossbar.get_port())
@@ -375,3 +543,8 @@ class LiteSATABIST(Module, AutoCSR):
         self.submodules.generator = generator
         self.submodules.checker   = checker
         self.submodules.identify  = identify
+        if with_workload:
+            workload = LiteSATABISTWorkload(crossbar.get_port(), counter_width)
+            if with_csr:
+                workload = LiteSATABISTUnitCSR(workload)
+            self.submodules.workload = workload
@@ -0,0 +1,253 @@
+#
+# This file is part of LiteSATA.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+from litesata.common import *
+
+from litex.soc.interconnect.csr import *
+
+# LiteSATACache ------------------------------------------------------------------------------------
+
+class LiteSATACache(Module, AutoCSR):
+    """SATA sector read cache
+
+    Cache single-sector reads issued on a port (core or user port) in block RAM. The cache is
+    set-associative: sector S is cached in set S % nsets, in one of the nways ways of the set
+    (LRU eviction). Hits are served from block RAM without any command on the port, misses are
+    forwarded to the port and fill the cache on the fly.
+
+    Other commands are forwarded to the port: multi-sector reads and identify bypass the cache,
+    writes are written through after invalidation of the cached sectors they cover (takes up to
+    2 x nsets cycles), trims after invalidation of the whole cache (the trimmed ranges are only
+    known from the data, takes 2 x nsets cycles).
+
+    Parameters
+    ----------
+    port : in
+        Port (sink/source) the commands are issued on.
+    nsets : int
+        Number of sets (power of 2).
+    nways : int
+        Number of ways per set (power of 2), capacity is nsets x nways sectors.
+    """
+    def __init__(self, port, nsets=16, nways=4, counter_width=32):
+        dw = len(port.sink.data)
+        self.sink   = sink   = stream.Endpoint(command_tx_description(dw))
+        self.source = source = stream.Endpoint(command_rx_description(dw))
+
+        self.hits   = CSRStatus(counter_width)
+        self.misses = CSRStatus(counter_width)
+
+        # # #
+
+        set_bits         = log2_int(nsets)
+        tag_bits         = 48 - set_bits
+        age_bits         = bits_for(nways - 1)
+        words_per_sector = logical_sector_size*8//dw
+
+        # Current command.
+        sector = Signal(48)
+        count  = Signal(16)
+        index  = Signal(max=max(nsets, 2))
+        tag    = Signal(tag_bits)
+        self.comb += [
+            index.eq(sector[:set_bits]),
+            tag.eq(sector[set_bits:])
+        ]
+
+        # Tag store: valid + tag per way.
+        tags      = Memory(nways*(tag_bits + 1), nsets)
+        tags_port = tags.get_port(write_capable=True)
+        self.specials += tags, tags_port
+        tags_row   = Signal(nways*(tag_bits + 1))
+        tags_valid = [tags_port.dat_r[w*(tag_bits + 1) + tag_bits] for w in range(nways)]
+        tags_tag   = [tags_port.dat_r[w*(tag_bits + 1):w*(tag_bits + 1) + tag_bits] for w in range(nways)]
+
+        # LRU store: age per way (0: most recently used).
+        lru      = Memory(nways*age_bits, nsets, init=[sum(w << (w*age_bits) for w in range(nways))]*nsets)
+        lru_port = lru.get_port(write_capable=True)
+        self.specials += lru, lru_port
+        ages = [lru_port.dat_r[w*age_bits:(w+1)*age_bits] for w in range(nways)]
+
+        # Data store.
+        data      = Memory(dw, nsets*nways*words_per_sector)
+        data_wr   = data.get_port(write_capable=True)
+        data_rd   = data.get_port(has_re=True)
+        self.specials += data, data_wr, data_rd
+        way  = Signal(max=max(nways, 2))
+        word = Signal(max=words_per_sector + 1)
+        self.comb += [
+            data_wr.adr.eq((index*nways + way)*words_per_sector + word),
+            data_wr.dat_w.eq(port.source.data),
+            data_rd.adr.eq((index*nways + way)*words_per_sector + word)
+        ]
+
+        # Lookup.
+        hit      = Signal()
+        hit_way  = Signal(max=max(nways, 2))
+        victim   = Signal(max=max(nways, 2))
+        for w in reversed(range(nways)):
+            self.comb += If(tags_valid[w] & (tags_tag[w] == tag),
+                hit.eq(1),
+                hit_way.eq(w)
+            )
+        for w in reversed(range(nways)):
+            self.comb += If(ages[w] == (nways - 1), victim.eq(w))
+        for w in reversed(range(nways)):
+            self.comb += If(~tags_valid[w], victim.eq(w))
+
+        # LRU update of the accessed way.
+        accessed   = Signal(max=max(nways, 2))
+        ages_array = Array(ages)
+        self.comb += [
+            accessed.eq(Mux(hit, hit_way, victim)),
+            lru_port.dat_w.eq(Cat(*[
+                Mux(accessed == w, 0, Mux(ages[w] < ages_array[accessed], ages[w] + 1, ages[w]))
+                for w in range(nways)]))
+        ]
+
+        # Invalidation of the sectors covered by a write (or of all sectors for a trim).
+        scan       = Signal(16)
+        scan_all   = Signal()
+        scan_index = Signal(max=max(nsets, 2))
+        scan_row   = Signal(nways*(tag_bits + 1))
+        self.comb += scan_index.eq((sector + scan)[:set_bits])
+        for w in range(nways):
+            line = Signal(48)
+            self.comb += [
+                line.eq(Cat(scan_index, tags_tag[w])),
+                scan_row[w*(tag_bits + 1):(w+1)*(tag_bits + 1)].eq(
+                    tags_port.dat_r[w*(tag_bits + 1):(w+1)*(tag_bits + 1)]),
+                If(scan_all | ((line >= sector) & (line < (sector + count))),
+                    scan_row[w*(tag_bits + 1) + tag_bits].eq(0)
+                )
+            ]
+
+        # Hit data: 1-stage pipeline on the data read port.
+        hit_valid = Signal()
+        hit_last  = Signal()
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            tags_port.adr.eq(sink.sector[:set_bits]),
+            lru_port.adr.eq(sink.sector[:set_bits]),
+            NextValue(sector, sink.sector),
+            NextValue(count,  sink.count),
+            NextValue(scan,   0),
+            NextValue(scan_all, sink.trim),
+            NextValue(word,   0),
+            If(sink.valid,
+                If(sink.read & (sink.count == 1),
+                    sink.ready.eq(1),
+                    NextState("LOOKUP")
+                ).Elif(sink.write | sink.trim,
+                    NextState("INVALIDATE_READ")
+                ).Else(
+                    NextState("FORWARD")
+                )
+            )
+        )
+        fsm.act("LOOKUP",
+            tags_port.adr.eq(index),
+            lru_port.adr.eq(index),
+            lru_port.we.eq(1),
+            NextValue(tags_row, tags_port.dat_r),
+            If(hit,
+                NextValue(self.hits.status, self.hits.status + 1),
+                NextValue(way, hit_way),
+                NextState("HIT_DATA")
+            ).Else(
+                # Invalidate the victim during the fill.
+                tags_port.we.eq(1),
+                tags_port.dat_w.eq(tags_port.dat_r),
+                [If(victim == w, tags_port.dat_w[w*(tag_bits + 1) + tag_bits].eq(0)) for w in range(nways)],
+                NextValue(self.misses.status, self.misses.status + 1),
+                NextValue(way, victim),
+                NextState("MISS_CMD")
+            )
+        )
+        fsm.act("HIT_DATA",
+            data_rd.re.eq(~hit_valid | source.ready),
+            source.valid.eq(hit_valid),
+            source.read.eq(1),
+            source.last.eq(hit_last),
+            source.data.eq(data_rd.dat_r),
+            If(data_rd.re,
+                NextValue(hit_valid, word != words_per_sector),
+                NextValue(hit_last,  word == (words_per_sector - 1)),
+                If(word != words_per_sector,
+                    NextValue(word, word + 1)
+                )
+            ),
+            If(source.valid & source.ready & source.last,
+                NextValue(hit_valid, 0),
+                NextState("HIT_RESPONSE")
+            )
+        )
+        fsm.act("HIT_RESPONSE",
+            source.valid.eq(1),
+            source.read.eq(1),
+            source.last.eq(1),
+            source.end.eq(1),
+            If(source.ready,
+                NextState("IDLE")
+            )
+        )
+        fsm.act("MISS_CMD",
+            port.sink.valid.eq(1),
+            port.sink.read.eq(1),
+            port.sink.sector.eq(sector),
+            port.sink.count.eq(1),
+            port.sink.last.eq(1),
+            If(port.sink.ready,
+                NextState("MISS_DATA")
+            )
+        )
+        fsm.act("MISS_DATA",
+            port.source.connect(source),
+            tags_port.adr.eq(index),
+            If(port.source.valid & port.source.ready,
+                If(port.source.end,
+                    # Fill done: validate the line.
+                    If(~port.source.failed & (word == words_per_sector),
+                        tags_port.we.eq(1),
+                        tags_port.dat_w.eq(tags_row),
+                        [If(way == w,
+                            tags_port.dat_w[w*(tag_bits + 1):(w+1)*(tag_bits + 1)].eq(Cat(tag, 1))
+                        ) for w in range(nways)]
+                    ),
+                    NextState("IDLE")
+                ).Elif(word != words_per_sector,
+                    data_wr.we.eq(1),
+                    NextValue(word, word + 1)
+                )
+            )
+        )
+        fsm.act("INVALIDATE_READ",
+            tags_port.adr.eq(scan_index),
+            If(((scan == count) & ~scan_all) | (scan == nsets),
+                NextState("FORWARD")
+            ).Else(
+                NextState("INVALIDATE_WRITE")
+            )
+        )
+        fsm.act("INVALIDATE_WRITE",
+            tags_port.adr.eq(scan_index),
+            tags_port.we.eq(1),
+            tags_port.dat_w.eq(scan_row),
+            NextValue(scan, scan + 1),
+            NextState("INVALIDATE_READ")
+        )
+        fsm.act("FORWARD",
+            sink.connect(port.sink),
+            If(sink.valid & sink.ready & sink.last,
+                NextState("RESPONSE")
+            )
+        )
+        fsm.act("RESPONSE",
+            port.source.connect(source),
+            If(port.source.valid & port.source.ready & port.source.last & port.source.end,
+                NextState("IDLE")
+            )
+        )
@@ -0,0 +1,226 @@
+#
+# This file is part of LiteSATA.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+from functools import reduce
+from operator import and_
+
+from litesata.common import *
+from litesata.frontend.arbitration import LiteSATAUserPort
+
+# LiteSATAWriteCoalescer ---------------------------------------------------------------------------
+
+class LiteSATAWriteCoalescer(Module):
+    """SATA write coalescer
+
+    The write coalescer handles a port (core or user port) and provides N ports. Writes of the N
+    ports on contiguous sectors are merged in a buffer (block RAM) of buffer_sectors sectors and
+    written with a single command on the port:
+        port0 (write S,    C0) --+
+        port1 (write S+C0, C1) --+--> buffer --> port (write S, C0+C1+...)
+        portN (...)            --+
+
+    The buffer is written (flushed) when:
+        - it is full or the next write is not contiguous.
+        - no write was merged for timeout cycles (if timeout is not None).
+        - flush is asserted.
+        - a read/identify is presented (reads always see the written data).
+
+    The response of a merged write is presented to its port once the buffer is written on the
+    port (with the failed status of this write): each port waits for its own writes only, a port
+    issuing several writes before their responses gets one response per write. Writes larger than
+    the buffer (or of 0 sectors), reads and identify are forwarded once the buffer is written.
+
+    Parameters
+    ----------
+    port : in
+        Port (sink/source) the commands are issued on.
+    n : int
+        Number of ports.
+    buffer_sectors : int
+        Maximum number of sectors merged in a single command.
+    timeout : int
+        Flush timeout in sys_clk cycles (None to disable).
+    """
+    def __init__(self, port, n=2, buffer_sectors=32, timeout=1024):
+        dw = len(port.sink.data)
+        self.ports = ports = [LiteSATAUserPort(dw) for i in range(n)]
+        self.flush = Signal()
+
+        # # #
+
+        words_per_sector = logical_sector_size*8//dw
+        buffer_words     = buffer_sectors*words_per_sector
+
+        # Ports arbitration (round-robin).
+        grant   = Signal(max=max(n, 2))
+        sinks   = [p.sink   for p in ports]
+        sources = [p.source for p in ports]
+        sink    = stream.Endpoint(command_tx_description(dw))
+        source  = stream.Endpoint(command_rx_description(dw))
+        fanout  = Signal()
+        for i in range(n):
+            self.comb += If(grant == i, sinks[i].connect(sink))
+        requests   = Signal(n)
+        next_grant = Signal(max=max(n, 2))
+        self.comb += requests.eq(Cat(*[s.valid for s in sinks]))
+        for g in range(n):
+            for k in reversed(range(1, n + 1)):
+                self.comb += If((grant == g) & requests[(g + k) % n], next_grant.eq((g + k) % n))
+
+        # Buffered run: start sector and number of sectors.
+        start      = Signal(48)
+        nsectors   = Signal(max=buffer_sectors + 1)
+        pending    = [Signal(max=buffer_sectors + 1) for i in range(n)]
+        appended   = Signal()
+        failed     = Signal()
+        appendable = Signal()
+        self.comb += appendable.eq(sink.write & (sink.count != 0) & (sink.count <= buffer_sectors) &
+            ((nsectors == 0) | ((sink.sector == (start + nsectors)) &
+                               ((nsectors + sink.count) <= buffer_sectors))))
+
+        # Flush conditions.
+        timer   = Signal(max=max(timeout or 0, 1) + 1)
+        expired = Signal()
+        if timeout is not None:
+            self.comb += expired.eq(timer == timeout)
+        flush_request = Signal()
+        self.sync += \
+            If(self.flush,
+                flush_request.eq(1)
+            ).Elif(nsectors == 0,
+                flush_request.eq(0)
+            )
+
+        # Buffer.
+        data    = Memory(dw, buffer_words)
+        data_wr = data.get_port(write_capable=True)
+        data_rd = data.get_port(has_re=True)
+        self.specials += data, data_wr, data_rd
+        word  = Signal(max=buffer_words + 1)
+        total = Signal(max=buffer_words + 1)
+        self.comb += [
+            total.eq(nsectors*words_per_sector),
+            data_wr.adr.eq(nsectors*words_per_sector + word),
+            data_wr.dat_w.eq(sink.data),
+            data_rd.adr.eq(word)
+        ]
+        flush_valid = Signal()
+        flush_last  = Signal()
+
+        # Responses: merged writes' responses to all their ports (one response per merged write of
+        # the port), forwarded responses to grant.
+        fanout_done = Signal()
+        fanout_last = []
+        for i in range(n):
+            fanout_last.append((pending[i] == 0) | ((pending[i] == 1) & sources[i].ready))
+            self.comb += [
+                If(fanout,
+                    If(pending[i] != 0,
+                        sources[i].valid.eq(1),
+                        sources[i].last.eq(1),
+                        sources[i].write.eq(1),
+                        sources[i].end.eq(1),
+                        sources[i].failed.eq(failed)
+                    )
+                ).Elif(grant == i,
+                    source.connect(sources[i])
+                )
+            ]
+            self.sync += \
+                If(appended & (grant == i),
+                    pending[i].eq(pending[i] + 1)
+                ).Elif(sources[i].valid & sources[i].ready & fanout,
+                    pending[i].eq(pending[i] - 1)
+                )
+        self.comb += fanout_done.eq(reduce(and_, fanout_last))
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            NextValue(word, 0),
+            If(nsectors != 0,
+                NextValue(timer, timer + ~expired),
+                If(flush_request | expired | (nsectors == buffer_sectors),
+                    NextState("FLUSH_DATA")
+                ).Elif(requests != 0,
+                    NextValue(grant, next_grant),
+                    NextState("DISPATCH")
+                )
+            ).Elif(requests != 0,
+                NextValue(grant, next_grant),
+                NextState("DISPATCH")
+            )
+        )
+        fsm.act("DISPATCH",
+            If(appendable,
+                If(nsectors == 0,
+                    NextValue(start, sink.sector)
+                ),
+                NextState("APPEND")
+            ).Elif(nsectors != 0,
+                NextState("FLUSH_DATA")
+            ).Else(
+                NextState("FORWARD")
+            )
+        )
+        fsm.act("APPEND",
+            sink.ready.eq(1),
+            If(sink.valid,
+                data_wr.we.eq(1),
+                NextValue(word, word + 1),
+                If(sink.last,
+                    appended.eq(1),
+                    NextValue(nsectors, nsectors + sink.count),
+                    NextValue(timer, 0),
+                    NextState("IDLE")
+                )
+            )
+        )
+        fsm.act("FLUSH_DATA",
+            data_rd.re.eq(~flush_valid | port.sink.ready),
+            port.sink.valid.eq(flush_valid),
+            port.sink.write.eq(1),
+            port.sink.sector.eq(start),
+            port.sink.count.eq(nsectors),
+            port.sink.last.eq(flush_last),
+            port.sink.data.eq(data_rd.dat_r),
+            If(data_rd.re,
+                NextValue(flush_valid, word != total),
+                NextValue(flush_last,  word == (total - 1)),
+                If(word != total,
+                    NextValue(word, word + 1)
+                )
+            ),
+            If(port.sink.valid & port.sink.ready & port.sink.last,
+                NextValue(flush_valid, 0),
+                NextState("FLUSH_RESPONSE")
+            )
+        )
+        fsm.act("FLUSH_RESPONSE",
+            port.source.ready.eq(1),
+            If(port.source.valid & port.source.last & port.source.end,
+                NextValue(failed, port.source.failed),
+                NextState("FANOUT")
+            )
+        )
+        fsm.act("FANOUT",
+            fanout.eq(1),
+            If(fanout_done,
+                NextValue(nsectors, 0),
+                NextValue(timer, 0),
+                NextState("IDLE")
+            )
+        )
+        fsm.act("FORWARD",
+            sink.connect(port.sink),
+            If(sink.valid & sink.ready & sink.last,
+                NextState("RESPONSE")
+            )
+        )
+        fsm.act("RESPONSE",
+            port.source.connect(source),
+            If(port.source.valid & port.source.ready & port.source.last & port.source.end,
+                NextState("IDLE")
+            )
+        )
@@ -6,10 +6,15 @@
 
 from migen import *
 
+from litex.gen.common import reverse_bytes
+
 from litex.soc.interconnect.csr import *
+from litex.soc.interconnect.csr_eventmanager import *
 from litex.soc.interconnect import stream
 
-from litex.soc.cores.dma import WishboneDMAWriter
+from litex.soc.cores.dma import WishboneDMAReader, WishboneDMAWriter
+
+from litesata.common import logical_sector_size
 
 # SATA Block2Mem DMA ---------------------------------------------------------------------------------
 
@@ -73,3 +78,308 @@ class LiteSATABlock2MemDMA(Module, AutoCSR):
                 )
             )
         )
+
+# SATA Scatter-Gather DMA Rings --------------------------------------------------------------------
+
+class LiteSATAScatterGatherDMARings:
+    """Scatter-Gather DMA rings
+
+    Descriptor/status rings and CSRs shared by the Scatter-Gather DMAs.
+
+    Each descriptor (sector, count, base) is pushed to the descriptor ring by writing the desc_*
+    CSRs and then desc_we. Once a descriptor is executed, a completion (index, failed) is pushed
+    to the status ring and a done event is generated. The completion is read from the status_*
+    CSRs and popped with status_ack. index is the number of the descriptor since reset (modulo
+    2**16).
+    """
+    def add_rings(self, ring_depth):
+        self.desc_sector   = CSRStorage(48)
+        self.desc_count    = CSRStorage(16)
+        self.desc_base     = CSRStorage(64)
+        self.desc_we       = CSR()
+        self.desc_level    = CSRStatus(bits_for(ring_depth))
+
+        self.status_index  = CSRStatus(16)
+        self.status_failed = CSRStatus()
+        self.status_level  = CSRStatus(bits_for(ring_depth))
+        self.status_ack    = CSR()
+
+        self.submodules.ev = EventManager()
+        self.ev.done = EventSourcePulse()
+        self.ev.finalize()
+
+        # # #
+
+        # Descriptor ring
+        desc_layout = [("sector", 48), ("count", 16), ("base", 64)]
+        self.submodules.desc_ring = desc_ring = stream.SyncFIFO(desc_layout, ring_depth)
+        self.comb += [
+            desc_ring.sink.valid.eq(self.desc_we.re),
+            desc_ring.sink.sector.eq(self.desc_sector.storage),
+            desc_ring.sink.count.eq(self.desc_count.storage),
+            desc_ring.sink.base.eq(self.desc_base.storage),
+            self.desc_level.status.eq(desc_ring.level)
+        ]
+
+        # Status ring
+        index = Signal(16)
+        status_layout = [("index", 16), ("failed", 1)]
+        self.submodules.status_ring = status_ring = stream.SyncFIFO(status_layout, ring_depth)
+        self.sync += If(status_ring.sink.valid, index.eq(index + 1))
+        self.comb += [
+            status_ring.sink.index.eq(index),
+            self.ev.done.trigger.eq(status_ring.sink.valid),
+            self.status_index.status.eq(status_ring.source.index),
+            self.status_failed.status.eq(status_ring.source.failed),
+            self.status_level.status.eq(status_ring.level),
+            status_ring.source.ready.eq(self.status_ack.re)
+        ]
+
+        return desc_ring, status_ring
+
+# SATA Block2Mem Scatter-Gather DMA ----------------------------------------------------------------
+
+class LiteSATABlock2MemScatterGatherDMA(Module, AutoCSR, LiteSATAScatterGatherDMARings):
+    """Block to Memory Scatter-Gather DMA
+
+    Read blocks from the SATA drive and write them to memory through DMA, driven by a descriptor
+    ring (see LiteSATAScatterGatherDMARings).
+
+    Descriptors are executed back to back with multi-sector READ DMA EXT commands (count >= 1),
+    a completion is reported once the data of a descriptor is written to memory. Descriptors are
+    only started when the status ring has room for their completion. Descriptors with a count of
+    0 (65536 sectors for the drive) are not executed and reported as failed.
+
+    Memory bus width can be any multiple of the user port width (up to 256 bits).
+    """
+    def __init__(self, user_port, bus, endianness="little", fifo_depth=128, ring_depth=16):
+        self.user_port = user_port
+        self.bus       = bus
+        dw             = user_port.dw
+        assert bus.data_width%dw == 0
+        assert bus.data_width <= 256
+        desc_ring, status_ring = self.add_rings(ring_depth)
+
+        # # #
+
+        shift  = log2_int(bus.data_width//8)
+        sector = Signal(48)
+        count  = Signal(16)
+        base   = Signal(bus.adr_width)
+        words  = Signal(16 + 9 - shift + 1)
+        offset = Signal(len(words))
+        failed = Signal()
+
+        # DMA
+        self.submodules.dma = dma = WishboneDMAWriter(bus, with_csr=False, endianness="big")
+
+        # FIFO / Converter
+        self.submodules.fifo = fifo = stream.SyncFIFO([("data", dw)], fifo_depth)
+        self.submodules.converter = converter = ResetInserter()(stream.Converter(dw, bus.data_width))
+        self.comb += [
+            fifo.sink.valid.eq(user_port.source.valid & ~user_port.source.end),
+            fifo.sink.data.eq(user_port.source.data),
+            user_port.source.ready.eq(fifo.sink.ready | user_port.source.end),
+            fifo.source.connect(converter.sink, omit={"data"}),
+            converter.sink.last.eq(0)
+        ]
+        for i in range(dw//32):
+            data = fifo.source.data[32*i:32*(i+1)]
+            if endianness == "big":
+                data = reverse_bytes(data)
+            self.comb += converter.sink.data[32*i:32*(i+1)].eq(data)
+        self.comb += [
+            dma.sink.valid.eq(converter.source.valid),
+            dma.sink.address.eq(base + offset),
+            dma.sink.data.eq(converter.source.data),
+            converter.source.ready.eq(dma.sink.ready)
+        ]
+        self.sync += \
+            If(dma.sink.valid & dma.sink.ready,
+                offset.eq(offset + 1)
+            )
+
+        # FSM
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            converter.reset.eq(1),
+            If(desc_ring.source.valid & status_ring.sink.ready,
+                desc_ring.source.ready.eq(1),
+                NextValue(sector, desc_ring.source.sector),
+                NextValue(count,  desc_ring.source.count),
+                NextValue(base,   desc_ring.source.base[shift:]),
+                NextValue(words,  desc_ring.source.count << (9 - shift)),
+                NextValue(offset, 0),
+                NextValue(failed, 0),
+                If(desc_ring.source.count == 0,
+                    NextValue(failed, 1),
+                    NextState("STATUS")
+                ).Else(
+                    NextState("SEND-CMD")
+                )
+            )
+        )
+        fsm.act("SEND-CMD",
+            user_port.sink.valid.eq(1),
+            user_port.sink.last.eq(1),
+            user_port.sink.read.eq(1),
+            user_port.sink.sector.eq(sector),
+            user_port.sink.count.eq(count),
+            If(user_port.sink.ready,
+                NextState("RECEIVE-DATA")
+            )
+        )
+        fsm.act("RECEIVE-DATA",
+            If(user_port.source.valid & user_port.source.end,
+                NextValue(failed, user_port.source.failed),
+                NextState("WAIT-DMA")
+            )
+        )
+        fsm.act("WAIT-DMA",
+            If((offset == words) | (failed & ~fifo.source.valid & ~converter.source.valid),
+                NextState("STATUS")
+            )
+        )
+        fsm.act("STATUS",
+            status_ring.sink.valid.eq(1),
+            status_ring.sink.failed.eq(failed),
+            NextState("IDLE")
+        )
+
+# SATA Mem2Block Scatter-Gather DMA ----------------------------------------------------------------
+
+class LiteSATAMem2BlockDMA(Module, AutoCSR, LiteSATAScatterGatherDMARings):
+    """Memory to Block Scatter-Gather DMA
+
+    Read memory buffers through DMA and write them to the SATA drive, driven by a descriptor ring
+    (see LiteSATAScatterGatherDMARings).
+
+    Descriptors are executed back to back with multi-sector WRITE DMA EXT commands (count >= 1),
+    a completion is reported once the drive has acknowledged the write. Memory is read ahead in a
+    prefetch FIFO: the command is only issued once the FIFO is full (or holds the whole transfer),
+    and the FIFO keeps filling while the drive sends its DMA Activates, so that data is always
+    available when the drive requests it. fifo_depth should cover the DMA Activate latency of the
+    drive at line rate (512 dwords ~ 3.4us at Gen3). Descriptors with a count of 0 (65536 sectors
+    for the drive) are not executed and reported as failed.
+
+    Memory bus width can be any multiple of the user port width (up to 256 bits).
+    """
+    def __init__(self, user_port, bus, endianness="little", fifo_depth=512, ring_depth=16):
+        self.user_port = user_port
+        self.bus       = bus
+        dw             = user_port.dw
+        assert bus.data_width%dw == 0
+        assert bus.data_width <= 256
+        desc_ring, status_ring = self.add_rings(ring_depth)
+
+        # # #
+
+        shift     = log2_int(bus.data_width//8)
+        sector    = Signal(48)
+        count     = Signal(16)
+        base      = Signal(bus.adr_width)
+        words     = Signal(16 + 9 - shift + 1)
+        offset    = Signal(len(words))
+        ndata     = Signal(16 + log2_int(logical_sector_size*8//dw) + 1)
+        data      = Signal(len(ndata))
+        data_last = Signal()
+        failed    = Signal()
+
+        # DMA
+        self.submodules.dma = dma = WishboneDMAReader(bus, with_csr=False, endianness="big")
+
+        # Converter / Prefetch FIFO
+        self.submodules.converter = converter = ResetInserter()(stream.Converter(bus.data_width, dw))
+        self.submodules.fifo = fifo = ResetInserter()(stream.SyncFIFO([("data", dw)], fifo_depth))
+        self.comb += [
+            dma.source.connect(converter.sink, omit={"last"}),
+            converter.source.connect(fifo.sink, omit={"data", "last"})
+        ]
+        for i in range(dw//32):
+            d = converter.source.data[32*i:32*(i+1)]
+            if endianness == "big":
+                d = reverse_bytes(d)
+            self.comb += fifo.sink.data[32*i:32*(i+1)].eq(d)
+        self.comb += data_last.eq(data == (ndata - 1))
+
+        # FSM
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        self.comb += [
+            dma.sink.valid.eq(~fsm.ongoing("IDLE") & (offset != words)),
+            dma.sink.address.eq(base + offset)
+        ]
+        self.sync += \
+            If(dma.sink.valid & dma.sink.ready,
+                offset.eq(offset + 1)
+            )
+        fsm.act("IDLE",
+            converter.reset.eq(1),
+            fifo.reset.eq(1),
+            If(desc_ring.source.valid & status_ring.sink.ready,
+                desc_ring.source.ready.eq(1),
+                NextValue(sector, desc_ring.source.sector),
+                NextValue(count,  desc_ring.source.count),
+                NextValue(base,   desc_ring.source.base[shift:]),
+                NextValue(words,  desc_ring.source.count << (9 - shift)),
+                NextValue(ndata,  desc_ring.source.count << log2_int(logical_sector_size*8//dw)),
+                NextValue(offset, 0),
+                NextValue(data,   0),
+                NextValue(failed, 0),
+                If(desc_ring.source.count == 0,
+                    NextValue(failed, 1),
+                    NextState("STATUS")
+                ).Else(
+                    NextState("PREFETCH")
+                )
+            )
+        )
+        fsm.act("PREFETCH",
+            If((fifo.level == fifo_depth) | (fifo.level == ndata),
+                NextState("SEND-CMD-AND-DATA")
+            )
+        )
+        fsm.act("SEND-CMD-AND-DATA",
+            user_port.sink.valid.eq(fifo.source.valid),
+            user_port.sink.last.eq(data_last),
+            user_port.sink.write.eq(1),
+            user_port.sink.sector.eq(sector),
+            user_port.sink.count.eq(count),
+            user_port.sink.data.eq(fifo.source.data),
+            fifo.source.ready.eq(user_port.sink.ready),
+            If(user_port.sink.valid & user_port.sink.ready,
+                NextValue(data, data + 1),
+                If(data_last,
+                    NextState("WAIT-RESPONSE")
+                )
+            ),
+            # Write aborted by the drive: discard the remaining data (if any).
+            If(user_port.source.valid & user_port.source.end,
+                NextValue(failed, 1),
+                If(user_port.sink.valid & user_port.sink.ready & data_last,
+                    NextState("STATUS")
+                ).Else(
+                    NextState("FLUSH")
+                )
+            )
+        )
+        fsm.act("FLUSH",
+            fifo.source.ready.eq(1),
+            If(fifo.source.valid,
+                NextValue(data, data + 1),
+                If(data_last,
+                    NextState("STATUS")
+                )
+            )
+        )
+        fsm.act("WAIT-RESPONSE",
+            If(user_port.source.valid & user_port.source.end,
+                NextValue(failed, user_port.source.failed),
+                NextState("STATUS")
+            )
+        )
+        fsm.act("STATUS",
+            status_ring.sink.valid.eq(1),
+            status_ring.sink.failed.eq(failed),
+            NextState("IDLE")
+        )
+        self.comb += user_port.source.ready.eq(1)
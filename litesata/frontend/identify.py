@@ -0,0 +1,176 @@
+#
+# This file is part of LiteSATA.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+from litesata.common import *
+
+from litex.soc.interconnect.csr import *
+
+# LiteSATAIdentify ---------------------------------------------------------------------------------
+
+class LiteSATAIdentify(Module, AutoCSR):
+    """SATA IDENTIFY DEVICE parser
+
+    Issue an IDENTIFY DEVICE command on a user port and parse the 256 words of identify data on
+    the fly (no buffering) to latch the device's capabilities:
+        - max_lba: last addressable sector (words 100-103 when 48 bits LBA is supported, words
+          60-61 otherwise).
+        - gen: supported SATA generations (bit n: Gen n+1, word 76).
+        - ncq_depth: NCQ queue depth (word 75 + 1, 0 when NCQ is not supported, word 76).
+        - logical_sector_size/physical_sector_size: sector sizes in bytes (words 106/117-118).
+        - trim: DATA SET MANAGEMENT TRIM support (word 169).
+        - write_cache_supported/write_cache_enabled: write cache state (words 82/85).
+
+    The parsing is started on a rising edge of start (ie start can be tied to the PHY ready to
+    identify the device at link-up) or by writing to the start CSR. valid is set when all the
+    identify data has been received without error, frontends can then use the parsed values
+    directly.
+
+    Parameters
+    ----------
+    user_port : LiteSATAUserPort
+        Port the IDENTIFY DEVICE command is issued on.
+    """
+    def __init__(self, user_port):
+        self.start                 = Signal()
+        self.done                  = Signal()
+        self.valid                 = Signal()
+        self.max_lba               = Signal(48)
+        self.gen                   = Signal(3)
+        self.ncq_depth             = Signal(6)
+        self.logical_sector_size   = Signal(32)
+        self.physical_sector_size  = Signal(32)
+        self.trim                  = Signal()
+        self.write_cache_supported = Signal()
+        self.write_cache_enabled   = Signal()
+
+        self._start                 = CSR()
+        self._done                  = CSRStatus()
+        self._valid                 = CSRStatus()
+        self._max_lba               = CSRStatus(48)
+        self._gen                   = CSRStatus(3)
+        self._ncq_depth             = CSRStatus(6)
+        self._logical_sector_size   = CSRStatus(32)
+        self._physical_sector_size  = CSRStatus(32)
+        self._trim                  = CSRStatus()
+        self._write_cache_supported = CSRStatus()
+        self._write_cache_enabled   = CSRStatus()
+
+        # # #
+
+        sink, source = user_port.sink, user_port.source
+
+        ratio = user_port.dw//32
+        beats = 128//ratio
+
+        # Start on start's rising edge or on CSR write.
+        start   = Signal()
+        start_d = Signal()
+        self.sync += start_d.eq(self.start)
+        self.comb += start.eq((self.start & ~start_d) | (self._start.re & self._start.r))
+
+        # Identify dwords of interest, latched on the fly.
+        beat   = Signal(max=beats + 1)
+        failed = Signal()
+        dwords = {n: Signal(32) for n in [30, 37, 38, 41, 42, 50, 51, 53, 58, 59, 84]}
+        def word(n):
+            return dwords[n//2][16*(n%2):16*(n%2 + 1)]
+        for n, dword in dwords.items():
+            self.sync += \
+                If(source.valid & source.ready & (beat == n//ratio),
+                    dword.eq(source.data[32*(n%ratio):32*(n%ratio + 1)])
+                )
+
+        # Parsing.
+        lba48             = Signal()
+        sectors           = Signal(48)
+        sector_size_valid = Signal()
+        logical_words     = Signal(32)
+        logical_size      = Signal(32)
+        physical_size     = Signal(32)
+        self.comb += [
+            lba48.eq(word(83)[10]),
+            If(lba48,
+                sectors.eq(Cat(word(100), word(101), word(102)))
+            ).Else(
+                sectors.eq(Cat(word(60), word(61)))
+            ),
+            # Word 106 is valid when bit 14 is set and bit 15 is cleared.
+            sector_size_valid.eq(word(106)[14] & ~word(106)[15]),
+            logical_words.eq(Cat(word(117), word(118))),
+            If(sector_size_valid & word(106)[12],
+                logical_size.eq(logical_words << 1)
+            ).Else(
+                logical_size.eq(logical_sector_size)
+            ),
+            If(sector_size_valid & word(106)[13],
+                physical_size.eq(logical_size << word(106)[:4])
+            ).Else(
+                physical_size.eq(logical_size)
+            )
+        ]
+
+        # FSM.
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            self.done.eq(1),
+            If(start,
+                NextValue(self.valid, 0),
+                NextValue(beat, 0),
+                NextValue(failed, 0),
+                NextState("SEND-CMD")
+            )
+        )
+        fsm.act("SEND-CMD",
+            sink.valid.eq(1),
+            sink.last.eq(1),
+            sink.identify.eq(1),
+            If(sink.ready,
+                NextState("RECEIVE-DATA")
+            )
+        )
+        fsm.act("RECEIVE-DATA",
+            source.ready.eq(1),
+            If(source.valid,
+                If(beat != beats,
+                    NextValue(beat, beat + 1)
+                ),
+                If(source.failed,
+                    NextValue(failed, 1)
+                ),
+                If(source.last,
+                    NextState("UPDATE")
+                )
+            )
+        )
+        fsm.act("UPDATE",
+            NextValue(self.valid, ~failed & (beat == beats)),
+            NextValue(self.max_lba, sectors - 1),
+            NextValue(self.gen, word(76)[1:4]),
+            If(word(76)[8],
+                NextValue(self.ncq_depth, word(75)[:5] + 1)
+            ).Else(
+                NextValue(self.ncq_depth, 0)
+            ),
+            NextValue(self.logical_sector_size,  logical_size),
+            NextValue(self.physical_sector_size, physical_size),
+            NextValue(self.trim, word(169)[0]),
+            NextValue(self.write_cache_supported, word(82)[5]),
+            NextValue(self.write_cache_enabled,   word(85)[5]),
+            NextState("IDLE")
+        )
+
+        # CSRs.
+        self.comb += [
+            self._done.status.eq(self.done),
+            self._valid.status.eq(self.valid),
+            self._max_lba.status.eq(self.max_lba),
+            self._gen.status.eq(self.gen),
+            self._ncq_depth.status.eq(self.ncq_depth),
+            self._logical_sector_size.status.eq(self.logical_sector_size),
+            self._physical_sector_size.status.eq(self.physical_sector_size),
+            self._trim.status.eq(self.trim),
+            self._write_cache_supported.status.eq(self.write_cache_supported),
+            self._write_cache_enabled.status.eq(self.write_cache_enabled)
+        ]
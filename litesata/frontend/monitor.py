@@ -0,0 +1,131 @@
+#
+# This file is part of LiteSATA.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+from litesata.common import *
+
+from litex.soc.interconnect.csr import *
+
+# LiteSATALatencyMonitor ---------------------------------------------------------------------------
+
+class LiteSATALatencyMonitor(Module, AutoCSR):
+    """SATA latency monitor
+
+    Passively monitor a user port and measure the latency (in sys_clk cycles) of each command, from
+    its issue (first cycle of sink.valid) to its completion (source end). Latencies are accumulated
+    in a log2-bucketed histogram stored in block RAM: bucket n counts the commands with a latency
+    in [2**n, 2**(n+1)) (bucket 0 also counts latencies of 0).
+
+    Buckets are read by writing bucket then reading bucket_value. clear resets the histogram,
+    count and max (takes nbuckets cycles). Commands are expected to be executed one at a time on
+    the port (non-queued commands).
+
+    Parameters
+    ----------
+    user_port : LiteSATAUserPort
+        Port to monitor.
+    counter_width : int
+        Width of the latency/bucket counters (and number of buckets).
+    """
+    def __init__(self, user_port, counter_width=32):
+        nbuckets = counter_width
+
+        self.clear        = CSR()
+        self.bucket       = CSRStorage(bits_for(nbuckets - 1))
+        self.bucket_value = CSRStatus(counter_width)
+        self.count        = CSRStatus(counter_width)
+        self.max          = CSRStatus(counter_width)
+
+        # # #
+
+        sink, source = user_port.sink, user_port.source
+
+        # Latency measurement
+        ongoing  = Signal()
+        issue    = Signal()
+        complete = Signal()
+        latency  = Signal(counter_width)
+        self.comb += [
+            issue.eq(sink.valid & ~ongoing),
+            complete.eq(source.valid & source.ready & source.last & source.end & ongoing)
+        ]
+        self.sync += [
+            If(issue,
+                ongoing.eq(1)
+            ).Elif(complete,
+                ongoing.eq(0)
+            ),
+            If(issue,
+                latency.eq(1)
+            ).Elif(latency != (2**counter_width - 1),
+                latency.eq(latency + 1)
+            )
+        ]
+
+        # Bucket selection: position of the most significant bit set
+        bucket = Signal(bits_for(nbuckets - 1))
+        for i in range(nbuckets):
+            self.comb += If(latency[i], bucket.eq(i))
+
+        pending        = Signal()
+        pending_bucket = Signal(bits_for(nbuckets - 1))
+
+        # Histogram
+        mem = Memory(counter_width, nbuckets)
+        port = mem.get_port(write_capable=True)
+        csr_port = mem.get_port()
+        self.specials += mem, port, csr_port
+        self.comb += [
+            csr_port.adr.eq(self.bucket.storage),
+            self.bucket_value.status.eq(csr_port.dat_r)
+        ]
+
+        clear_adr = Signal(bits_for(nbuckets - 1))
+        clearing  = Signal()
+        update    = Signal()
+
+        self.submodules.fsm = fsm = FSM(reset_state="CLEAR")
+        fsm.act("IDLE",
+            port.adr.eq(pending_bucket),
+            If(self.clear.re,
+                NextValue(clear_adr, 0),
+                NextState("CLEAR")
+            ).Elif(pending,
+                NextState("UPDATE")
+            )
+        )
+        fsm.act("UPDATE",
+            port.adr.eq(pending_bucket),
+            port.we.eq(1),
+            port.dat_w.eq(port.dat_r + 1),
+            update.eq(1),
+            NextState("IDLE")
+        )
+        fsm.act("CLEAR",
+            port.adr.eq(clear_adr),
+            port.we.eq(1),
+            port.dat_w.eq(0),
+            clearing.eq(1),
+            NextValue(clear_adr, clear_adr + 1),
+            If(clear_adr == (nbuckets - 1),
+                NextState("IDLE")
+            )
+        )
+        self.sync += [
+            If(complete,
+                pending.eq(1),
+                pending_bucket.eq(bucket)
+            ).Elif(update,
+                pending.eq(0)
+            ),
+            If(clearing,
+                self.count.status.eq(0),
+                self.max.status.eq(0)
+            ).Elif(complete,
+                self.count.status.eq(self.count.status + 1),
+                If(latency > self.max.status,
+                    self.max.status.eq(latency)
+                )
+            )
+        ]
@@ -0,0 +1,304 @@
+#
+# This file is part of LiteSATA.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+from functools import reduce
+from operator import add
+
+from litesata.common import *
+
+from litex.soc.interconnect.csr import *
+
+# LiteSATAPrefetcher -------------------------------------------------------------------------------
+
+class LiteSATAPrefetcher(Module, AutoCSR):
+    """SATA sequential read-ahead prefetcher
+
+    Detect sequential read streams on a port (core or user port) and read them ahead in a staging
+    buffer (block RAM) of prefetch_sectors sectors per stream:
+        - a read of up to prefetch_sectors sectors fully contained in the buffer of a stream is
+          served from the buffer, without any command on the port. Once the buffer of the stream is
+          consumed up to its end, the next prefetch_sectors sectors are read ahead.
+        - a read starting where the previous read of a stream ended (sequential) fills the buffer
+          of the stream with prefetch_sectors sectors from its start and is then served from it.
+        - other reads are forwarded and start tracking a new stream (round-robin replacement of
+          the nstreams streams).
+
+    Read aheads are done in the background: reads hitting the buffers of the other streams are
+    served while a read ahead is in flight, other commands (which need the port) wait for its
+    completion. Writes invalidate the buffers they overlap, trims all the buffers (the trimmed
+    ranges are only known from the data), and are forwarded, identify and larger reads are
+    forwarded. useful counts the sectors served from the buffers, wasted the prefetched
+    sectors discarded without being served and blocked the cycles commands waited for a read
+    ahead.
+
+    Parameters
+    ----------
+    port : in
+        Port (sink/source) the commands are issued on.
+    nstreams : int
+        Number of tracked streams.
+    prefetch_sectors : int
+        Prefetch depth (sectors per prefetch read / per stream buffer).
+    """
+    def __init__(self, port, nstreams=2, prefetch_sectors=16, counter_width=32):
+        dw = len(port.sink.data)
+        self.sink   = sink   = stream.Endpoint(command_tx_description(dw))
+        self.source = source = stream.Endpoint(command_rx_description(dw))
+
+        self.useful  = CSRStatus(counter_width)
+        self.wasted  = CSRStatus(counter_width)
+        self.blocked = CSRStatus(counter_width)
+
+        # # #
+
+        words_per_sector = logical_sector_size*8//dw
+        buffer_words     = prefetch_sectors*words_per_sector
+
+        # Current command.
+        sector = Signal(48)
+        count  = Signal(16)
+
+        # Streams: next expected sector, buffer base sector, filled / consumed sectors.
+        tracked  = [Signal()   for i in range(nstreams)]
+        expected = [Signal(48) for i in range(nstreams)]
+        base     = [Signal(48) for i in range(nstreams)]
+        filled   = [Signal(max=prefetch_sectors + 1) for i in range(nstreams)]
+        consumed = [Signal(16) for i in range(nstreams)]
+        unused   = [Signal(max=prefetch_sectors + 1) for i in range(nstreams)]
+        for i in range(nstreams):
+            self.comb += If(consumed[i] < filled[i], unused[i].eq(filled[i] - consumed[i]))
+
+        sel        = Signal(max=max(nstreams, 2))
+        sel_base   = Array(base)[sel]
+        sel_filled = Array(filled)[sel]
+        sel_unused = Array(unused)[sel]
+        rr         = Signal(max=max(nstreams, 2))
+
+        # Lookup of the command presented on the sink.
+        hits      = Signal(nstreams)
+        seqs      = Signal(nstreams)
+        overlaps  = Signal(nstreams)
+        hit_sel   = Signal(max=max(nstreams, 2))
+        seq_sel   = Signal(max=max(nstreams, 2))
+        for i in reversed(range(nstreams)):
+            self.comb += [
+                hits[i].eq((filled[i] != 0) &
+                    (sink.sector >= base[i]) &
+                    ((sink.sector + sink.count) <= (base[i] + filled[i]))),
+                seqs[i].eq(tracked[i] & (sink.sector == expected[i])),
+                overlaps[i].eq((filled[i] != 0) &
+                    (sink.sector < (base[i] + filled[i])) &
+                    ((sink.sector + sink.count) > base[i])),
+                If(hits[i], hit_sel.eq(i)),
+                If(seqs[i], seq_sel.eq(i))
+            ]
+
+        # Streams updates.
+        fill_start  = Signal() # Start a prefetch in the buffer of sel at fill_sector.
+        fill_done   = Signal() # Prefetch of fill_sel completed.
+        served      = Signal() # Command served from the buffer of sel.
+        allocate    = Signal() # Track a new stream (round-robin).
+        invalidate  = Signal() # Drop the buffers overlapped by the command (all for a trim).
+        dropped     = Signal(nstreams)
+        fill_sector = Signal(48)
+        fill_sel    = Signal(max=max(nstreams, 2))
+        self.sync += If(fill_start, fill_sel.eq(sel))
+        self.comb += dropped.eq(Mux(sink.trim, 2**nstreams - 1, overlaps))
+        for i in range(nstreams):
+            self.sync += [
+                If(fill_start & (sel == i),
+                    base[i].eq(fill_sector),
+                    filled[i].eq(0),
+                    consumed[i].eq(0)
+                ),
+                If(fill_done & (fill_sel == i),
+                    filled[i].eq(prefetch_sectors)
+                ),
+                If(served & (sel == i),
+                    expected[i].eq(sector + count),
+                    consumed[i].eq(consumed[i] + count)
+                ),
+                If(allocate & (rr == i),
+                    tracked[i].eq(1),
+                    expected[i].eq(sink.sector + sink.count),
+                    filled[i].eq(0)
+                ),
+                If(invalidate & dropped[i],
+                    filled[i].eq(0)
+                )
+            ]
+        self.sync += [
+            If(allocate,
+                rr.eq(Mux(rr == (nstreams - 1), 0, rr + 1))
+            ),
+            If(served,
+                self.useful.status.eq(self.useful.status + count)
+            ),
+            If(fill_start,
+                self.wasted.status.eq(self.wasted.status + sel_unused)
+            ).Elif(allocate,
+                self.wasted.status.eq(self.wasted.status + Array(unused)[rr])
+            ).Elif(invalidate,
+                self.wasted.status.eq(self.wasted.status +
+                    reduce(add, [Mux(dropped[i], unused[i], 0) for i in range(nstreams)]))
+            )
+        ]
+
+        # Staging buffers.
+        data    = Memory(dw, nstreams*buffer_words)
+        data_wr = data.get_port(write_capable=True)
+        data_rd = data.get_port(has_re=True)
+        self.specials += data, data_wr, data_rd
+        word      = Signal(max=buffer_words + 1)
+        fill_word = Signal(max=buffer_words + 1)
+        offset    = Signal(max=buffer_words)
+        total     = Signal(max=buffer_words + 1)
+        self.comb += [
+            offset.eq((sector - sel_base)*words_per_sector),
+            total.eq(count*words_per_sector),
+            data_wr.adr.eq(fill_sel*buffer_words + fill_word),
+            data_wr.dat_w.eq(port.source.data),
+            data_rd.adr.eq(sel*buffer_words + offset + word)
+        ]
+
+        # Served data: 1-stage pipeline on the data read port.
+        serve_valid = Signal()
+        serve_last  = Signal()
+
+        # Prefetch of a sequential read (served once prefetched) or read ahead (after a serve, in
+        # the background).
+        filling     = Signal()
+        fill_failed = Signal()
+
+        self.submodules.fill_fsm = fill_fsm = FSM(reset_state="IDLE")
+        self.comb += filling.eq(~fill_fsm.ongoing("IDLE"))
+        fill_fsm.act("IDLE",
+            NextValue(fill_word, 0),
+            If(fill_start,
+                NextValue(fill_failed, 0),
+                NextState("CMD")
+            )
+        )
+        fill_fsm.act("CMD",
+            port.sink.valid.eq(1),
+            port.sink.read.eq(1),
+            port.sink.sector.eq(fill_sector),
+            port.sink.count.eq(prefetch_sectors),
+            port.sink.last.eq(1),
+            If(port.sink.ready,
+                NextState("DATA")
+            )
+        )
+        fill_fsm.act("DATA",
+            port.source.ready.eq(1),
+            If(port.source.valid,
+                If(port.source.end,
+                    NextValue(fill_failed, fill_failed | port.source.failed),
+                    If(port.source.last,
+                        fill_done.eq(~(fill_failed | port.source.failed)),
+                        NextState("IDLE")
+                    )
+                ).Elif(fill_word != buffer_words,
+                    data_wr.we.eq(1),
+                    NextValue(fill_word, fill_word + 1)
+                )
+            )
+        )
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            NextValue(sector, sink.sector),
+            NextValue(count,  sink.count),
+            NextValue(word,   0),
+            If(sink.valid,
+                If(sink.read & (sink.count != 0) & (sink.count <= prefetch_sectors) & (hits != 0),
+                    sink.ready.eq(1),
+                    NextValue(sel, hit_sel),
+                    NextState("SERVE")
+                ).Elif(filling,
+                    # Port busy with a read ahead.
+                    NextValue(self.blocked.status, self.blocked.status + 1)
+                ).Elif(sink.write | sink.trim,
+                    invalidate.eq(1),
+                    NextState("FORWARD")
+                ).Elif(sink.read & (sink.count != 0) & (sink.count <= prefetch_sectors),
+                    If(seqs != 0,
+                        NextValue(sel,         seq_sel),
+                        NextValue(fill_sector, sink.sector),
+                        NextState("PREFETCH_START")
+                    ).Else(
+                        allocate.eq(1),
+                        NextState("FORWARD")
+                    )
+                ).Else(
+                    NextState("FORWARD")
+                )
+            )
+        )
+        fsm.act("SERVE",
+            data_rd.re.eq(~serve_valid | source.ready),
+            source.valid.eq(serve_valid),
+            source.read.eq(1),
+            source.last.eq(serve_last),
+            source.data.eq(data_rd.dat_r),
+            If(data_rd.re,
+                NextValue(serve_valid, word != total),
+                NextValue(serve_last,  word == (total - 1)),
+                If(word != total,
+                    NextValue(word, word + 1)
+                )
+            ),
+            If(source.valid & source.ready & source.last,
+                NextValue(serve_valid, 0),
+                NextState("SERVE_RESPONSE")
+            )
+        )
+        fsm.act("SERVE_RESPONSE",
+            source.valid.eq(1),
+            source.read.eq(1),
+            source.last.eq(1),
+            source.end.eq(1),
+            If(source.ready,
+                served.eq(1),
+                # Buffer consumed up to its end: read ahead (if the port is available).
+                If(((sector + count) == (sel_base + sel_filled)) & ~filling,
+                    NextValue(fill_sector, sector + count),
+                    NextState("READ_AHEAD_START")
+                ).Else(
+                    NextState("IDLE")
+                )
+            )
+        )
+        fsm.act("READ_AHEAD_START",
+            fill_start.eq(1),
+            NextState("IDLE")
+        )
+        fsm.act("PREFETCH_START",
+            fill_start.eq(1),
+            NextState("PREFETCH_WAIT")
+        )
+        fsm.act("PREFETCH_WAIT",
+            NextValue(word, 0),
+            If(~filling,
+                If(fill_failed,
+                    NextState("FORWARD")
+                ).Else(
+                    sink.ready.eq(1),
+                    NextState("SERVE")
+                )
+            )
+        )
+        fsm.act("FORWARD",
+            sink.connect(port.sink),
+            If(sink.valid & sink.ready & sink.last,
+                NextState("RESPONSE")
+            )
+        )
+        fsm.act("RESPONSE",
+            port.source.connect(source),
+            If(port.source.valid & port.source.ready & port.source.last & port.source.end,
+                NextState("IDLE")
+            )
+        )
@@ -5,7 +5,7 @@
 # SPDX-License-Identifier: BSD-2-Clause
 
 from functools import reduce
-from operator import and_, or_
+from operator import and_, or_, xor
 
 from litesata.common import *
 from litesata.frontend.arbitration import LiteSATAUserPort
@@ -143,6 +143,207 @@ class LiteSATAStriping(Module):
             ]
         self.sink, self.source = self.tx.sink, self.rx.source
 
+# LiteSATA Chunked Striping ------------------------------------------------------------------------
+
+class LiteSATAChunkedStriping(Module):
+    """SATA Chunked Striping
+
+    Segment the sector space in chunks of stripe_sectors sectors distributed on N different
+    controllers:
+                 +----> controller0 (dw): chunks 0, N,   2N, ...
+    port (dw) <--+----> controllerX (dw): chunks X, N+X, ...
+                 +----> controllerN (dw): chunks N-1, 2N-1, ...
+
+    Each command is mapped to sub-commands (one per chunk) issued to the controllers as soon as
+    they are free: sub-commands on different controllers are executed concurrently. Responses and
+    read data are merged back in order and a single end/failed response is presented per command.
+    Identify commands are sent to controller0, flush and set features commands to all the
+    controllers (one after the other, a single combined response is presented). Trim commands are
+    not supported (their ranges would have to be remapped to the controllers): the data is
+    discarded and a failed response is presented.
+
+    Characteristics:
+        - port's visible capacity = N x controller's visible capacity
+        - small random accesses are spread on the N controllers (IOPS scale with N)
+        - large transfers overlap on up to N controllers
+
+    Parameters
+    ----------
+    controllers : list
+        Controllers (N must be a power of 2).
+    stripe_sectors : int
+        Chunk size in sectors (power of 2).
+    """
+    def __init__(self, controllers, stripe_sectors=64):
+        n  = len(controllers)
+        dw = len(controllers[0].sink.data)
+        self.sink   = sink   = stream.Endpoint(command_tx_description(dw))
+        self.source = source = stream.Endpoint(command_rx_description(dw))
+
+        # # #
+
+        n_bits           = log2_int(n)
+        stripe_bits      = log2_int(stripe_sectors)
+        words_per_sector = logical_sector_size*8//dw
+
+        # Mapping of the current sector to controller / controller's sector.
+        is_write     = Signal()
+        is_read      = Signal()
+        is_identify  = Signal()
+        is_flush     = Signal()
+        is_features  = Signal()
+        features     = Signal(8)
+        broadcast    = Signal()
+        bcast_drive  = Signal(max=max(n, 2))
+        sector       = Signal(48)
+        remaining    = Signal(16)
+        offset       = Signal(stripe_bits)
+        chunk        = Signal(48 - stripe_bits)
+        drive        = Signal(max=max(n, 2))
+        drive_sector = Signal(48)
+        count        = Signal(16)
+        last_cmd     = Signal()
+        words        = Signal(max=stripe_sectors*words_per_sector)
+        words_last   = Signal()
+        self.comb += [
+            offset.eq(sector[:stripe_bits]),
+            chunk.eq(sector[stripe_bits:]),
+            broadcast.eq(is_flush | is_features),
+            drive.eq(Mux(broadcast, bcast_drive, chunk[:n_bits] if n_bits else 0)),
+            drive_sector.eq(Cat(offset, chunk[n_bits:])),
+            last_cmd.eq(remaining <= (stripe_sectors - offset)),
+            count.eq(Mux(last_cmd, remaining, stripe_sectors - offset)),
+            words_last.eq(words == (count*words_per_sector - 1))
+        ]
+
+        # Controllers' busy flags (one non-queued command per controller).
+        busy     = Signal(n)
+        busy_set = Signal(n)
+        busy_clr = Signal(n)
+        self.sync += busy.eq((busy | busy_set) & ~busy_clr)
+
+        # Order of the sub-commands (controller, last) for the merge of the responses.
+        order = stream.SyncFIFO([("drive", len(drive))], n)
+        self.submodules += order
+        self.comb += [
+            order.sink.drive.eq(drive),
+            order.sink.last.eq(Mux(broadcast, bcast_drive == (n - 1), last_cmd | is_identify))
+        ]
+
+        # Sub-commands
+        cmd = stream.Endpoint(command_tx_description(dw))
+        self.comb += [
+            cmd.write.eq(is_write),
+            cmd.read.eq(is_read),
+            cmd.identify.eq(is_identify),
+            cmd.flush.eq(is_flush),
+            cmd.set_features.eq(is_features),
+            cmd.features.eq(features),
+            cmd.sector.eq(drive_sector),
+            cmd.count.eq(count),
+            cmd.data.eq(sink.data)
+        ]
+        for i, controller in enumerate(controllers):
+            self.comb += [
+                cmd.connect(controller.sink, omit={"valid", "ready"}),
+                If(drive == i,
+                    controller.sink.valid.eq(cmd.valid),
+                    cmd.ready.eq(controller.sink.ready)
+                )
+            ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        reject = Signal()
+        fsm.act("IDLE",
+            NextValue(words, 0),
+            If(sink.valid & sink.trim,
+                NextState("REJECT")
+            ).Elif(sink.valid,
+                # Write data is consumed with the sub-commands.
+                sink.ready.eq(~sink.write),
+                NextValue(is_write,    sink.write),
+                NextValue(is_read,     sink.read),
+                NextValue(is_identify, sink.identify),
+                NextValue(is_flush,    sink.flush),
+                NextValue(is_features, sink.set_features),
+                NextValue(features,    sink.features),
+                NextValue(bcast_drive, 0),
+                NextValue(sector,      Mux(sink.identify, 0, sink.sector)),
+                NextValue(remaining,   sink.count),
+                NextState("SEND_CMD")
+            )
+        )
+        fsm.act("SEND_CMD",
+            If(~(busy >> drive)[0] & order.sink.ready,
+                If(is_write,
+                    cmd.valid.eq(sink.valid),
+                    cmd.last.eq(words_last | sink.last),
+                    sink.ready.eq(cmd.ready)
+                ).Else(
+                    cmd.valid.eq(1),
+                    cmd.last.eq(1)
+                )
+            ),
+            If(cmd.valid & cmd.ready,
+                NextValue(words, words + 1),
+                If(cmd.last,
+                    order.sink.valid.eq(1),
+                    busy_set.eq(1 << drive),
+                    NextValue(words,     0),
+                    NextValue(sector,    sector    + count),
+                    NextValue(remaining, remaining - count),
+                    NextValue(bcast_drive, bcast_drive + 1),
+                    If(order.sink.last,
+                        NextState("IDLE")
+                    )
+                )
+            )
+        )
+        fsm.act("REJECT",
+            sink.ready.eq(1),
+            If(sink.valid & sink.last,
+                NextState("PRESENT_FAILED_RESPONSE")
+            )
+        )
+        fsm.act("PRESENT_FAILED_RESPONSE",
+            # Once the responses of the previous commands are presented.
+            reject.eq(~order.source.valid),
+            If(reject & source.ready,
+                NextState("IDLE")
+            )
+        )
+
+        # Responses merge: intermediate ends are not forwarded, failures are accumulated.
+        failed = Signal()
+        resp   = stream.Endpoint(command_rx_description(dw))
+        for i, controller in enumerate(controllers):
+            self.comb += If(order.source.valid & (order.source.drive == i),
+                controller.source.connect(resp)
+            )
+        self.comb += [
+            If(reject,
+                source.valid.eq(1),
+                source.last.eq(1),
+                source.write.eq(1),
+                source.end.eq(1),
+                source.failed.eq(1)
+            ).Else(
+                resp.connect(source, omit={"valid", "ready", "end", "failed"}),
+                source.valid.eq(resp.valid & (~resp.end | order.source.last)),
+                source.end.eq(resp.end),
+                source.failed.eq(resp.failed | (resp.end & failed))
+            ),
+            resp.ready.eq(source.ready | (resp.end & ~order.source.last)),
+            If(resp.valid & resp.ready & resp.end,
+                order.source.ready.eq(1),
+                busy_clr.eq(1 << order.source.drive)
+            )
+        ]
+        self.sync += \
+            If(resp.valid & resp.ready & resp.end,
+                failed.eq(~order.source.last & (failed | resp.failed))
+            )
+
 # LiteSATA Mirroring -------------------------------------------------------------------------------
 
 class LiteSATAMirroringCtrl(Module):
@@ -201,7 +402,7 @@ class LiteSATAMirroringTX(Module):
                 sink.connect(read, omit=set(["valid", "ready"])),
                 sink.connect(write, omit=set(["valid", "ready"])),
                 read.valid.eq(sink.valid & (sink.read | sink.identify) & ~read_stall),
-                write.valid.eq(sink.valid & sink.write),
+                write.valid.eq(sink.valid & ~(sink.read | sink.identify)),
                 If(sink.read | sink.identify,
                     sink.ready.eq((read.ready & ~read_stall))
                 ).Else(
@@ -275,6 +476,172 @@ class LiteSATAMirroringRX(Module):
             ]
 
 
+class LiteSATAMirroringWriteQueues(Module):
+    """SATA Mirroring with per-controller write queues
+
+    Writes (and trim, flush and set features commands) from the N ports are arbitrated and buffered
+    in a write queue per controller (command + data, write_queue_sectors sectors), so the port is
+    released as soon as the write is queued. Each controller executes its queue in order and
+    independently from the others: a write does not stall the reads of the other ports, reads are
+    only interleaved between the writes on their controller (reads have priority over queued
+    writes).
+
+    Writes are queued in the same order on all the controllers, so mirrors stay identical. The
+    write response is presented to the port once the write is completed on all the controllers.
+    A read overlapping a write still in the queue of its controller is held until the write is
+    issued, so a read issued after a write (even before its response) returns the written data.
+    """
+    def __init__(self, n, dw, write_queue_sectors=16, write_queue_depth=4):
+        self.sinks         = sinks         = [stream.Endpoint(command_tx_description(dw)) for i in range(n)]
+        self.sources       = sources       = [stream.Endpoint(command_rx_description(dw)) for i in range(n)]
+        self.ctrl_sources  = ctrl_sources  = [stream.Endpoint(command_tx_description(dw)) for i in range(n)]
+        self.ctrl_sinks    = ctrl_sinks    = [stream.Endpoint(command_rx_description(dw)) for i in range(n)]
+
+        # # #
+
+        words_per_sector = logical_sector_size*8//dw
+
+        # Writes arbitration and broadcast to the write queues.
+        reads  = [stream.Endpoint(command_tx_description(dw)) for i in range(n)]
+        writes = [stream.Endpoint(command_tx_description(dw)) for i in range(n)]
+        for sink, read, write in zip(sinks, reads, writes):
+            self.comb += [
+                sink.connect(read,  omit={"valid", "ready"}),
+                sink.connect(write, omit={"valid", "ready"}),
+                read.valid.eq(sink.valid & (sink.read | sink.identify)),
+                write.valid.eq(sink.valid & ~(sink.read | sink.identify)),
+                If(sink.read | sink.identify,
+                    sink.ready.eq(read.ready)
+                ).Else(
+                    sink.ready.eq(write.ready)
+                )
+            ]
+
+        # Ports of the queued writes (in order).
+        ports = stream.SyncFIFO([("port", bits_for(n - 1)), ("write", 1)], write_queue_depth)
+        self.submodules += ports
+
+        write         = stream.Endpoint(command_tx_description(dw))
+        write_arbiter = Arbiter(writes, write)
+        write_striper = LiteSATAStripingTX(n, dw, mirroring_mode=True)
+        self.submodules += write_arbiter, write_striper
+        self.comb += [
+            write.connect(write_striper.sink, omit={"valid", "ready"}),
+            write_striper.sink.valid.eq(write.valid & ports.sink.ready),
+            write.ready.eq(write_striper.sink.ready & ports.sink.ready),
+            ports.sink.valid.eq(write.valid & write.ready & write.last),
+            ports.sink.port.eq(write_arbiter.grant),
+            ports.sink.write.eq(write.write | write.trim)
+        ]
+
+        # Controllers' sequencers.
+        dones   = []
+        queueds = []
+        for i in range(n):
+            queue = stream.SyncFIFO(command_tx_description(dw), write_queue_sectors*words_per_sector)
+            done  = stream.SyncFIFO([("failed", 1)], write_queue_depth)
+            self.submodules += queue, done
+            self.comb += write_striper.sources[i].connect(queue.sink)
+            dones.append(done)
+
+            # Ranges of the writes in the queue: overlapping reads are held until they are issued.
+            ranges_sector = [Signal(48) for k in range(write_queue_depth)]
+            ranges_count  = [Signal(16) for k in range(write_queue_depth)]
+            ranges_valid  = Signal(write_queue_depth)
+            ranges_wr     = Signal(max=max(write_queue_depth, 2))
+            ranges_rd     = Signal(max=max(write_queue_depth, 2))
+            ranges_push   = Signal()
+            ranges_pop    = Signal()
+            read_hold     = Signal()
+            self.comb += [
+                ranges_push.eq(queue.sink.valid & queue.sink.ready & queue.sink.last),
+                read_hold.eq(reads[i].read & reduce(or_, [ranges_valid[k] &
+                    (reads[i].sector < (ranges_sector[k] + ranges_count[k])) &
+                    (ranges_sector[k] < (reads[i].sector + reads[i].count))
+                    for k in range(write_queue_depth)]))
+            ]
+            self.sync += [
+                If(ranges_push,
+                    ranges_wr.eq(Mux(ranges_wr == (write_queue_depth - 1), 0, ranges_wr + 1))
+                ),
+                If(ranges_pop,
+                    ranges_rd.eq(Mux(ranges_rd == (write_queue_depth - 1), 0, ranges_rd + 1))
+                )
+            ]
+            for k in range(write_queue_depth):
+                self.sync += \
+                    If(ranges_push & (ranges_wr == k),
+                        ranges_sector[k].eq(queue.sink.sector),
+                        ranges_count[k].eq(queue.sink.count),
+                        ranges_valid[k].eq(1)
+                    ).Elif(ranges_pop & (ranges_rd == k),
+                        ranges_valid[k].eq(0)
+                    )
+
+            # One command at a time per controller, reads have priority over queued writes.
+            busy = Signal()
+            self.sync += \
+                If(ctrl_sources[i].valid & ctrl_sources[i].ready & ctrl_sources[i].last,
+                    busy.eq(1)
+                ).Elif(ctrl_sinks[i].valid & ctrl_sinks[i].ready & ctrl_sinks[i].end,
+                    busy.eq(0)
+                )
+
+            fsm = FSM(reset_state="IDLE")
+            self.submodules += fsm
+            fsm.act("IDLE",
+                If(~busy,
+                    If(reads[i].valid & ~read_hold,
+                        reads[i].connect(ctrl_sources[i])
+                    ).Elif(queue.source.valid,
+                        NextState("WRITE")
+                    )
+                )
+            )
+            fsm.act("WRITE",
+                queue.source.connect(ctrl_sources[i]),
+                If(ctrl_sources[i].valid & ctrl_sources[i].ready & ctrl_sources[i].last,
+                    ranges_pop.eq(1),
+                    NextState("IDLE")
+                )
+            )
+
+            # Responses: queued commands to the done queue, reads to the port.
+            queued = Signal()
+            queueds.append(queued)
+            self.sync += \
+                If(ctrl_sources[i].valid & ctrl_sources[i].ready & ctrl_sources[i].last,
+                    queued.eq(fsm.ongoing("WRITE"))
+                )
+            self.comb += [
+                If(queued,
+                    done.sink.valid.eq(ctrl_sinks[i].valid & ctrl_sinks[i].end),
+                    done.sink.failed.eq(ctrl_sinks[i].failed),
+                    ctrl_sinks[i].ready.eq(done.sink.ready | ~ctrl_sinks[i].end)
+                )
+            ]
+
+        # Write responses: once completed on all the controllers.
+        write_done = Signal()
+        self.comb += write_done.eq(ports.source.valid & reduce(and_, [d.source.valid for d in dones]))
+        for i in range(n):
+            self.comb += [
+                If(write_done & (ports.source.port == i),
+                    sources[i].valid.eq(1),
+                    sources[i].last.eq(1),
+                    sources[i].write.eq(ports.source.write),
+                    sources[i].end.eq(1),
+                    sources[i].failed.eq(reduce(or_, [d.source.failed for d in dones])),
+                    If(sources[i].ready,
+                        ports.source.ready.eq(1),
+                        [d.source.ready.eq(1) for d in dones]
+                    )
+                ).Elif(~queueds[i],
+                    ctrl_sinks[i].connect(sources[i])
+                )
+            ]
+
+
 class LiteSATAMirroring(Module):
     """SATA Mirroring
 
@@ -284,7 +651,7 @@ class LiteSATAMirroring(Module):
         portX <----> controllerX
         portN <----> controllerN
 
-    Writes are mirrored on each controller:
+    Writes (and trim, flush and set features commands) are mirrored on each controller:
                    (port0 write)           |            (portN write)
         port0 ----------+----> controller0 | port0 (stalled) +-----> controller0
         portX (stalled) +----> controllerX | portX (stalled) +-----> controllerX
@@ -300,22 +667,389 @@ class LiteSATAMirroring(Module):
         - total reads throughput = N x controller's throughput
 
     Can be used for data redundancy and/or to increase total reads speed.
+
+    With with_write_queues, writes are instead buffered in a queue per controller and executed
+    independently on each controller: a write no longer stalls the reads of the other ports (see
+    LiteSATAMirroringWriteQueues): write_queue_sectors sets the size of the queues and
+    write_queue_depth the maximum number of queued writes.
     """
-    def __init__(self, controllers):
+    def __init__(self, controllers, with_write_queues=False, write_queue_sectors=16,
+        write_queue_depth=4):
         n  = len(controllers)
         dw = len(controllers[0].sink.data)
         self.ports = [LiteSATAUserPort(dw) for i in range(n)]
 
         # # #
 
-        self.submodules.ctrl = LiteSATAMirroringCtrl(n)
-        self.submodules.tx   = LiteSATAMirroringTX(n, dw, self.ctrl)
-        self.submodules.rx   = LiteSATAMirroringRX(n, dw, self.ctrl)
-        for i in range(n):
+        if with_write_queues:
+            self.submodules.queues = LiteSATAMirroringWriteQueues(n, dw,
+                write_queue_sectors = write_queue_sectors,
+                write_queue_depth   = write_queue_depth)
+            for i in range(n):
+                self.comb += [
+                    self.ports[i].sink.connect(self.queues.sinks[i]),
+                    self.queues.ctrl_sources[i].connect(controllers[i].sink),
+
+                    controllers[i].source.connect(self.queues.ctrl_sinks[i]),
+                    self.queues.sources[i].connect(self.ports[i].source)
+                ]
+        else:
+            self.submodules.ctrl = LiteSATAMirroringCtrl(n)
+            self.submodules.tx   = LiteSATAMirroringTX(n, dw, self.ctrl)
+            self.submodules.rx   = LiteSATAMirroringRX(n, dw, self.ctrl)
+            for i in range(n):
+                self.comb += [
+                    self.ports[i].sink.connect(self.tx.sinks[i]),
+                    self.tx.sources[i].connect(controllers[i].sink),
+
+                    controllers[i].source.connect(self.rx.sinks[i]),
+                    self.rx.sources[i].connect(self.ports[i].source)
+                ]
+
+# LiteSATA Mirrored Volume -------------------------------------------------------------------------
+
+class LiteSATAMirroredVolume(Module):
+    """SATA Mirrored Volume
+
+    The mirrored volume handles N controllers holding the same data and provides a single port
+    (use a crossbar to get several ports):
+                 +----> controller0 (dw)
+    port (dw) <--+----> controllerX (dw)
+                 +----> controllerN (dw)
+
+    Writes (and trim, flush and set features commands) are mirrored on each healthy controller
+    (through LiteSATAStripingTX in mirroring_mode) once all of them are idle, a single combined
+    response is presented. Reads are split in chunks of stripe_sectors sectors, each chunk is
+    dispatched to an idle healthy controller (round-robin preference): a single reader then gets
+    the throughput of all the mirrors. Responses and read data are merged back in order and a
+    single end/failed response is presented per command.
+
+    healthy can be used to exclude a controller from reads and writes (degraded mode).
+
+    Characteristics:
+        - port's visible capacity = controller's visible capacity
+        - writes throughput = (slowest) controller's throughput
+        - reads throughput = N x controller's throughput (for transfers > N x stripe_sectors)
+
+    Parameters
+    ----------
+    controllers : list
+        Controllers.
+    stripe_sectors : int
+        Reads chunk size in sectors (power of 2).
+    """
+    def __init__(self, controllers, stripe_sectors=64):
+        n  = len(controllers)
+        dw = len(controllers[0].sink.data)
+        self.sink    = sink   = stream.Endpoint(command_tx_description(dw))
+        self.source  = source = stream.Endpoint(command_rx_description(dw))
+        self.healthy = Signal(n, reset=2**n-1)
+
+        # # #
+
+        stripe_bits = log2_int(stripe_sectors)
+
+        is_read     = Signal()
+        is_identify = Signal()
+        sector      = Signal(48)
+        remaining   = Signal(16)
+        offset      = Signal(stripe_bits)
+        count       = Signal(16)
+        last_cmd    = Signal()
+        self.comb += [
+            offset.eq(sector[:stripe_bits]),
+            last_cmd.eq((remaining <= (stripe_sectors - offset)) | is_identify),
+            count.eq(Mux(last_cmd, remaining, stripe_sectors - offset))
+        ]
+
+        # Controllers' busy flags (one non-queued command per controller).
+        busy     = Signal(n)
+        busy_set = Signal(n)
+        busy_clr = Signal(n)
+        self.sync += busy.eq((busy | busy_set) & ~busy_clr)
+
+        # Reads dispatch: idle healthy controller, round-robin preference.
+        free  = Signal(n)
+        rr    = Signal(max=max(n, 2))
+        drive = Signal(max=max(n, 2))
+        self.comb += free.eq(~busy & self.healthy)
+        for i in reversed(range(n)):
+            self.comb += If(free[i], drive.eq(i))
+        self.comb += If((free >> rr)[0], drive.eq(rr))
+
+        # Order of the sub-commands (controllers' mask, mirrored, write, last) for the merge of the
+        # responses.
+        order = stream.SyncFIFO([("mask", n), ("mirrored", 1), ("write", 1)], n)
+        self.submodules += order
+
+        # Reads sub-commands
+        cmd = stream.Endpoint(command_tx_description(dw))
+        self.comb += [
+            cmd.read.eq(is_read),
+            cmd.identify.eq(is_identify),
+            cmd.sector.eq(sector),
+            cmd.count.eq(count),
+            cmd.last.eq(1)
+        ]
+
+        # Writes
+        writing       = Signal()
+        write_striper = LiteSATAStripingTX(n, dw, mirroring_mode=True)
+        self.submodules += write_striper
+
+        for i, controller in enumerate(controllers):
             self.comb += [
-                self.ports[i].sink.connect(self.tx.sinks[i]),
-                self.tx.sources[i].connect(controllers[i].sink),
+                If(writing,
+                    If(self.healthy[i],
+                        write_striper.sources[i].connect(controller.sink)
+                    ).Else(
+                        write_striper.sources[i].ready.eq(1)
+                    )
+                ).Elif(drive == i,
+                    cmd.connect(controller.sink)
+                )
+            ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            If(sink.valid,
+                If(~(sink.read | sink.identify),
+                    NextState("SEND_WRITE")
+                ).Else(
+                    sink.ready.eq(1),
+                    NextValue(is_read,     sink.read),
+                    NextValue(is_identify, sink.identify),
+                    NextValue(sector,      sink.sector),
+                    NextValue(remaining,   sink.count),
+                    NextState("SEND_READ")
+                )
+            )
+        )
+        fsm.act("SEND_WRITE",
+            If(((busy & self.healthy) == 0) & order.sink.ready,
+                writing.eq(1),
+                sink.connect(write_striper.sink),
+                If(sink.valid & sink.ready & sink.last,
+                    order.sink.valid.eq(1),
+                    order.sink.mask.eq(self.healthy),
+                    order.sink.mirrored.eq(1),
+                    order.sink.write.eq(sink.write | sink.trim),
+                    order.sink.last.eq(1),
+                    busy_set.eq(self.healthy),
+                    NextState("IDLE")
+                )
+            )
+        )
+        fsm.act("SEND_READ",
+            cmd.valid.eq((free != 0) & order.sink.ready),
+            If(cmd.valid & cmd.ready,
+                order.sink.valid.eq(1),
+                order.sink.mask.eq(1 << drive),
+                order.sink.last.eq(last_cmd),
+                busy_set.eq(1 << drive),
+                NextValue(rr, Mux(drive == (n - 1), 0, drive + 1)),
+                NextValue(sector,    sector    + count),
+                NextValue(remaining, remaining - count),
+                If(last_cmd,
+                    NextState("IDLE")
+                )
+            )
+        )
+
+        # Responses merge: intermediate ends are not forwarded, failures are accumulated.
+        failed = Signal()
+        got    = Signal(n)
+        resp   = stream.Endpoint(command_rx_description(dw))
+        for i, controller in enumerate(controllers):
+            self.comb += [
+                If(order.source.valid & order.source.mask[i],
+                    If(order.source.mirrored,
+                        # Mirrored commands: collect the responses of all the mirrors.
+                        controller.source.ready.eq(~got[i])
+                    ).Else(
+                        controller.source.connect(resp)
+                    )
+                )
+            ]
+        self.sync += \
+            If(order.source.valid & order.source.mirrored,
+                If(order.source.ready,
+                    got.eq(0),
+                    failed.eq(0)
+                ).Else(
+                    got.eq(got | Cat(*[c.source.valid & c.source.ready for c in controllers])),
+                    failed.eq(failed | reduce(or_, [c.source.valid & c.source.ready & c.source.failed
+                        for c in controllers]))
+                )
+            ).Elif(resp.valid & resp.ready & resp.end,
+                failed.eq(~order.source.last & (failed | resp.failed))
+            )
+        self.comb += [
+            If(order.source.valid & order.source.mirrored,
+                source.valid.eq(got == order.source.mask),
+                source.last.eq(1),
+                source.write.eq(order.source.write),
+                source.end.eq(1),
+                source.failed.eq(failed),
+                If(source.valid & source.ready,
+                    order.source.ready.eq(1),
+                    busy_clr.eq(order.source.mask)
+                )
+            ).Else(
+                resp.connect(source, omit={"valid", "ready", "end", "failed"}),
+                source.valid.eq(resp.valid & (~resp.end | order.source.last)),
+                source.end.eq(resp.end),
+                source.failed.eq(resp.failed | (resp.end & failed)),
+                resp.ready.eq(source.ready | (resp.end & ~order.source.last)),
+                If(resp.valid & resp.ready & resp.end,
+                    order.source.ready.eq(1),
+                    busy_clr.eq(order.source.mask)
+                )
+            )
+        ]
+
+# LiteSATA RAID5 -----------------------------------------------------------------------------------
+
+class LiteSATARAID5(Module):
+    """SATA RAID5
+
+    Segment data on N-1 controllers and store the XOR parity on the remaining controller:
+                         +----> controller0 (dw)
+    port ((N-1)*dw) <----+----> controllerX (dw)
+                         +----> controllerN (dw)
+
+    As for striping, each port's word is split in N-1 data words written at the same position on
+    N-1 controllers and the parity word (XOR of the data words) is computed on the fly and written
+    on the last one. Parity placement rotates every stripe_sectors sectors: for chunk C (port's
+    sector >> log2(stripe_sectors)), parity is on controller C % N and the data words on the other
+    controllers (in order). Every write is a full-stripe write: parity never has to be read back
+    (no read-modify-write).
+
+    healthy can be used to exclude a controller (degraded mode): writes still compute the full
+    parity, reads reconstruct the data words of the excluded controller from the other ones.
+
+    Characteristics:
+        - port's visible capacity = (N-1) x controller's visible capacity
+        - port's throughput = (N-1) x (slowest) controller's throughput
+        - survives the loss of one controller
+
+    Parameters
+    ----------
+    controllers : list
+        Controllers (N >= 3).
+    stripe_sectors : int
+        Parity rotation period in sectors (power of 2).
+    """
+    def __init__(self, controllers, stripe_sectors=64):
+        n  = len(controllers)
+        dw = len(controllers[0].sink.data)
+        if n < 3:
+            raise ValueError("RAID5 requires at least 3 controllers.")
+        self.sink    = sink   = stream.Endpoint(command_tx_description(dw*(n-1)))
+        self.source  = source = stream.Endpoint(command_rx_description(dw*(n-1)))
+        self.healthy = Signal(n, reset=2**n-1)
+
+        # # #
+
+        stripe_bits      = log2_int(stripe_sectors)
+        words_per_sector = logical_sector_size*8//dw
+        chunk_words      = stripe_sectors*words_per_sector
+
+        # Parity rotation: parity controller / word offset in the current chunk.
+        parity = Signal(max=n)
+        word   = Signal(max=chunk_words)
+        word_advance = [
+            If(word == (chunk_words - 1),
+                NextValue(word, 0),
+                NextValue(parity, Mux(parity == (n - 1), 0, parity + 1))
+            ).Else(
+                NextValue(word, word + 1)
+            )
+        ]
+
+        # Parity controller of the first chunk (chunk % n, computed bit per bit).
+        chunk     = Signal(48 - stripe_bits)
+        chunk_bit = Signal(max=len(chunk) + 1)
+        remainder = Signal(bits_for(2*n - 1))
+        self.comb += remainder.eq(Cat(chunk[-1], parity))
 
-                controllers[i].source.connect(self.rx.sinks[i]),
-                self.rx.sources[i].connect(self.ports[i].source)
+        # Writes: data words + parity to the controllers.
+        mapped  = stream.Endpoint(command_tx_description(dw*n))
+        striper = LiteSATAStripingTX(n, dw)
+        self.submodules += striper
+        self.comb += mapped.connect(striper.sink)
+
+        slices      = [sink.data[k*dw:(k+1)*dw] for k in range(n-1)]
+        parity_data = reduce(xor, slices)
+        for i, controller in enumerate(controllers):
+            cases = {}
+            for p in range(n):
+                cases[p] = mapped.data[i*dw:(i+1)*dw].eq(parity_data if i == p else slices[i if i < p else i-1])
+            self.comb += [
+                Case(parity, cases),
+                If(self.healthy[i],
+                    striper.sources[i].connect(controller.sink)
+                ).Else(
+                    striper.sources[i].ready.eq(1)
+                )
             ]
+
+        # Reads: combine the responses of the healthy controllers, reconstruct the missing words.
+        resp = stream.Endpoint(command_rx_description(dw*n))
+        for i, controller in reversed(list(enumerate(controllers))):
+            self.comb += If(self.healthy[i],
+                controller.source.connect(resp, omit={"valid", "ready", "data", "failed"})
+            )
+        rebuilt = reduce(xor, [Mux(self.healthy[i], c.source.data, 0) for i, c in enumerate(controllers)])
+        self.comb += [
+            resp.valid.eq(reduce(and_, [c.source.valid | ~self.healthy[i] for i, c in enumerate(controllers)])),
+            resp.failed.eq(reduce(or_, [c.source.failed & self.healthy[i] for i, c in enumerate(controllers)])),
+            [c.source.ready.eq((resp.valid & resp.ready) | ~self.healthy[i]) for i, c in enumerate(controllers)],
+            resp.data.eq(Cat(*[Mux(self.healthy[i], c.source.data, rebuilt) for i, c in enumerate(controllers)])),
+            resp.connect(source, omit={"data"})
+        ]
+        cases = {}
+        for p in range(n):
+            cases[p] = [source.data[k*dw:(k+1)*dw].eq(resp.data[(k if k < p else k+1)*dw:][:dw])
+                for k in range(n-1)]
+        self.comb += Case(parity, cases)
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            If(sink.valid,
+                NextValue(chunk,     sink.sector[stripe_bits:]),
+                NextValue(chunk_bit, len(chunk)),
+                NextValue(parity,    0),
+                NextValue(word,      (sink.sector & (stripe_sectors - 1))*words_per_sector),
+                NextState("MAP")
+            )
+        )
+        fsm.act("MAP",
+            NextValue(parity,    Mux(remainder >= n, remainder - n, remainder)),
+            NextValue(chunk,     chunk << 1),
+            NextValue(chunk_bit, chunk_bit - 1),
+            If(chunk_bit == 1,
+                NextState("SEND")
+            )
+        )
+        fsm.act("SEND",
+            sink.connect(mapped, omit={"data"}),
+            If(mapped.valid & mapped.ready,
+                If(sink.write,
+                    word_advance
+                ),
+                If(mapped.last,
+                    NextState("RECEIVE")
+                )
+            )
+        )
+        fsm.act("RECEIVE",
+            If(source.valid & source.ready,
+                If(source.read & ~source.end,
+                    word_advance
+                ),
+                If(source.last & source.end,
+                    NextState("IDLE")
+                )
+            )
+        )
@@ -0,0 +1,158 @@
+#
+# This file is part of LiteSATA.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+from litesata.common import *
+
+# LiteSATASplitter ---------------------------------------------------------------------------------
+
+class LiteSATASplitter(Module):
+    """SATA transfer splitter
+
+    Accept commands with a 32-bit sector count and split them into READ/WRITE DMA EXT commands of
+    up to max_count sectors on the port (core or user port).
+
+    The next command is only issued once the port reports the end of the previous one (commands
+    of a transfer are serialized, ie throughput is limited by the per-command latency of the port
+    when max_count is small): the intermediate responses are not forwarded and a single end/failed
+    response is presented per transfer. The transfer is aborted on the first failed command
+    (remaining write data is then discarded).
+
+    Read/write transfers of 0 sectors (which ATA would interpret as 65536 sectors) are not issued
+    on the port and get a failed response (write data is discarded).
+
+    Other commands (identify, trim, flush, set features) are forwarded unchanged to the port, with
+    their data and response.
+
+    Parameters
+    ----------
+    port : in
+        Port (sink/source) the commands are issued on.
+    max_count : int
+        Maximum number of sectors per command.
+    """
+    def __init__(self, port, max_count=2**16-1):
+        dw = len(port.sink.data)
+        self.sink   = sink   = stream.Endpoint(command_tx_description(dw, count_width=32))
+        self.source = source = stream.Endpoint(command_rx_description(dw))
+
+        # # #
+
+        words_per_sector = logical_sector_size*8//dw
+
+        is_write   = Signal()
+        is_read    = Signal()
+        sector     = Signal(48)
+        remaining  = Signal(32)
+        count      = Signal(max=max_count + 1)
+        last_cmd   = Signal()
+        words      = Signal(max=max_count*words_per_sector)
+        words_last = Signal()
+
+        self.comb += [
+            last_cmd.eq(remaining <= max_count),
+            count.eq(Mux(last_cmd, remaining, max_count)),
+            words_last.eq(words == (count*words_per_sector - 1))
+        ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            NextValue(words, 0),
+            If(sink.valid,
+                NextValue(is_write,  sink.write),
+                NextValue(is_read,   sink.read),
+                NextValue(sector,    sink.sector),
+                NextValue(remaining, sink.count),
+                If(~(sink.write | sink.read),
+                    NextState("FORWARD")
+                ).Elif(sink.count == 0,
+                    NextState("REJECT")
+                ).Else(
+                    # Write data is consumed with the commands.
+                    sink.ready.eq(~sink.write),
+                    NextState("SEND_CMD")
+                )
+            )
+        )
+        fsm.act("REJECT",
+            sink.ready.eq(1),
+            If(sink.valid & (sink.last | ~is_write),
+                NextState("PRESENT_FAILED_RESPONSE")
+            )
+        )
+        fsm.act("PRESENT_FAILED_RESPONSE",
+            source.valid.eq(1),
+            source.last.eq(1),
+            source.write.eq(is_write),
+            source.read.eq(is_read),
+            source.end.eq(1),
+            source.failed.eq(1),
+            If(source.ready,
+                NextState("IDLE")
+            )
+        )
+        fsm.act("FORWARD",
+            sink.connect(port.sink),
+            If(sink.valid & sink.ready & sink.last,
+                NextState("RESPONSE")
+            )
+        )
+        fsm.act("RESPONSE",
+            port.source.connect(source),
+            If(port.source.valid & port.source.ready & port.source.last & port.source.end,
+                NextState("IDLE")
+            )
+        )
+        fsm.act("SEND_CMD",
+            port.sink.write.eq(is_write),
+            port.sink.read.eq(is_read),
+            port.sink.sector.eq(sector),
+            port.sink.count.eq(count),
+            port.sink.data.eq(sink.data),
+            If(is_write,
+                port.sink.valid.eq(sink.valid),
+                port.sink.last.eq(words_last | sink.last),
+                sink.ready.eq(port.sink.ready),
+                If(port.sink.valid & port.sink.ready,
+                    NextValue(words, words + 1),
+                    If(port.sink.last,
+                        NextValue(words, 0),
+                        NextState("WAIT_RESPONSE")
+                    )
+                )
+            ).Else(
+                port.sink.valid.eq(1),
+                port.sink.last.eq(1),
+                If(port.sink.ready,
+                    NextState("WAIT_RESPONSE")
+                )
+            )
+        )
+        fsm.act("WAIT_RESPONSE",
+            port.source.connect(source),
+            If(port.source.valid & port.source.end,
+                If(last_cmd | port.source.failed,
+                    If(source.ready,
+                        If(last_cmd | ~is_write,
+                            NextState("IDLE")
+                        ).Else(
+                            NextState("FLUSH")
+                        )
+                    )
+                ).Else(
+                    # Intermediate response: not forwarded, issue next command.
+                    source.valid.eq(0),
+                    port.source.ready.eq(1),
+                    NextValue(sector,    sector    + count),
+                    NextValue(remaining, remaining - count),
+                    NextState("SEND_CMD")
+                )
+            )
+        )
+        fsm.act("FLUSH",
+            sink.ready.eq(1),
+            If(sink.valid & sink.last,
+                NextState("IDLE")
+            )
+        )
@@ -0,0 +1,499 @@
+#
+# This file is part of LiteSATA.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+from migen import *
+
+from litex.soc.interconnect.csr import *
+from litex.soc.interconnect import stream
+from litex.soc.interconnect import wishbone
+
+from litex.soc.cores.dma import WishboneDMAReader, WishboneDMAWriter
+
+from litesata.common import logical_sector_size
+
+# SATA Stream Recorder -----------------------------------------------------------------------------
+
+class LiteSATAStreamRecorder(Module, AutoCSR):
+    """Stream Recorder
+
+    Record a stream to the SATA drive. The stream is written through DMA to a ring buffer in
+    memory (ring_size bytes at ring_base, ex in DRAM) that absorbs the latency spikes of the drive,
+    and the ring is written to the drive with WRITE DMA EXT commands of max_count sectors on
+    consecutive sectors of the [sector_start, sector_start + sector_count) window (wrapping around
+    at its end).
+
+    Recording is started by setting enable (the window and counters are then reset, once the
+    command in flight, if any, is completed) and stopped by clearing it: the complete sectors still
+    in the ring are then written (the last partial sector is not). The stream is never stalled by the drive: when the ring is full, data is
+    dropped and overflow is set. high_watermark reports the maximum ring level (bytes) and
+    bytes_written the number of bytes written to the drive.
+
+    Memory bus width can be any multiple of the user port width (up to 256 bits).
+    """
+    def __init__(self, user_port, bus, ring_base, ring_size, max_count=128, fifo_depth=512):
+        self.user_port = user_port
+        self.bus       = bus
+        dw             = user_port.dw
+        assert bus.data_width%dw == 0
+        assert bus.data_width <= 256
+        assert ring_size%logical_sector_size == 0
+        self.sink = sink = stream.Endpoint([("data", dw)])
+
+        self.enable         = CSRStorage()
+        self.sector_start   = CSRStorage(48)
+        self.sector_count   = CSRStorage(48)
+        self.overflow       = CSRStatus()
+        self.high_watermark = CSRStatus(bits_for(ring_size))
+        self.bytes_written  = CSRStatus(64)
+        self.errors         = CSRStatus(32)
+
+        # # #
+
+        shift            = log2_int(bus.data_width//8)
+        ring_words       = ring_size >> shift
+        sector_words     = logical_sector_size >> shift
+        sector_bits      = log2_int(sector_words)
+        words_per_sector = logical_sector_size*8//dw
+
+        # Start (taken between two commands).
+        start         = Signal()
+        start_request = Signal()
+        self.sync += \
+            If(self.enable.re & self.enable.storage,
+                start_request.eq(1)
+            ).Elif(start,
+                start_request.eq(0)
+            )
+
+        # DMAs (shared bus)
+        wr_bus = wishbone.Interface(data_width=bus.data_width, adr_width=bus.adr_width)
+        rd_bus = wishbone.Interface(data_width=bus.data_width, adr_width=bus.adr_width)
+        self.submodules.arbiter = wishbone.Arbiter([wr_bus, rd_bus], bus)
+        self.submodules.dma_wr  = dma_wr = WishboneDMAWriter(wr_bus, with_csr=False, endianness="big")
+        self.submodules.dma_rd  = dma_rd = WishboneDMAReader(rd_bus, with_csr=False, endianness="big")
+
+        # Ring pointers / level (in bus words).
+        wr_ptr = Signal(max=ring_words)
+        rd_ptr = Signal(max=ring_words)
+        level  = Signal(max=ring_words + 1)
+        push   = Signal()
+        pop    = Signal()
+        self.comb += [
+            push.eq(dma_wr.sink.valid & dma_wr.sink.ready),
+            pop.eq(dma_rd.sink.valid & dma_rd.sink.ready)
+        ]
+        self.sync += [
+            If(start,
+                wr_ptr.eq(0),
+                rd_ptr.eq(0),
+                level.eq(0)
+            ).Else(
+                If(push, wr_ptr.eq(Mux(wr_ptr == (ring_words - 1), 0, wr_ptr + 1))),
+                If(pop,  rd_ptr.eq(Mux(rd_ptr == (ring_words - 1), 0, rd_ptr + 1))),
+                level.eq(level + push - pop)
+            ),
+            If(start,
+                self.high_watermark.status.eq(0)
+            ).Elif(level > (self.high_watermark.status >> shift),
+                self.high_watermark.status.eq(level << shift)
+            )
+        ]
+
+        # Stream -> Ring (data is dropped when the ring is full).
+        self.submodules.up_converter = up_converter = stream.Converter(dw, bus.data_width)
+        self.comb += [
+            sink.connect(up_converter.sink, omit={"valid", "last"}),
+            up_converter.sink.valid.eq(sink.valid & self.enable.storage),
+            If(~self.enable.storage, sink.ready.eq(1)),
+            dma_wr.sink.valid.eq(up_converter.source.valid & (level != ring_words)),
+            dma_wr.sink.address.eq((ring_base >> shift) + wr_ptr),
+            dma_wr.sink.data.eq(up_converter.source.data),
+            up_converter.source.ready.eq(dma_wr.sink.ready | (level == ring_words))
+        ]
+        self.sync += \
+            If(start,
+                self.overflow.status.eq(0)
+            ).Elif(up_converter.source.valid & (level == ring_words),
+                self.overflow.status.eq(1)
+            )
+
+        # Ring -> Drive
+        sector    = Signal(48)
+        remaining = Signal(48) # Sectors to the end of the window.
+        count     = Signal(16)
+        available = Signal(len(level)) # Complete sectors in the ring.
+        cmd_count = Signal(16)
+        fetched   = Signal(max=ring_words + 1)
+        words     = Signal(max=ring_words + 1)
+        ndata     = Signal(16 + log2_int(words_per_sector) + 1)
+        data      = Signal(len(ndata))
+        data_last = Signal()
+        failed    = Signal()
+        self.comb += [
+            available.eq(level >> sector_bits),
+            count.eq(max_count),
+            If(available < max_count, count.eq(available)),
+            If((remaining < max_count) & (remaining < available), count.eq(remaining)),
+            words.eq(cmd_count << sector_bits),
+            data_last.eq(data == (ndata - 1))
+        ]
+
+        # Converter / Prefetch FIFO
+        self.submodules.down_converter = down_converter = ResetInserter()(stream.Converter(bus.data_width, dw))
+        self.submodules.fifo = fifo = ResetInserter()(stream.SyncFIFO([("data", dw)], fifo_depth))
+        self.comb += [
+            dma_rd.source.connect(down_converter.sink, omit={"last"}),
+            down_converter.source.connect(fifo.sink, omit={"last"})
+        ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        self.comb += [
+            start.eq(fsm.ongoing("IDLE") & ((self.enable.re & self.enable.storage) | start_request)),
+            dma_rd.sink.valid.eq(~fsm.ongoing("IDLE") & (fetched != words)),
+            dma_rd.sink.address.eq((ring_base >> shift) + rd_ptr)
+        ]
+        self.sync += \
+            If(fsm.ongoing("IDLE"),
+                fetched.eq(0)
+            ).Elif(pop,
+                fetched.eq(fetched + 1)
+            )
+        fsm.act("IDLE",
+            down_converter.reset.eq(1),
+            fifo.reset.eq(1),
+            If(start,
+                NextValue(sector,    self.sector_start.storage),
+                NextValue(remaining, self.sector_count.storage),
+                NextValue(self.bytes_written.status, 0),
+                NextValue(self.errors.status, 0)
+            ).Elif((count != 0) & ((count == max_count) | (count == remaining) | ~self.enable.storage),
+                NextValue(cmd_count, count),
+                NextValue(ndata, count*words_per_sector),
+                NextValue(data,  0),
+                NextState("PREFETCH")
+            )
+        )
+        fsm.act("PREFETCH",
+            If((fifo.level == fifo_depth) | (fifo.level == ndata),
+                NextState("SEND-CMD-AND-DATA")
+            )
+        )
+        fsm.act("SEND-CMD-AND-DATA",
+            user_port.sink.valid.eq(fifo.source.valid),
+            user_port.sink.last.eq(data_last),
+            user_port.sink.write.eq(1),
+            user_port.sink.sector.eq(sector),
+            user_port.sink.count.eq(cmd_count),
+            user_port.sink.data.eq(fifo.source.data),
+            fifo.source.ready.eq(user_port.sink.ready),
+            If(user_port.sink.valid & user_port.sink.ready,
+                NextValue(data, data + 1),
+                If(data_last,
+                    NextState("WAIT-RESPONSE")
+                )
+            ),
+            # Write aborted by the drive: discard the remaining data (if any).
+            If(user_port.source.valid & user_port.source.end,
+                NextValue(failed, 1),
+                If(user_port.sink.valid & user_port.sink.ready & data_last,
+                    NextState("NEXT")
+                ).Else(
+                    NextState("FLUSH")
+                )
+            )
+        )
+        fsm.act("FLUSH",
+            fifo.source.ready.eq(1),
+            If(fifo.source.valid,
+                NextValue(data, data + 1),
+                If(data_last,
+                    NextState("NEXT")
+                )
+            )
+        )
+        fsm.act("WAIT-RESPONSE",
+            If(user_port.source.valid & user_port.source.end,
+                NextValue(failed, user_port.source.failed),
+                NextState("NEXT")
+            )
+        )
+        fsm.act("NEXT",
+            NextValue(failed, 0),
+            If(failed,
+                NextValue(self.errors.status, self.errors.status + 1)
+            ).Else(
+                NextValue(self.bytes_written.status, self.bytes_written.status + cmd_count*logical_sector_size)
+            ),
+            # Next sectors, wrap around at the end of the window.
+            If(remaining == cmd_count,
+                NextValue(sector,    self.sector_start.storage),
+                NextValue(remaining, self.sector_count.storage)
+            ).Else(
+                NextValue(sector,    sector    + cmd_count),
+                NextValue(remaining, remaining - cmd_count)
+            ),
+            NextState("IDLE")
+        )
+        self.comb += user_port.source.ready.eq(1)
+
+# SATA Stream Player -------------------------------------------------------------------------------
+
+class LiteSATAStreamPlayer(Module, AutoCSR):
+    """Stream Player
+
+    Play sectors of the SATA drive to a stream. The [sector_start, sector_start + sector_count)
+    window is read ahead with READ DMA EXT commands of max_count sectors and written through DMA
+    to a ring buffer in memory (ring_size bytes at ring_base, ex in DRAM), the ring is then read
+    to the stream.
+
+    Playback is started by setting enable (once the command in flight, if any, is completed): the
+    stream is only presented once the ring is full (or holds the whole window), and commands are
+    then issued as soon as the ring has room for max_count sectors. Clearing enable stops issuing
+    commands (the ring is still played). Failed reads are retried up to max_retries times and
+    counted in errors: when a read still fails, the playback is aborted (aborted is set, the
+    remaining sectors are not read and the ring is still played).
+
+    The stream can be paced with period (minimum number of cycles between two words, 0 to
+    disable). underruns counts the times the stream was starved once playing (valid deasserted
+    while ready and data still to be played), bytes_read the number of bytes read from the drive
+    and done reports the end of the playback.
+
+    Memory bus width can be any multiple of the user port width (up to 256 bits).
+    """
+    def __init__(self, user_port, bus, ring_base, ring_size, max_count=128, fifo_depth=128,
+        max_retries=4):
+        self.user_port = user_port
+        self.bus       = bus
+        dw             = user_port.dw
+        assert bus.data_width%dw == 0
+        assert bus.data_width <= 256
+        assert ring_size%logical_sector_size == 0
+        assert ring_size >= max_count*logical_sector_size
+        self.source = source = stream.Endpoint([("data", dw)])
+
+        self.enable       = CSRStorage()
+        self.sector_start = CSRStorage(48)
+        self.sector_count = CSRStorage(48)
+        self.period       = CSRStorage(32)
+        self.done         = CSRStatus()
+        self.underruns    = CSRStatus(32)
+        self.bytes_read   = CSRStatus(64)
+        self.errors       = CSRStatus(32)
+        self.aborted      = CSRStatus()
+
+        # # #
+
+        shift        = log2_int(bus.data_width//8)
+        ring_words   = ring_size >> shift
+        sector_words = logical_sector_size >> shift
+        sector_bits  = log2_int(sector_words)
+
+        # Start (taken between two commands).
+        start         = Signal()
+        start_request = Signal()
+        self.sync += \
+            If(self.enable.re & self.enable.storage,
+                start_request.eq(1)
+            ).Elif(start,
+                start_request.eq(0)
+            )
+
+        # DMAs (shared bus)
+        wr_bus = wishbone.Interface(data_width=bus.data_width, adr_width=bus.adr_width)
+        rd_bus = wishbone.Interface(data_width=bus.data_width, adr_width=bus.adr_width)
+        self.submodules.arbiter = wishbone.Arbiter([wr_bus, rd_bus], bus)
+        self.submodules.dma_wr  = dma_wr = WishboneDMAWriter(wr_bus, with_csr=False, endianness="big")
+        self.submodules.dma_rd  = dma_rd = WishboneDMAReader(rd_bus, with_csr=False, endianness="big")
+
+        # Ring pointers (in bus words): space is not reserved by the commands, level is written by
+        # completed commands and not yet read.
+        wr_ptr    = Signal(max=ring_words)
+        wr_commit = Signal(max=ring_words)
+        rd_ptr    = Signal(max=ring_words)
+        space     = Signal(max=ring_words + 1, reset=ring_words)
+        level     = Signal(max=ring_words + 1)
+        count     = Signal(16)
+        cmd_count = Signal(16)
+        words     = Signal(max=ring_words + 1)
+        push      = Signal()
+        pop       = Signal()
+        reserve   = Signal() # Reserve count sectors in the ring.
+        commit    = Signal() # Command completed: make its data available.
+        rewind    = Signal() # Command failed: discard its data.
+        self.comb += [
+            push.eq(dma_wr.sink.valid & dma_wr.sink.ready),
+            pop.eq(dma_rd.sink.valid & dma_rd.sink.ready),
+            words.eq(cmd_count << sector_bits)
+        ]
+        self.sync += [
+            If(start,
+                wr_ptr.eq(0),
+                wr_commit.eq(0),
+                rd_ptr.eq(0),
+                space.eq(ring_words),
+                level.eq(0)
+            ).Else(
+                If(rewind,
+                    wr_ptr.eq(wr_commit)
+                ).Elif(push,
+                    wr_ptr.eq(Mux(wr_ptr == (ring_words - 1), 0, wr_ptr + 1))
+                ),
+                If(commit, wr_commit.eq(wr_ptr)),
+                If(pop, rd_ptr.eq(Mux(rd_ptr == (ring_words - 1), 0, rd_ptr + 1))),
+                space.eq(space - Mux(reserve, count << sector_bits, 0) + pop),
+                level.eq(level + Mux(commit, words, 0) - pop)
+            )
+        ]
+
+        # Drive -> Ring
+        self.submodules.fifo = fifo = stream.SyncFIFO([("data", dw)], fifo_depth)
+        self.submodules.up_converter = up_converter = ResetInserter()(stream.Converter(dw, bus.data_width))
+        self.comb += [
+            fifo.sink.valid.eq(user_port.source.valid & ~user_port.source.end),
+            fifo.sink.data.eq(user_port.source.data),
+            user_port.source.ready.eq(fifo.sink.ready | user_port.source.end),
+            fifo.source.connect(up_converter.sink, omit={"last"}),
+            dma_wr.sink.valid.eq(up_converter.source.valid),
+            dma_wr.sink.address.eq((ring_base >> shift) + wr_ptr),
+            dma_wr.sink.data.eq(up_converter.source.data),
+            up_converter.source.ready.eq(dma_wr.sink.ready)
+        ]
+
+        sector    = Signal(48)
+        remaining = Signal(48) # Sectors to be read.
+        pushed    = Signal(max=ring_words + 1)
+        failed    = Signal()
+        retries   = Signal(max=max_retries + 1)
+        started   = Signal()
+        finished  = Signal()
+        self.comb += [
+            count.eq(max_count),
+            If((space >> sector_bits) < max_count, count.eq(space >> sector_bits)),
+            If((remaining < max_count) & (remaining < (space >> sector_bits)), count.eq(remaining))
+        ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        self.comb += [
+            start.eq(fsm.ongoing("IDLE") & ((self.enable.re & self.enable.storage) | start_request)),
+            finished.eq(fsm.ongoing("IDLE") & (remaining == 0))
+        ]
+        self.sync += \
+            If(fsm.ongoing("SEND-CMD"),
+                pushed.eq(0)
+            ).Elif(push,
+                pushed.eq(pushed + 1)
+            )
+        fsm.act("IDLE",
+            up_converter.reset.eq(1),
+            If(start,
+                NextValue(sector,    self.sector_start.storage),
+                NextValue(remaining, self.sector_count.storage),
+                NextValue(started, 0),
+                NextValue(self.bytes_read.status, 0),
+                NextValue(self.errors.status, 0),
+                NextValue(self.aborted.status, 0)
+            ).Elif(self.enable.storage & (count != 0) & ((count == max_count) | (count == remaining)),
+                reserve.eq(1),
+                NextValue(cmd_count, count),
+                NextValue(retries, 0),
+                NextState("SEND-CMD")
+            ).Else(
+                # Ring full (or whole window read): start playing.
+                NextValue(started, 1)
+            )
+        )
+        fsm.act("SEND-CMD",
+            user_port.sink.valid.eq(1),
+            user_port.sink.last.eq(1),
+            user_port.sink.read.eq(1),
+            user_port.sink.sector.eq(sector),
+            user_port.sink.count.eq(cmd_count),
+            If(user_port.sink.ready,
+                NextState("RECEIVE-DATA")
+            )
+        )
+        fsm.act("RECEIVE-DATA",
+            If(user_port.source.valid & user_port.source.end,
+                NextValue(failed, user_port.source.failed),
+                NextState("WAIT-DMA")
+            )
+        )
+        fsm.act("WAIT-DMA",
+            If((pushed == words) | (failed & ~fifo.source.valid & ~up_converter.source.valid),
+                NextState("NEXT")
+            )
+        )
+        fsm.act("NEXT",
+            If(failed,
+                rewind.eq(1),
+                up_converter.reset.eq(1),
+                NextValue(self.errors.status, self.errors.status + 1),
+                If(retries == max_retries,
+                    # Abort the playback.
+                    NextValue(self.aborted.status, 1),
+                    NextValue(remaining, 0),
+                    NextState("IDLE")
+                ).Else(
+                    # Retry the command.
+                    NextValue(retries, retries + 1),
+                    NextState("SEND-CMD")
+                )
+            ).Else(
+                commit.eq(1),
+                NextValue(self.bytes_read.status, self.bytes_read.status + cmd_count*logical_sector_size),
+                NextValue(sector,    sector    + cmd_count),
+                NextValue(remaining, remaining - cmd_count),
+                NextState("IDLE")
+            )
+        )
+
+        # Ring -> Stream
+        self.submodules.down_converter = down_converter = stream.Converter(bus.data_width, dw)
+        self.comb += [
+            dma_rd.sink.valid.eq(started & (level != 0)),
+            dma_rd.sink.address.eq((ring_base >> shift) + rd_ptr),
+            dma_rd.source.connect(down_converter.sink, omit={"last"})
+        ]
+
+        # Pacing
+        timer = Signal(32)
+        tick  = Signal()
+        self.comb += [
+            tick.eq(timer == 0),
+            source.valid.eq(down_converter.source.valid & tick),
+            source.data.eq(down_converter.source.data),
+            down_converter.source.ready.eq(source.ready & tick)
+        ]
+        self.sync += \
+            If(source.valid & source.ready & (self.period.storage > 1),
+                timer.eq(self.period.storage - 1)
+            ).Elif(~tick,
+                timer.eq(timer - 1)
+            )
+
+        # Status / Underruns (counted from the first played word, the initial ring read latency
+        # is not an underrun).
+        playing    = Signal()
+        starving   = Signal()
+        starving_d = Signal()
+        self.comb += [
+            self.done.status.eq(finished & (level == 0) &
+                ~dma_rd.source.valid & ~down_converter.source.valid),
+            starving.eq(playing & tick & source.ready & ~down_converter.source.valid &
+                ((level != 0) | (self.enable.storage & ~finished)))
+        ]
+        self.sync += [
+            If(start,
+                playing.eq(0)
+            ).Elif(source.valid & source.ready,
+                playing.eq(1)
+            ),
+            starving_d.eq(starving),
+            If(start,
+                self.underruns.status.eq(0)
+            ).Elif(starving & ~starving_d,
+                self.underruns.status.eq(self.underruns.status + 1)
+            )
+        ]
@@ -0,0 +1,163 @@
+#
+# This file is part of LiteSATA.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+from litesata.common import *
+
+from litex.soc.interconnect.csr import *
+
+# LiteSATATrim -------------------------------------------------------------------------------------
+
+class LiteSATATrim(Module, AutoCSR):
+    """SATA TRIM
+
+    Discard the (sector, count) ranges presented on the sink with DATA SET MANAGEMENT (TRIM)
+    commands issued on a port (core or user port). Ranges are packed in 512-byte blocks of range
+    entries (64 per block, ranges larger than 65535 sectors use several entries) buffered in
+    block RAM, a command is issued when max_blocks blocks are filled or on the last range of the
+    sink (unused entries of the last block are zeroed).
+
+    commands counts the issued commands, errors the failed ones.
+
+    Parameters
+    ----------
+    port : in
+        Port (sink/source) the commands are issued on (32-bit or multiple of 64-bit).
+    max_blocks : int
+        Maximum number of range blocks per command.
+    """
+    def __init__(self, port, max_blocks=1, counter_width=32):
+        dw = len(port.sink.data)
+        self.sink = sink = stream.Endpoint([("sector", 48), ("count", 32)])
+
+        self.commands = CSRStatus(counter_width)
+        self.errors   = CSRStatus(counter_width)
+
+        # # #
+
+        max_entries     = max_blocks*dsm_entries_per_block
+        words_per_block = logical_sector_size*8//dw
+
+        # Entries buffer: row of max(dw, 64) bits (entries_per_row 64-bit entries, words_per_row
+        # port words).
+        row_width       = max(dw, 64)
+        entries_per_row = row_width//64
+        words_per_row   = row_width//dw
+        entries = Memory(row_width, max_entries//entries_per_row)
+        entries_wr = entries.get_port(write_capable=True, we_granularity=64)
+        entries_rd = entries.get_port(has_re=True)
+        self.specials += entries, entries_wr, entries_rd
+
+        # Entry of the range presented on the sink (ranges are split in entries of up to
+        # dsm_max_range_count sectors).
+        consumed = Signal(32)
+        sector   = Signal(48)
+        count    = Signal(32)
+        length   = Signal(16)
+        nentries = Signal(max=max_entries + 1)
+        entry_we = Signal()
+        self.comb += [
+            sector.eq(sink.sector + consumed),
+            count.eq(sink.count - consumed),
+            length.eq(dsm_max_range_count),
+            If(count < dsm_max_range_count, length.eq(count)),
+            entries_wr.adr.eq(nentries >> log2_int(entries_per_row)),
+            entries_wr.dat_w.eq(Replicate(Cat(sector, length), entries_per_row))
+        ]
+        if entries_per_row > 1:
+            self.comb += If(entry_we, entries_wr.we.eq(1 << nentries[:log2_int(entries_per_row)]))
+        else:
+            self.comb += entries_wr.we.eq(entry_we)
+
+        # Command: blocks, port words.
+        nblocks    = Signal(max=max_blocks + 1)
+        word       = Signal(max=max_blocks*words_per_block + 1)
+        total      = Signal(max=max_blocks*words_per_block + 1)
+        first      = Signal(max=max_entries + 1) # First entry of the word.
+        data_valid = Signal()
+        data_last  = Signal()
+        data_high  = Signal()
+        data_pad   = Signal(entries_per_row)
+        self.comb += [
+            total.eq(nblocks*words_per_block),
+            first.eq((word << log2_int(entries_per_row)) >> log2_int(words_per_row)),
+            entries_rd.adr.eq(word >> log2_int(words_per_row))
+        ]
+        data = Signal(dw)
+        if words_per_row > 1:
+            # 32-bit port: entries are sent in 2 words (low dword first).
+            self.comb += data.eq(Mux(data_pad[0], 0,
+                Mux(data_high, entries_rd.dat_r[32:], entries_rd.dat_r[:32])))
+        else:
+            self.comb += data.eq(Cat(*[Mux(data_pad[i], 0, entries_rd.dat_r[64*i:64*(i+1)])
+                for i in range(entries_per_row)]))
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            NextValue(nentries, 0),
+            If(sink.valid,
+                NextState("COLLECT")
+            )
+        )
+        fsm.act("COLLECT",
+            If(sink.valid,
+                If(count == 0,
+                    sink.ready.eq(1)
+                ).Else(
+                    entry_we.eq(1),
+                    NextValue(nentries, nentries + 1),
+                    If(count == length,
+                        sink.ready.eq(1),
+                        NextValue(consumed, 0)
+                    ).Else(
+                        NextValue(consumed, consumed + length)
+                    )
+                ),
+                # Buffer full or last range: issue the command.
+                If((sink.ready & sink.last) | (entry_we & (nentries == (max_entries - 1))),
+                    NextState("SEND")
+                )
+            )
+        )
+        fsm.act("SEND",
+            NextValue(nblocks, (nentries + dsm_entries_per_block - 1) >> log2_int(dsm_entries_per_block)),
+            NextValue(word, 0),
+            If(nentries == 0,
+                NextState("IDLE")
+            ).Else(
+                NextState("SEND-CMD-AND-DATA")
+            )
+        )
+        fsm.act("SEND-CMD-AND-DATA",
+            entries_rd.re.eq(~data_valid | port.sink.ready),
+            port.sink.valid.eq(data_valid),
+            port.sink.last.eq(data_last),
+            port.sink.trim.eq(1),
+            port.sink.sector.eq(0),
+            port.sink.count.eq(nblocks),
+            port.sink.data.eq(data),
+            If(entries_rd.re,
+                NextValue(data_valid, word != total),
+                NextValue(data_last,  word == (total - 1)),
+                NextValue(data_high,  word[0]),
+                NextValue(data_pad,   Cat(*[(first + i) >= nentries for i in range(entries_per_row)])),
+                If(word != total,
+                    NextValue(word, word + 1)
+                )
+            ),
+            If(port.sink.valid & port.sink.ready & port.sink.last,
+                NextValue(data_valid, 0),
+                NextState("WAIT-RESPONSE")
+            )
+        )
+        fsm.act("WAIT-RESPONSE",
+            port.source.ready.eq(1),
+            If(port.source.valid & port.source.last & port.source.end,
+                NextValue(self.commands.status, self.commands.status + 1),
+                If(port.source.failed,
+                    NextValue(self.errors.status, self.errors.status + 1)
+                ),
+                NextState("IDLE")
+            )
+        )
@@ -26,12 +26,29 @@ class CommandLayer(Module):
     def callback(self, fis):
         resp = None
         if isinstance(fis, FIS_REG_H2D):
-            if fis.command == regs["WRITE_DMA_EXT"]:
+            if not fis.c:
+                resp = self.hdd.device_control_callback(fis)
+            elif self.hdd.hang:
+                pass
+            elif fis.command == regs["WRITE_DMA_EXT"]:
                 resp = self.hdd.write_dma_callback(fis)
             elif fis.command == regs["READ_DMA_EXT"]:
                 resp = self.hdd.read_dma_callback(fis)
+            elif fis.command == regs["WRITE_FPDMA_QUEUED"]:
+                resp = self.hdd.write_fpdma_callback(fis)
+            elif fis.command == regs["READ_FPDMA_QUEUED"]:
+                resp = self.hdd.read_fpdma_callback(fis)
+            elif fis.command == regs["IDENTIFY_DEVICE"]:
+                resp = self.hdd.identify_device_callback(fis)
+            elif fis.command == regs["DATA_SET_MANAGEMENT"]:
+                resp = self.hdd.data_set_management_callback(fis)
+            elif fis.command == regs["FLUSH_CACHE_EXT"]:
+                resp = self.hdd.flush_cache_callback(fis)
+            elif fis.command == regs["SET_FEATURES"]:
+                resp = self.hdd.set_features_callback(fis)
         elif isinstance(fis, FIS_DATA):
-            resp = self.hdd.data_callback(fis)
+            if not self.hdd.hang:
+                resp = self.hdd.data_callback(fis)
 
         if resp is not None:
             for packet in resp:
@@ -5,6 +5,7 @@
 # SPDX-License-Identifier: BSD-2-Clause
 
 import math
+from array import array
 
 from litesata.common import *
 
@@ -21,10 +22,46 @@ def print_hdd(s, n=None):
 # HDD Mem Region -----------------------------------------------------------------------------------
 
 class HDDMemRegion:
-    def __init__(self, base, count, sector_size):
+    def __init__(self, base, count):
         self.base  = base
         self.count = count
-        self.data  = [0]*(count*sector_size//4)
+
+    def __contains__(self, sector):
+        return self.base <= sector < self.base + self.count
+
+# HDD Mem ------------------------------------------------------------------------------------------
+
+class HDDMem:
+    """Sparse HDD storage
+
+    Covers the full 48-bit LBA space: dwords are stored in fixed-size chunks that are only
+    materialized on first write, unwritten sectors read as 0.
+    """
+    def __init__(self, sector_size, chunk_sectors=64):
+        self.sector_size  = sector_size
+        self.chunk_dwords = chunk_sectors*sector_size//4
+        self.chunks       = {}
+
+    def write(self, offset, data):
+        i = 0
+        while i < len(data):
+            chunk, o = divmod(offset + i, self.chunk_dwords)
+            n = min(len(data) - i, self.chunk_dwords - o)
+            if chunk not in self.chunks:
+                self.chunks[chunk] = array("I", bytes(4*self.chunk_dwords))
+            self.chunks[chunk][o:o+n] = array("I", data[i:i+n])
+            i += n
+
+    def read(self, offset, length):
+        data = []
+        while len(data) < length:
+            chunk, o = divmod(offset + len(data), self.chunk_dwords)
+            n = min(length - len(data), self.chunk_dwords - o)
+            if chunk in self.chunks:
+                data += self.chunks[chunk][o:o+n].tolist()
+            else:
+                data += [0]*n
+        return data
 
 # HDD model ----------------------------------------------------------------------------------------
 
@@ -42,22 +79,45 @@ class HDD(Module):
         self.command.set_hdd(self)
 
         self.debug         = hdd_debug
-        self.mem           = None
+        self.mem           = HDDMem(logical_sector_size)
+        self.regions       = []
         self.wr_sector     = 0
         self.wr_end_sector = 0
+        self.wr_tag        = None
         self.rd_sector     = 0
         self.rx_end_sector = 0
+        self.trim_blocks   = 0
+        self.trim_data     = []
+        self.trimmed       = []
+        self.write_cache   = True
+        self.flushes       = 0
+
+        # Identify parameters.
+        self.sectors                  = 2**34
+        self.gens                     = 0b111
+        self.ncq_depth                = 32
+        self.logical_sector_words     = logical_sector_size//2
+        self.physical_sector_exponent = 3
+        self.trim_supported           = True
 
         self.reg_d2h_status       = 0
         self.data_error_injection = 0
         self.busy                 = 0
+        self.hang                 = 0
+        self.srst                 = 0
 
     def malloc(self, sector, count):
         if self.debug:
             s = "Allocating {n} sectors: {s} to {e}".format(n=count, s=sector, e=sector+count-1)
             s += " ({} KB)".format(count*logical_sector_size//1024)
             print_hdd(s, self.n)
-        self.mem = HDDMemRegion(sector, count, logical_sector_size)
+        assert 0 <= sector and sector + count <= 2**48
+        self.regions.append(HDDMemRegion(sector, count))
+
+    def check_allocated(self, sector, count):
+        for i in [sector, sector + count - 1]:
+            if not any(i in region for region in self.regions):
+                raise ValueError("Sector {} not allocated".format(i))
 
     def write(self, sector, data):
         n = math.ceil(dwords2sectors(len(data)))
@@ -67,9 +127,20 @@ class HDD(Module):
             else:
                 s = "{s} to {e}".format(s=sector, e=sector+n-1)
             print_hdd("Writing sector " + s, self.n)
-        for i in range(len(data)):
-            offset = sectors2dwords(sector)
-            self.mem.data[offset+i] = data[i]
+        self.check_allocated(sector, n)
+        self.mem.write(sectors2dwords(sector), data)
+
+    def trim(self, entries):
+        for i in range(0, len(entries), 2):
+            sector = entries[i] + ((entries[i+1] & 0xffff) << 32)
+            count  = entries[i+1] >> 16
+            if count == 0:
+                continue
+            if self.debug:
+                print_hdd("Trimming sector {s} to {e}".format(s=sector, e=sector+count-1), self.n)
+            self.check_allocated(sector, count)
+            self.mem.write(sectors2dwords(sector), [0]*sectors2dwords(count))
+            self.trimmed.append((sector, count))
 
     def read(self, sector, count):
         if self.debug:
@@ -78,10 +149,8 @@ class HDD(Module):
             else:
                 s = "{s} to {e}".format(s=sector, e=sector+count-1)
             print_hdd("Reading sector " + s, self.n)
-        data = []
-        for i in range(sectors2dwords(count)):
-            data.append(self.mem.data[sectors2dwords(sector)+i])
-        return data
+        self.check_allocated(sector, count)
+        return self.mem.read(sectors2dwords(sector), sectors2dwords(count))
 
     def set_reg_d2h_status(self, value):
         self.reg_d2h_status = value & 0xff
@@ -91,38 +160,167 @@ class HDD(Module):
         reg_d2h.status = self.reg_d2h_status or self.busy
         return reg_d2h
 
+    def get_set_device_bits_d2h(self, tag):
+        set_device_bits = FIS_SET_DEVICE_BITS_D2H([0]*fis_set_device_bits_d2h_header.length)
+        set_device_bits.status  = self.reg_d2h_status or self.busy
+        set_device_bits.i       = 1
+        set_device_bits.sactive = 1 << tag
+        return set_device_bits
+
+    def get_dma_setup(self, tag, count, read):
+        dma_setup = FIS_DMA_SETUP([0]*fis_dma_setup_header.length)
+        dma_setup.d                  = read
+        dma_setup.dma_buffer_id_lsb  = tag
+        dma_setup.dma_transfer_count = count*logical_sector_size
+        return dma_setup
+
+    def get_data(self, sector, count):
+        packets    = []
+        end_sector = sector + count
+        while sector != end_sector:
+            n = min(end_sector - sector, (fis_max_dwords*4)//logical_sector_size)
+            packet = self.read(sector, n)
+            packet.insert(0, 0)
+            packets.append(FIS_DATA(packet, direction="D2H"))
+            sector += n
+        if self.data_error_injection:
+            for packet in packets:
+                packet.data_error_injection = True
+        return packets
+
+    def get_identify(self):
+        words = [0]*256
+        words[60]  = min(self.sectors, 2**28 - 1) & 0xffff
+        words[61]  = min(self.sectors, 2**28 - 1) >> 16
+        words[75]  = (max(self.ncq_depth, 1) - 1) & 0x1f
+        words[76]  = (self.gens << 1) | ((self.ncq_depth != 0) << 8)
+        words[82]  = 1 << 5
+        words[83]  = 1 << 10
+        words[85]  = self.write_cache << 5
+        for i in range(4):
+            words[100 + i] = (self.sectors >> 16*i) & 0xffff
+        words[106] = (1 << 14) | self.physical_sector_exponent
+        if self.physical_sector_exponent:
+            words[106] |= 1 << 13
+        if self.logical_sector_words != logical_sector_size//2:
+            words[106] |= 1 << 12
+            words[117]  = self.logical_sector_words & 0xffff
+            words[118]  = self.logical_sector_words >> 16
+        words[169] = self.trim_supported
+        return [words[2*i] | (words[2*i + 1] << 16) for i in range(128)]
+
     def set_data_error_injection(self, value):
         self.data_error_injection = value
 
     def set_busy(self, value):
         self.busy = value & 0x1
 
+    def set_hang(self, value):
+        # Stop responding to commands (until a soft reset).
+        self.hang = value & 0x1
+
     def write_dma_callback(self, fis):
-        self.wr_sector = fis.lba_lsb + (fis.lba_msb << 32)
+        self.wr_sector = fis.lba_lsb + (fis.lba_msb << 24)
         self.wr_end_sector = self.wr_sector + fis.count
         return [FIS_DMA_ACTIVATE_D2H()] if not self.busy else [self.get_reg_d2h()]
 
     def read_dma_callback(self, fis):
-        self.rd_sector = fis.lba_lsb + (fis.lba_msb << 32)
+        self.rd_sector = fis.lba_lsb + (fis.lba_msb << 24)
         self.rd_end_sector = self.rd_sector + fis.count
         packets = []
         if not self.busy:
-            while self.rd_sector != self.rd_end_sector:
-                count = min(self.rd_end_sector-self.rd_sector, (fis_max_dwords*4)//logical_sector_size)
-                packet = self.read(self.rd_sector, count)
-                packet.insert(0, 0)
-                packets.append(FIS_DATA(packet, direction="D2H"))
-                self.rd_sector += count
-            if self.data_error_injection:
-                for packet in packets:
-                    packet.data_error_injection = True
+            packets += self.get_data(self.rd_sector, fis.count)
+            self.rd_sector = self.rd_end_sector
         packets.append(self.get_reg_d2h())
         return packets
 
+    def write_fpdma_callback(self, fis):
+        tag   = (fis.count >> 3) & 0x1f
+        count = fis.features_lsb + (fis.features_msb << 8)
+        self.wr_sector     = fis.lba_lsb + (fis.lba_msb << 24)
+        self.wr_end_sector = self.wr_sector + count
+        self.wr_tag        = tag
+        packets = [self.get_reg_d2h()] # Release bus.
+        if not self.busy:
+            packets.append(self.get_dma_setup(tag, count, read=0))
+            packets.append(FIS_DMA_ACTIVATE_D2H())
+        return packets
+
+    def read_fpdma_callback(self, fis):
+        tag    = (fis.count >> 3) & 0x1f
+        count  = fis.features_lsb + (fis.features_msb << 8)
+        sector = fis.lba_lsb + (fis.lba_msb << 24)
+        packets = [self.get_reg_d2h()] # Release bus.
+        if not self.busy:
+            packets.append(self.get_dma_setup(tag, count, read=1))
+            packets += self.get_data(sector, count)
+            packets.append(self.get_set_device_bits_d2h(tag))
+        return packets
+
+    def identify_device_callback(self, fis):
+        if self.debug:
+            print_hdd("Identify device", self.n)
+        pio_setup = FIS_PIO_SETUP_D2H([0]*fis_pio_setup_d2h_header.length)
+        pio_setup.d              = 1
+        pio_setup.transfer_count = 512
+        packet = self.get_identify()
+        packet.insert(0, 0)
+        return [pio_setup, FIS_DATA(packet, direction="D2H")]
+
+    def data_set_management_callback(self, fis):
+        assert fis.features_lsb & dsm_trim
+        self.trim_blocks = fis.count
+        self.trim_data   = []
+        return [FIS_DMA_ACTIVATE_D2H()] if not self.busy else [self.get_reg_d2h()]
+
+    def device_control_callback(self, fis):
+        if fis.control & device_control["srst"]:
+            self.srst = 1
+        elif self.srst:
+            if self.debug:
+                print_hdd("Soft reset", self.n)
+            self.srst        = 0
+            self.hang        = 0
+            self.wr_tag      = None
+            self.trim_blocks = 0
+            return [self.get_reg_d2h()] # Signature.
+        return None
+
+    def flush_cache_callback(self, fis):
+        if self.debug:
+            print_hdd("Flushing cache", self.n)
+        self.flushes += 1
+        return [self.get_reg_d2h()]
+
+    def set_features_callback(self, fis):
+        if fis.features_lsb == set_features["ENABLE_WRITE_CACHE"]:
+            self.write_cache = True
+        elif fis.features_lsb == set_features["DISABLE_WRITE_CACHE"]:
+            self.write_cache = False
+        else:
+            # Unsupported subcommand: aborted.
+            reg_d2h = FIS_REG_D2H([0]*fis_reg_d2h_header.length)
+            reg_d2h.status = 1 << reg_d2h_status["err"]
+            return [reg_d2h]
+        if self.debug:
+            print_hdd("Write cache " + ("enabled" if self.write_cache else "disabled"), self.n)
+        return [self.get_reg_d2h()]
+
     def data_callback(self, fis):
+        if self.trim_blocks:
+            self.trim_data += fis.packet[1:]
+            if len(self.trim_data) == self.trim_blocks*sectors2dwords(1) or self.busy:
+                self.trim(self.trim_data)
+                self.trim_blocks = 0
+                return [self.get_reg_d2h()]
+            else:
+                return [FIS_DMA_ACTIVATE_D2H()]
         self.write(self.wr_sector, fis.packet[1:])
         self.wr_sector += dwords2sectors(len(fis.packet[1:]))
         if self.wr_sector == self.wr_end_sector or self.busy:
+            if self.wr_tag is not None:
+                tag, self.wr_tag = self.wr_tag, None
+                return [self.get_set_device_bits_d2h(tag)]
             return [self.get_reg_d2h()]
         else:
             return [FIS_DMA_ACTIVATE_D2H()]
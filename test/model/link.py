@@ -1,7 +1,6 @@
 # Copyright (c) 2015-2019 Florent Kermarrec <florent@enjoy-digital.fr>
 # SPDX-License-Identifier: BSD-2-Clause
 
-import subprocess
 import math
 
 from litesata.common import *
@@ -14,21 +13,56 @@ def print_link(s, n=None):
     print("[LNK{}]: {}".format("" if n is None else str(n), s))
 
 
+_scrambler_datas = None
+
 def import_scrambler_datas():
-    with subprocess.Popen(["./test/model/scrambler"],
-                          stdin=subprocess.PIPE,
-                          stdout=subprocess.PIPE) as process:
-        process.stdin.write("0x10000".encode("ASCII"))
-        out, err = process.communicate()
-    return [int(e, 16) for e in out.decode("utf-8").split("\n")[:-1]]
+    # Computed once per process and shared: serial LFSR G(x) = x^16 + x^15 + x^13 + x^4 + 1,
+    # same sequence as Scrambler (and test/model/scrambler.c).
+    global _scrambler_datas
+    if _scrambler_datas is None:
+        datas   = []
+        context = 0xffff
+        for n in range(0x10000):
+            value = 0
+            for i in range(32):
+                bit      = (context >> 15) & 0x1
+                context  = (context << 1) & 0xffff
+                context ^= 0xa011 if bit else 0
+                value   |= bit << i
+            datas.append(value)
+        _scrambler_datas = datas
+    return _scrambler_datas
+
+
+def _build_crc_table(polynom=0x04c11db7):
+    table = []
+    for byte in range(256):
+        crc = byte << 24
+        for i in range(8):
+            crc = ((crc << 1) ^ polynom if crc & 0x80000000 else crc << 1) & 0xffffffff
+        table.append(crc)
+    return table
+
+_crc_table = _build_crc_table()
+
+def compute_crc(dwords, init=0x52325032):
+    # Table-driven SATA CRC32, same result as LiteSATACRC (and test/model/crc.c).
+    crc   = init
+    table = _crc_table
+    for dword in dwords:
+        crc ^= dword
+        for i in range(4):
+            crc = ((crc << 8) & 0xffffffff) ^ table[crc >> 24]
+    return crc
 
 # LinkPacket ---------------------------------------------------------------------------------------
 
 class LinkPacket(list):
+    scrambled_datas = import_scrambler_datas()
+
     def __init__(self, init=[]):
         self.ongoing = False
         self.done    = False
-        self.scrambled_datas = import_scrambler_datas()
         for dword in init:
             self.append(dword)
 
@@ -40,17 +74,7 @@ class LinkRXPacket(LinkPacket):
             self[i] = self[i] ^ self.scrambled_datas[i]
 
     def check_crc(self):
-        stdin = ""
-        for v in self[:-1]:
-            stdin += "0x{:08x} ".format(v)
-        stdin += "exit"
-        with subprocess.Popen("./test/model/crc",
-            stdin  = subprocess.PIPE,
-            stdout = subprocess.PIPE) as process:
-            process.stdin.write(stdin.encode("ASCII"))
-            out, err = process.communicate()
-        crc = int(out.decode("ASCII"), 16)
-        r = (self[-1] == crc)
+        r = (self[-1] == compute_crc(self[:-1]))
         self.pop()
         return r
 
@@ -62,17 +86,7 @@ class LinkRXPacket(LinkPacket):
 
 class LinkTXPacket(LinkPacket):
     def insert_crc(self):
-        stdin = ""
-        for v in self:
-            stdin += "0x{:08x} ".format(v)
-        stdin += "exit"
-        with subprocess.Popen("./test/model/crc",
-            stdin  = subprocess.PIPE,
-            stdout = subprocess.PIPE) as process:
-            process.stdin.write(stdin.encode("ASCII"))
-            out, err = process.communicate()
-        crc = int(out.decode("ASCII"), 16)
-        self.append(crc)
+        self.append(compute_crc(self))
 
     def scramble(self):
         for i in range(len(self)):
@@ -155,6 +169,14 @@ class LinkLayer(Module):
                 self.phy.send(self.scrambled_datas[self.tx_cont_nb])
             self.tx_cont_nb += 1
         else:
+            dword = self.phy.tx.dword.dat
+            if self.tx_cont_nb > 0 and not is_primitive(dword) and self.send_state in ["DATA", "EOF"]:
+                # Data can't directly follow CONT: terminate it with the repeated primitive
+                # and send the data on the next dword.
+                self.tx_packet.insert(0, dword)
+                self.send_state = "DATA"
+                self.phy.send(self.tx_lasts[-2])
+                self.tx_lasts[-1] = self.tx_lasts[-2]
             self.tx_cont_nb = 0
 
     def remove_cont(self, dword):
@@ -83,6 +83,44 @@ class FIS_DMA_ACTIVATE_D2H(FIS):
         r += FIS.__repr__(self)
         return r
 
+# FIS_DMA_SETUP ------------------------------------------------------------------------------------
+
+class FIS_DMA_SETUP(FIS):
+    def __init__(self, packet=[0]*fis_dma_setup_header.length, direction="D2H"):
+        FIS.__init__(self, packet, fis_dma_setup_header.fields, direction)
+        self.type = fis_types["DMA_SETUP"]
+
+    def __repr__(self):
+        r = "FIS_DMA_SETUP\n"
+        r += FIS.__repr__(self)
+        return r
+
+# FIS_PIO_SETUP_D2H --------------------------------------------------------------------------------
+
+class FIS_PIO_SETUP_D2H(FIS):
+    def __init__(self, packet=[0]*fis_pio_setup_d2h_header.length):
+        FIS.__init__(self, packet, fis_pio_setup_d2h_header.fields)
+        self.type      = fis_types["PIO_SETUP_D2H"]
+        self.direction = "D2H"
+
+    def __repr__(self):
+        r = "FIS_PIO_SETUP_D2H\n"
+        r += FIS.__repr__(self)
+        return r
+
+# FIS_SET_DEVICE_BITS_D2H --------------------------------------------------------------------------
+
+class FIS_SET_DEVICE_BITS_D2H(FIS):
+    def __init__(self, packet=[0]*fis_set_device_bits_d2h_header.length):
+        FIS.__init__(self, packet, fis_set_device_bits_d2h_header.fields)
+        self.type      = fis_types["SET_DEVICE_BITS_D2H"]
+        self.direction = "D2H"
+
+    def __repr__(self):
+        r = "FIS_SET_DEVICE_BITS_D2H\n"
+        r += FIS.__repr__(self)
+        return r
+
 # FIS_DATA -----------------------------------------------------------------------------------------
 
 class FIS_DATA(FIS):
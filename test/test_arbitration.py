@@ -0,0 +1,234 @@
+#
+# This file is part of LiteSATA.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+import unittest
+
+from litesata.common import *
+from litesata.core import LiteSATACore
+from litesata.frontend.arbitration import LiteSATACrossbar
+from litesata.frontend.bist import LiteSATABISTGenerator, LiteSATABISTChecker
+
+from litex.soc.interconnect.stream_sim import *
+
+from test.model.hdd import *
+
+
+class TestArbitration(unittest.TestCase):
+    def arbitration_latency_test(self, with_qos):
+        latency = [0]
+        def generator(dut):
+            dut.hdd.malloc(0, 64)
+
+            # Bulk write on the first port.
+            yield dut.generator.sector.eq(0)
+            yield dut.generator.count.eq(32)
+            yield dut.generator.start.eq(1)
+            yield
+            yield dut.generator.start.eq(0)
+            for i in range(256):
+                yield
+
+            # Short read on the second port during the bulk write.
+            yield dut.checker.sector.eq(32)
+            yield dut.checker.count.eq(1)
+            yield dut.checker.start.eq(1)
+            yield
+            yield dut.checker.start.eq(0)
+            yield
+            while not (yield dut.checker.done):
+                latency[0] += 1
+                yield
+            while not (yield dut.generator.done):
+                yield
+            self.assertEqual((yield dut.generator.aborted), 0)
+            self.assertEqual((yield dut.checker.aborted), 0)
+
+            # Verify the bulk write (split in several commands with QoS).
+            yield dut.checker.sector.eq(0)
+            yield dut.checker.count.eq(32)
+            yield dut.checker.start.eq(1)
+            yield
+            yield dut.checker.start.eq(0)
+            yield
+            while not (yield dut.checker.done):
+                yield
+            self.assertEqual((yield dut.checker.errors), 0)
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd = HDD(
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                self.submodules.core     = LiteSATACore(self.hdd.phy)
+                self.submodules.crossbar = LiteSATACrossbar(self.core)
+
+                if with_qos:
+                    bulk_port = self.crossbar.get_port(max_count=2)
+                    fast_port = self.crossbar.get_port(priority=1)
+                else:
+                    bulk_port = self.crossbar.get_port()
+                    fast_port = self.crossbar.get_port()
+                self.submodules.generator = LiteSATABISTGenerator(bulk_port)
+                self.submodules.checker   = LiteSATABISTChecker(fast_port)
+
+        dut = DUT()
+        generators = {
+            "sys" :   [generator(dut),
+                       dut.hdd.link.generator(),
+                       dut.hdd.phy.rx.generator(),
+                       dut.hdd.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
+        return latency[0]
+
+    def test_arbitration_qos(self):
+        # The short read waits for the whole bulk write without QoS, for one 2-sector quantum with.
+        latency_plain = self.arbitration_latency_test(with_qos=False)
+        latency_qos   = self.arbitration_latency_test(with_qos=True)
+        print("short read latency: {} cycles (plain) / {} cycles (qos)".format(latency_plain, latency_qos))
+        self.assertLess(latency_qos, latency_plain)
+
+    def test_split_port(self):
+        statuses = []
+        datas    = []
+
+        def command(port, write, sector, count, data=[0]):
+            for i, d in enumerate(data):
+                yield port.sink.valid.eq(1)
+                yield port.sink.write.eq(write)
+                yield port.sink.read.eq(not write)
+                yield port.sink.sector.eq(sector)
+                yield port.sink.count.eq(count)
+                yield port.sink.data.eq(d)
+                yield port.sink.last.eq(i == (len(data) - 1))
+                yield
+                while not (yield port.sink.ready):
+                    yield
+            yield port.sink.valid.eq(0)
+            while len(statuses) == 0:
+                yield
+            return statuses.pop(0)
+
+        def generator(dut):
+            dut.hdd.malloc(0, 64)
+            write_data = [seed_to_data(i) for i in range(sectors2dwords(2))]
+
+            # Write: status only.
+            status = yield from command(dut.port, 1, 4, 2, write_data)
+            self.assertEqual(status, (1, 0, 1, 0))
+            self.assertEqual(datas, [])
+
+            # Read: data, then status.
+            status = yield from command(dut.port, 0, 4, 2)
+            self.assertEqual(status, (0, 1, 1, 0))
+            self.assertEqual(datas, write_data)
+
+        @passive
+        def status_monitor(port):
+            yield port.status.ready.eq(1)
+            while True:
+                if (yield port.status.valid):
+                    statuses.append(((yield port.status.write), (yield port.status.read),
+                                     (yield port.status.end),   (yield port.status.failed)))
+                yield
+
+        @passive
+        def data_monitor(port):
+            yield port.data.ready.eq(1)
+            while True:
+                if (yield port.data.valid):
+                    # Data is forwarded before the status of the command.
+                    self.assertEqual(len(statuses), 0)
+                    datas.append((yield port.data.data))
+                yield
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd = HDD(
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                self.submodules.core     = LiteSATACore(self.hdd.phy)
+                self.submodules.crossbar = LiteSATACrossbar(self.core)
+                self.port = self.crossbar.get_port(split=True)
+
+        dut = DUT()
+        generators = {
+            "sys" :   [generator(dut),
+                       status_monitor(dut.port),
+                       data_monitor(dut.port),
+                       dut.hdd.link.generator(),
+                       dut.hdd.phy.rx.generator(),
+                       dut.hdd.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
+
+    def test_quantum_port_flush(self):
+        responses = []
+
+        def command(port, **fields):
+            yield port.sink.valid.eq(1)
+            yield port.sink.last.eq(1)
+            for name, value in fields.items():
+                yield getattr(port.sink, name).eq(value)
+            yield
+            while not (yield port.sink.ready):
+                yield
+            yield port.sink.valid.eq(0)
+            for name in fields:
+                yield getattr(port.sink, name).eq(0)
+            while len(responses) == 0:
+                yield
+            return responses.pop(0)
+
+        def generator(dut):
+            dut.hdd.malloc(0, 64)
+
+            # Flush / write cache control through a quantum port (forwarded by the splitter).
+            response = yield from command(dut.port, flush=1)
+            self.assertEqual(response, (1, 0))
+            self.assertEqual(dut.hdd.flushes, 1)
+            response = yield from command(dut.port, set_features=1,
+                features=set_features["DISABLE_WRITE_CACHE"])
+            self.assertEqual(response, (1, 0))
+            self.assertEqual(dut.hdd.write_cache, False)
+
+        @passive
+        def response_monitor(port):
+            yield port.source.ready.eq(1)
+            while True:
+                if (yield port.source.valid) and (yield port.source.end):
+                    responses.append(((yield port.source.end), (yield port.source.failed)))
+                yield
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd = HDD(
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                self.submodules.core     = LiteSATACore(self.hdd.phy)
+                self.submodules.crossbar = LiteSATACrossbar(self.core)
+                self.port = self.crossbar.get_port(max_count=2)
+
+        dut = DUT()
+        generators = {
+            "sys" :   [generator(dut),
+                       response_monitor(dut.port),
+                       dut.hdd.link.generator(),
+                       dut.hdd.phy.rx.generator(),
+                       dut.hdd.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
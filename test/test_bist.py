@@ -9,7 +9,7 @@ import unittest
 from litesata.common import *
 from litesata.core import LiteSATACore
 from litesata.frontend.arbitration import LiteSATACrossbar
-from litesata.frontend.bist import LiteSATABISTGenerator, LiteSATABISTChecker
+from litesata.frontend.bist import LiteSATABISTGenerator, LiteSATABISTChecker, LiteSATABISTWorkload
 
 from litex.soc.interconnect.stream_sim import *
 
@@ -74,3 +74,59 @@ class TestBIST(unittest.TestCase):
         }
         clocks = {"sys": 10}
         run_simulation(dut, generators, clocks)
+
+    def test_bist_workload(self):
+        def main_generator(dut):
+            dut.hdd.malloc(16, 32)
+            workload = dut.workload
+            sizes    = [1, 1, 2, 4]
+            yield workload.sector.eq(16)
+            yield workload.span.eq(32)
+            yield workload.count.eq(16)
+            yield workload.random.eq(1)
+            yield workload.write_ratio.eq(128)
+            yield workload.sizes.eq(sum(size << 16*i for i, size in enumerate(sizes)))
+            yield workload.start.eq(1)
+            yield
+            yield workload.start.eq(0)
+            yield
+            while not (yield workload.done):
+                yield
+
+            rd_commands = (yield workload.rd_commands)
+            wr_commands = (yield workload.wr_commands)
+            print("reads {} / writes {}".format(rd_commands, wr_commands))
+            self.assertEqual((yield workload.errors), 0)
+            self.assertEqual((yield workload.aborted), 0)
+            self.assertEqual(rd_commands + wr_commands, 16)
+            self.assertNotEqual(rd_commands, 0)
+            self.assertNotEqual(wr_commands, 0)
+            for rw in ["rd", "wr"]:
+                commands = (yield getattr(workload, rw + "_commands"))
+                nbytes   = (yield getattr(workload, rw + "_bytes"))
+                cycles   = (yield getattr(workload, rw + "_cycles"))
+                self.assertGreaterEqual(nbytes, commands*min(sizes)*logical_sector_size)
+                self.assertLessEqual(nbytes,    commands*max(sizes)*logical_sector_size)
+                self.assertGreater(cycles, 0)
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd = HDD(
+                    link_debug         = False,
+                    link_random_level  = 0,
+                    transport_debug    = False,
+                    transport_loopback = False,
+                    hdd_debug          = True)
+                self.submodules.core     = LiteSATACore(self.hdd.phy)
+                self.submodules.crossbar = LiteSATACrossbar(self.core)
+                self.submodules.workload = LiteSATABISTWorkload(self.crossbar.get_port())
+
+        dut = DUT()
+        generators = {
+            "sys" : [main_generator(dut),
+                       dut.hdd.link.generator(),
+                       dut.hdd.phy.rx.generator(),
+                       dut.hdd.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
@@ -0,0 +1,110 @@
+#
+# This file is part of LiteSATA.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+import unittest
+
+from litesata.common import *
+from litesata.core import LiteSATACore
+from litesata.frontend.arbitration import LiteSATACrossbar
+from litesata.frontend.bist import LiteSATABISTGenerator, LiteSATABISTChecker
+from litesata.frontend.cache import LiteSATACache
+from litesata.frontend.trim import LiteSATATrim
+
+from litex.soc.interconnect.stream_sim import *
+
+from test.model.hdd import *
+
+
+class TestCache(unittest.TestCase):
+    def test_cache(self):
+        def run(unit, sector, count, random=0):
+            yield unit.sector.eq(sector)
+            yield unit.count.eq(count)
+            yield unit.random.eq(random)
+            yield unit.start.eq(1)
+            yield
+            yield unit.start.eq(0)
+            yield
+            cycles = 1
+            while not (yield unit.done):
+                cycles += 1
+                yield
+            self.assertEqual((yield unit.aborted), 0)
+            self.assertEqual((yield unit.errors), 0)
+            return cycles
+
+        def counters(dut):
+            return ((yield dut.cache.hits.status), (yield dut.cache.misses.status))
+
+        def generator(dut):
+            dut.hdd.malloc(0, 64)
+            for sector in [0, 2, 4]:
+                yield from run(dut.generator, sector, 1)
+
+            # Miss then hit.
+            miss_cycles = yield from run(dut.checker, 0, 1)
+            hit_cycles  = yield from run(dut.checker, 0, 1)
+            print("read latency: {} cycles (miss) / {} cycles (hit)".format(miss_cycles, hit_cycles))
+            self.assertEqual((yield from counters(dut)), (1, 1))
+            self.assertLess(hit_cycles, miss_cycles)
+
+            # LRU eviction (sectors 0, 2 and 4 are in set 0).
+            yield from run(dut.checker, 2, 1) # miss
+            yield from run(dut.checker, 0, 1) # hit, 2 is now the LRU
+            yield from run(dut.checker, 4, 1) # miss, evicts 2
+            yield from run(dut.checker, 0, 1) # hit
+            yield from run(dut.checker, 2, 1) # miss
+            self.assertEqual((yield from counters(dut)), (3, 4))
+
+            # Write-through invalidation.
+            yield from run(dut.generator, 0, 1, random=1)
+            yield from run(dut.checker,   0, 1, random=1) # miss
+            yield from run(dut.checker,   0, 1, random=1) # hit
+            self.assertEqual((yield from counters(dut)), (4, 5))
+
+            # Multi-sector reads bypass the cache.
+            yield from run(dut.generator, 8, 2)
+            yield from run(dut.checker,   8, 2)
+            self.assertEqual((yield from counters(dut)), (4, 5))
+
+            # Trim invalidates the whole cache (sector 0 is cached, not trimmed).
+            yield dut.trim.sink.valid.eq(1)
+            yield dut.trim.sink.sector.eq(20)
+            yield dut.trim.sink.count.eq(1)
+            yield dut.trim.sink.last.eq(1)
+            yield
+            while not (yield dut.trim.sink.ready):
+                yield
+            yield dut.trim.sink.valid.eq(0)
+            while (yield dut.trim.commands.status) != 1:
+                yield
+            yield from run(dut.checker, 0, 1, random=1) # miss
+            self.assertEqual((yield from counters(dut)), (4, 6))
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd = HDD(
+                    link_debug         = False,
+                    link_random_level  = 0,
+                    transport_debug    = False,
+                    transport_loopback = False,
+                    hdd_debug          = False)
+                self.submodules.core      = LiteSATACore(self.hdd.phy)
+                self.submodules.crossbar  = LiteSATACrossbar(self.core)
+                self.submodules.cache     = LiteSATACache(self.crossbar.get_port(), nsets=2, nways=2)
+                self.submodules.users     = LiteSATACrossbar(self.cache)
+                self.submodules.generator = LiteSATABISTGenerator(self.users.get_port())
+                self.submodules.checker   = LiteSATABISTChecker(self.users.get_port())
+                self.submodules.trim      = LiteSATATrim(self.users.get_port())
+
+        dut = DUT()
+        generators = {
+            "sys" :   [generator(dut),
+                       dut.hdd.link.generator(),
+                       dut.hdd.phy.rx.generator(),
+                       dut.hdd.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
@@ -0,0 +1,222 @@
+#
+# This file is part of LiteSATA.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+import unittest
+
+from litesata.common import *
+from litesata.core import LiteSATACore
+from litesata.frontend.arbitration import LiteSATACrossbar
+from litesata.frontend.bist import LiteSATABISTGenerator, LiteSATABISTChecker
+from litesata.frontend.coalescer import LiteSATAWriteCoalescer
+
+from litex.soc.interconnect.stream_sim import *
+
+from test.model.hdd import *
+
+
+class TestCoalescer(unittest.TestCase):
+    def test_coalescer(self):
+        timeout  = 4096
+        commands = [0]
+
+        def start(unit, sector, count):
+            yield unit.sector.eq(sector)
+            yield unit.count.eq(count)
+            yield unit.start.eq(1)
+            yield
+            yield unit.start.eq(0)
+            yield
+
+        def wait(units):
+            cycles = 0
+            for unit in units:
+                while not (yield unit.done):
+                    cycles += 1
+                    yield
+            for unit in units:
+                self.assertEqual((yield unit.aborted), 0)
+            return cycles
+
+        def generator(dut):
+            dut.hdd.malloc(0, 64)
+
+            # Contiguous writes of the 2 ports: merged, written on flush.
+            yield from start(dut.generator0, 0, 2)
+            for i in range(16):
+                yield
+            yield from start(dut.generator1, 2, 2)
+            for i in range(512):
+                yield
+            self.assertEqual((yield dut.generator0.done), 0)
+            self.assertEqual((yield dut.generator1.done), 0)
+            self.assertEqual(commands[0], 0)
+            yield dut.coalescer.flush.eq(1)
+            yield
+            yield dut.coalescer.flush.eq(0)
+            yield from wait([dut.generator0, dut.generator1])
+            self.assertEqual(commands[0], 1)
+
+            # Verify data
+            yield from start(dut.checker0, 0, 2)
+            yield from wait([dut.checker0])
+            yield from start(dut.checker1, 2, 2)
+            yield from wait([dut.checker1])
+            self.assertEqual((yield dut.checker0.errors), 0)
+            self.assertEqual((yield dut.checker1.errors), 0)
+            self.assertEqual(commands[0], 3)
+
+            # Single write: written on timeout.
+            yield from start(dut.generator0, 8, 1)
+            cycles = yield from wait([dut.generator0])
+            self.assertGreaterEqual(cycles, timeout)
+            self.assertEqual(commands[0], 4)
+
+            # Contiguous writes filling the buffer: written once full.
+            yield from start(dut.generator0, 16, 4)
+            for i in range(16):
+                yield
+            yield from start(dut.generator1, 20, 4)
+            cycles = yield from wait([dut.generator0, dut.generator1])
+            self.assertLess(cycles, timeout)
+            self.assertEqual(commands[0], 5)
+
+        @passive
+        def commands_monitor(dut):
+            sink = dut.core.sink
+            while True:
+                if (yield sink.valid) and (yield sink.ready) and (yield sink.last):
+                    commands[0] += 1
+                yield
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd = HDD(
+                    link_debug         = False,
+                    link_random_level  = 0,
+                    transport_debug    = False,
+                    transport_loopback = False,
+                    hdd_debug          = False)
+                self.submodules.core      = LiteSATACore(self.hdd.phy)
+                self.submodules.coalescer = LiteSATAWriteCoalescer(self.core,
+                    n              = 2,
+                    buffer_sectors = 8,
+                    timeout        = timeout)
+
+                self.submodules.crossbar0  = LiteSATACrossbar(self.coalescer.ports[0])
+                self.submodules.generator0 = LiteSATABISTGenerator(self.crossbar0.get_port())
+                self.submodules.checker0   = LiteSATABISTChecker(self.crossbar0.get_port())
+
+                self.submodules.crossbar1  = LiteSATACrossbar(self.coalescer.ports[1])
+                self.submodules.generator1 = LiteSATABISTGenerator(self.crossbar1.get_port())
+                self.submodules.checker1   = LiteSATABISTChecker(self.crossbar1.get_port())
+
+        dut = DUT()
+        generators = {
+            "sys" :   [generator(dut),
+                       commands_monitor(dut),
+                       dut.hdd.link.generator(),
+                       dut.hdd.phy.rx.generator(),
+                       dut.hdd.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
+
+    def test_coalescer_single_port(self):
+        timeout   = 256
+        commands  = [0]
+        responses = [0]
+
+        def write(port, sector, count):
+            data = [seed_to_data(sector*1024 + i) for i in range(sectors2dwords(count))]
+            for i, d in enumerate(data):
+                yield port.sink.valid.eq(1)
+                yield port.sink.write.eq(1)
+                yield port.sink.sector.eq(sector)
+                yield port.sink.count.eq(count)
+                yield port.sink.data.eq(d)
+                yield port.sink.last.eq(i == (len(data) - 1))
+                yield
+                while not (yield port.sink.ready):
+                    yield
+            yield port.sink.valid.eq(0)
+            yield
+            return data
+
+        def wait_responses(n):
+            while responses[0] != n:
+                yield
+
+        def generator(dut):
+            port = dut.coalescer.ports[0]
+            dut.hdd.malloc(0, 64)
+
+            # Back-to-back contiguous writes (no wait for the responses): merged, one response per
+            # write.
+            data  = yield from write(port, 0, 1)
+            data += yield from write(port, 1, 2)
+            yield dut.coalescer.flush.eq(1)
+            yield
+            yield dut.coalescer.flush.eq(0)
+            yield from wait_responses(2)
+            for i in range(64):
+                yield
+            self.assertEqual(responses[0], 2)
+            self.assertEqual(commands[0], 1)
+            self.assertEqual(dut.hdd.read(0, 3), data)
+
+            # Response-gated contiguous writes: each write is written on timeout.
+            data = yield from write(port, 4, 1)
+            yield from wait_responses(3)
+            data += yield from write(port, 5, 1)
+            yield from wait_responses(4)
+            for i in range(64):
+                yield
+            self.assertEqual(responses[0], 4)
+            self.assertEqual(commands[0], 3)
+            self.assertEqual(dut.hdd.read(4, 2), data)
+
+        @passive
+        def commands_monitor(dut):
+            sink = dut.core.sink
+            while True:
+                if (yield sink.valid) and (yield sink.ready) and (yield sink.last):
+                    commands[0] += 1
+                yield
+
+        @passive
+        def responses_monitor(dut):
+            source = dut.coalescer.ports[0].source
+            yield source.ready.eq(1)
+            while True:
+                if (yield source.valid) and (yield source.last) and (yield source.end):
+                    self.assertEqual((yield source.failed), 0)
+                    responses[0] += 1
+                yield
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd = HDD(
+                    link_debug         = False,
+                    link_random_level  = 0,
+                    transport_debug    = False,
+                    transport_loopback = False,
+                    hdd_debug          = False)
+                self.submodules.core      = LiteSATACore(self.hdd.phy)
+                self.submodules.coalescer = LiteSATAWriteCoalescer(self.core,
+                    n              = 2,
+                    buffer_sectors = 8,
+                    timeout        = timeout)
+
+        dut = DUT()
+        generators = {
+            "sys" :   [generator(dut),
+                       commands_monitor(dut),
+                       responses_monitor(dut),
+                       dut.hdd.link.generator(),
+                       dut.hdd.phy.rx.generator(),
+                       dut.hdd.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
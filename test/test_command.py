@@ -5,9 +5,11 @@
 # SPDX-License-Identifier: BSD-2-Clause
 
 import unittest
+from copy import deepcopy
 
 from litesata.common import *
 from litesata.core import LiteSATACore
+from litesata.frontend.splitter import LiteSATASplitter
 
 from litex.soc.interconnect.stream_sim import *
 
@@ -15,20 +17,25 @@ from test.model.hdd import *
 
 
 class CommandTXPacket(list):
-    def __init__(self, write=0, read=0, sector=0, count=0, data=[]):
-        self.ongoing = False
-        self.done    = False
-        self.write   = write
-        self.read    = read
-        self.sector  = sector
-        self.count   = count
+    def __init__(self, write=0, read=0, ncq=0, flush=0, set_features=0, features=0,
+                 sector=0, count=0, data=[]):
+        self.ongoing      = False
+        self.done         = False
+        self.write        = write
+        self.read         = read
+        self.ncq          = ncq
+        self.flush        = flush
+        self.set_features = set_features
+        self.features     = features
+        self.sector       = sector
+        self.count        = count
         for d in data:
             self.append(d)
 
 
 class CommandStreamer(PacketStreamer):
-    def __init__(self):
-        self.source = stream.Endpoint(command_tx_description(32))
+    def __init__(self, count_width=16):
+        self.source = stream.Endpoint(command_tx_description(32, count_width))
 
         # # #
 
@@ -53,6 +60,10 @@ class CommandStreamer(PacketStreamer):
                 self.packet = self.packets.pop(0)
             yield self.source.write.eq(self.packet.write)
             yield self.source.read.eq(self.packet.read)
+            yield self.source.ncq.eq(self.packet.ncq)
+            yield self.source.flush.eq(self.packet.flush)
+            yield self.source.set_features.eq(self.packet.set_features)
+            yield self.source.features.eq(self.packet.features)
             yield self.source.sector.eq(self.packet.sector)
             yield self.source.count.eq(self.packet.count)
             if not self.packet.ongoing and not self.packet.done:
@@ -78,13 +89,17 @@ class CommandRXPacket(list):
         self.done    = False
         self.write   = 0
         self.read    = 0
+        self.ncq     = 0
+        self.tag     = 0
+        self.end     = 0
         self.failed  = 0
 
 
 class CommandLogger(PacketLogger):
     def __init__(self):
         PacketLogger.__init__(self, command_rx_description(32), CommandRXPacket)
-        self.first = True
+        self.first   = True
+        self.packets = []
 
     @passive
     def generator(self):
@@ -94,17 +109,64 @@ class CommandLogger(PacketLogger):
                 self.packet = CommandRXPacket()
                 self.packet.write  = (yield self.sink.write)
                 self.packet.read   = (yield self.sink.read)
+                self.packet.ncq    = (yield self.sink.ncq)
+                self.packet.tag    = (yield self.sink.tag)
+                self.packet.end    = (yield self.sink.end)
                 self.packet.failed = (yield self.sink.failed)
                 self.packet.append((yield self.sink.data))
                 self.first = False
             elif (yield self.sink.valid):
+                self.packet.failed |= (yield self.sink.failed)
                 self.packet.append((yield self.sink.data))
             if (yield self.sink.valid) and (yield self.sink.last):
                 self.packet.done = True
+                self.packets.append(self.packet)
                 self.first = True
             yield
 
 
+class DUT(Module):
+    def __init__(self, with_ncq=False, splitter_max_count=None, **kwargs):
+        self.submodules.hdd = HDD(
+            link_debug         = False,
+            link_random_level  = 50,
+            transport_debug    = False,
+            transport_loopback = False,
+            hdd_debug          = True)
+        self.submodules.core = LiteSATACore(self.hdd.phy, with_ncq=with_ncq, **kwargs)
+        port = self.core
+        count_width = 16
+        if splitter_max_count is not None:
+            self.submodules.splitter = port = LiteSATASplitter(self.core, splitter_max_count)
+            count_width = 32
+
+        self.submodules.streamer = CommandStreamer(count_width)
+        self.submodules.streamer_randomizer = Randomizer(command_tx_description(32, count_width), level=50)
+
+        self.submodules.logger = CommandLogger()
+        self.submodules.logger_randomizer = Randomizer(command_rx_description(32), level=50)
+
+        self.submodules.pipeline = Pipeline(
+            self.streamer,
+            self.streamer_randomizer,
+            port,
+            self.logger_randomizer,
+            self.logger
+        )
+
+    def get_generators(self, generator):
+        return {
+            "sys" :   [generator,
+                       self.hdd.link.generator(),
+                       self.streamer.generator(),
+                       self.streamer_randomizer.generator(),
+                       self.logger.generator(),
+                       self.logger_randomizer.generator(),
+                       self.hdd.phy.rx.generator(),
+                       self.hdd.phy.tx.generator()]
+        }
+
+
 class TestCommand(unittest.TestCase):
     def test_command(self):
         def generator(dut):
@@ -124,43 +186,238 @@ class TestCommand(unittest.TestCase):
             # Check results
             s, l, e = check(write_data, read_data)
             print("shift " + str(s) + " / length " + str(l) + " / errors " + str(e))
+            self.assertEqual(l, len(write_data))
             self.assertEqual(s, 0)
             self.assertEqual(e, 0)
 
-        class DUT(Module):
-            def __init__(self):
-                self.submodules.hdd = HDD(
-                    link_debug         = False,
-                    link_random_level  = 50,
-                    transport_debug    = False,
-                    transport_loopback = False,
-                    hdd_debug          = True)
-                self.submodules.core = LiteSATACore(self.hdd.phy)
-
-                self.submodules.streamer = CommandStreamer()
-                self.submodules.streamer_randomizer = Randomizer(command_tx_description(32), level=50)
-
-                self.submodules.logger = CommandLogger()
-                self.submodules.logger_randomizer = Randomizer(command_rx_description(32), level=50)
-
-                self.submodules.pipeline = Pipeline(
-                    self.streamer,
-                    self.streamer_randomizer,
-                    self.core,
-                    self.logger_randomizer,
-                    self.logger
-                )
+        dut = DUT()
+        run_simulation(dut, dut.get_generators(generator(dut)), {"sys": 10})
+
+    def test_command_lba48(self):
+        def generator(dut):
+            hdd = dut.hdd
+            sector = 2**48 - 64
+            hdd.malloc(sector, 64)
+            write_data   = [seed_to_data(i) for i in range(sectors2dwords(2))]
+            write_len    = dwords2sectors(len(write_data))
+            write_packet = CommandTXPacket(write=1, sector=sector + 2, count=write_len, data=write_data)
+            yield from dut.streamer.send_blocking(write_packet)
+            yield from dut.logger.receive()
+
+            read_packet = CommandTXPacket(read=1, sector=sector + 2, count=write_len)
+            yield from dut.streamer.send_blocking(read_packet)
+            yield from dut.logger.receive()
+            read_data = dut.logger.packet
+
+            # Check results
+            self.assertEqual(hdd.read(sector + 2, write_len), write_data)
+            s, l, e = check(write_data, read_data)
+            print("shift " + str(s) + " / length " + str(l) + " / errors " + str(e))
+            self.assertEqual(l, len(write_data))
+            self.assertEqual(s, 0)
+            self.assertEqual(e, 0)
 
         dut = DUT()
-        generators = {
-            "sys" :   [generator(dut),
-                       dut.hdd.link.generator(),
-                       dut.streamer.generator(),
-                       dut.streamer_randomizer.generator(),
-                       dut.logger.generator(),
-                       dut.logger_randomizer.generator(),
-                       dut.hdd.phy.rx.generator(),
-                       dut.hdd.phy.tx.generator()]
-        }
-        clocks = {"sys": 10}
-        run_simulation(dut, generators, clocks)
+        run_simulation(dut, dut.get_generators(generator(dut)), {"sys": 10})
+
+    def test_command_splitter(self):
+        def generator(dut):
+            hdd = dut.hdd
+            hdd.malloc(0, 64)
+            write_data   = [seed_to_data(i) for i in range(sectors2dwords(5))]
+            write_len    = dwords2sectors(len(write_data))
+            write_packet = CommandTXPacket(write=1, sector=2, count=write_len, data=write_data)
+            yield from dut.streamer.send_blocking(write_packet)
+            while not len(dut.logger.packets):
+                yield
+            write_packets = dut.logger.packets
+            dut.logger.packets = []
+
+            read_packet = CommandTXPacket(read=1, sector=2, count=write_len)
+            yield from dut.streamer.send_blocking(read_packet)
+            while not len([p for p in dut.logger.packets if p.end]):
+                yield
+            read_packets = dut.logger.packets
+
+            # Check results: a single response per transfer.
+            for packets in [write_packets, read_packets]:
+                self.assertEqual([p.end for p in packets].count(1), 1)
+                self.assertEqual(packets[-1].end, 1)
+                self.assertEqual(packets[-1].failed, 0)
+            read_data = sum([list(p) for p in read_packets[:-1]], [])
+            s, l, e = check(write_data, read_data)
+            print("shift " + str(s) + " / length " + str(l) + " / errors " + str(e))
+            self.assertEqual(l, len(write_data))
+            self.assertEqual(s, 0)
+            self.assertEqual(e, 0)
+
+            # 0 sector transfers: not issued, failed response.
+            for packet in [
+                CommandTXPacket(read=1, sector=2, count=0),
+                CommandTXPacket(write=1, sector=2, count=0, data=[0, 0])]:
+                dut.logger.packets = []
+                yield from dut.streamer.send_blocking(packet)
+                yield from dut.logger.receive()
+                self.assertEqual(dut.logger.packet.end, 1)
+                self.assertEqual(dut.logger.packet.failed, 1)
+            self.assertEqual(hdd.read(2, write_len), write_data)
+
+        dut = DUT(splitter_max_count=2)
+        run_simulation(dut, dut.get_generators(generator(dut)), {"sys": 10})
+
+    def test_command_cut_through(self):
+        def generator(dut):
+            hdd = dut.hdd
+            hdd.malloc(0, 64)
+            write_data   = [seed_to_data(i) for i in range(sectors2dwords(2))]
+            write_len    = dwords2sectors(len(write_data))
+            write_packet = CommandTXPacket(write=1, sector=2, count=write_len, data=write_data)
+            yield from dut.streamer.send_blocking(write_packet)
+            yield from dut.logger.receive()
+
+            # Small RX buffer: HOLD is sent to the device.
+            read_packet = CommandTXPacket(read=1, sector=2, count=write_len)
+            yield from dut.streamer.send_blocking(read_packet)
+            while not len([p for p in dut.logger.packets if p.end]) == 2:
+                yield
+            read_packets = dut.logger.packets[1:]
+            dut.logger.packets = []
+            for p in read_packets:
+                self.assertEqual(p.failed, 0)
+            read_data = sum([list(p) for p in read_packets[:-1]], [])
+            s, l, e = check(write_data, read_data)
+            print("shift " + str(s) + " / length " + str(l) + " / errors " + str(e))
+            self.assertEqual(l, len(write_data))
+            self.assertEqual(s, 0)
+            self.assertEqual(e, 0)
+
+            # CRC error: reported on the last beat of the data and in the response.
+            hdd.set_data_error_injection(1)
+            yield from dut.streamer.send_blocking(read_packet)
+            while not len([p for p in dut.logger.packets if p.end]):
+                yield
+            read_packets = dut.logger.packets
+            self.assertEqual(read_packets[0].failed, 1)
+            self.assertEqual(read_packets[-1].end, 1)
+            self.assertEqual(read_packets[-1].failed, 1)
+
+        dut = DUT(rx_buffer_depth=48, rx_hold_threshold=16)
+        run_simulation(dut, dut.get_generators(generator(dut)), {"sys": 10})
+
+    def test_command_ncq(self):
+        def generator(dut):
+            hdd = dut.hdd
+            hdd.malloc(0, 64)
+            n = 4
+
+            # Queue writes
+            write_datas = []
+            for i in range(n):
+                write_data = [seed_to_data(i*1024 + j) for j in range(sectors2dwords(2))]
+                write_datas.append(write_data)
+                dut.streamer.send(CommandTXPacket(write=1, ncq=1, sector=4*i, count=2, data=write_data))
+            while len([p for p in dut.logger.packets if p.end]) < n:
+                yield
+            write_packets = dut.logger.packets
+            dut.logger.packets = []
+
+            # Queue reads
+            for i in range(n):
+                dut.streamer.send(CommandTXPacket(read=1, ncq=1, sector=4*i, count=2))
+            while len([p for p in dut.logger.packets if p.end]) < n:
+                yield
+            read_packets = dut.logger.packets
+
+            # Check results
+            for p in write_packets + read_packets:
+                self.assertEqual(p.ncq, 1)
+                self.assertEqual(p.failed, 0)
+            read_datas = [[] for i in range(n)]
+            tags       = {}
+            acks       = 0
+            for p in read_packets:
+                if p.end:
+                    tags.pop(p.tag)
+                elif p.tag not in tags:
+                    # Acks are presented in issue order.
+                    tags[p.tag] = acks
+                    acks += 1
+                else:
+                    read_datas[tags[p.tag]] += p
+            for i in range(n):
+                s, l, e = check(write_datas[i], read_datas[i])
+                print("shift " + str(s) + " / length " + str(l) + " / errors " + str(e))
+                self.assertEqual(l, len(write_datas[i]))
+                self.assertEqual(s, 0)
+                self.assertEqual(e, 0)
+
+        dut = DUT(with_ncq=True)
+        run_simulation(dut, dut.get_generators(generator(dut)), {"sys": 10})
+
+    def test_command_cache_control(self):
+        def generator(dut):
+            hdd = dut.hdd
+            hdd.malloc(0, 64)
+
+            # Disable/Enable write cache.
+            for enable in [0, 1]:
+                features = set_features["ENABLE_WRITE_CACHE" if enable else "DISABLE_WRITE_CACHE"]
+                yield from dut.streamer.send_blocking(CommandTXPacket(set_features=1, features=features))
+                yield from dut.logger.receive()
+                self.assertEqual(dut.logger.packet.end, 1)
+                self.assertEqual(dut.logger.packet.failed, 0)
+                self.assertEqual(hdd.write_cache, enable)
+
+            # Cached write followed by a flush.
+            write_data = [seed_to_data(i) for i in range(sectors2dwords(2))]
+            yield from dut.streamer.send_blocking(CommandTXPacket(write=1, sector=2, count=2, data=write_data))
+            yield from dut.logger.receive()
+            yield from dut.streamer.send_blocking(CommandTXPacket(flush=1))
+            yield from dut.logger.receive()
+            self.assertEqual(dut.logger.packet.end, 1)
+            self.assertEqual(dut.logger.packet.failed, 0)
+            self.assertEqual(hdd.flushes, 1)
+            self.assertEqual(hdd.read(2, 2), write_data)
+
+            # Unsupported SET FEATURES subcommand: aborted by the device.
+            yield from dut.streamer.send_blocking(CommandTXPacket(set_features=1, features=0xff))
+            yield from dut.logger.receive()
+            self.assertEqual(dut.logger.packet.end, 1)
+            self.assertEqual(dut.logger.packet.failed, 1)
+
+        dut = DUT()
+        run_simulation(dut, dut.get_generators(generator(dut)), {"sys": 10})
+
+    def test_command_timeout(self):
+        def generator(dut):
+            hdd      = dut.hdd
+            watchdog = dut.core.command.watchdog
+            hdd.malloc(0, 64)
+            write_data = [seed_to_data(i) for i in range(sectors2dwords(2))]
+
+            # Device hangs on a read/write: failed response, soft reset recovery.
+            for n, packet in enumerate([
+                CommandTXPacket(read=1, sector=2, count=2),
+                CommandTXPacket(write=1, sector=2, count=2, data=write_data)]):
+                hdd.set_hang(1)
+                yield from dut.streamer.send_blocking(packet)
+                yield from dut.logger.receive()
+                self.assertEqual(dut.logger.packet.end, 1)
+                self.assertEqual(dut.logger.packet.failed, 1)
+                while (yield watchdog.recoveries.status) != (n + 1):
+                    yield
+                self.assertEqual(hdd.hang, 0)
+                self.assertNotEqual((yield watchdog.recovery_cycles.status), 0)
+
+            # Commands are resumed after the recovery.
+            yield from dut.streamer.send_blocking(CommandTXPacket(write=1, sector=2, count=2, data=write_data))
+            yield from dut.logger.receive()
+            self.assertEqual(dut.logger.packet.failed, 0)
+            yield from dut.streamer.send_blocking(CommandTXPacket(read=1, sector=2, count=2))
+            yield from dut.logger.receive()
+            self.assertEqual(dut.logger.packet.failed, 0)
+            self.assertEqual(list(dut.logger.packet), write_data)
+            self.assertEqual((yield watchdog.recoveries.status), 2)
+
+        dut = DUT(command_timeout=4096)
+        run_simulation(dut, dut.get_generators(generator(dut)), {"sys": 10})
@@ -0,0 +1,162 @@
+#
+# This file is part of LiteSATA.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+import unittest
+
+from litesata.common import *
+from litesata.core import LiteSATACore
+from litesata.frontend.arbitration import LiteSATACrossbar
+from litesata.frontend.dma import LiteSATABlock2MemScatterGatherDMA, LiteSATAMem2BlockDMA
+
+from litex.soc.interconnect import wishbone
+
+from litex.soc.interconnect.stream_sim import *
+
+from test.model.hdd import *
+
+
+class TestDMA(unittest.TestCase):
+    def test_block2mem_scatter_gather_dma(self):
+        bus_dw = 128
+        descriptors = [
+            # sector, count, base
+            (2, 2, 0x0000),
+            (8, 1, 0x1000),
+            (10, 0, 0x1400), # Not executed: failed.
+            (4, 3, 0x0400),
+        ]
+
+        def generator(dut):
+            hdd = dut.hdd
+            hdd.malloc(0, 64)
+            for sector in range(16):
+                hdd.write(sector, [seed_to_data(sector*1024 + i) for i in range(sectors2dwords(1))])
+
+            # Push descriptors
+            for sector, count, base in descriptors:
+                yield dut.dma.desc_sector.storage.eq(sector)
+                yield dut.dma.desc_count.storage.eq(count)
+                yield dut.dma.desc_base.storage.eq(base)
+                yield dut.dma.desc_we.re.eq(1)
+                yield
+                yield dut.dma.desc_we.re.eq(0)
+                yield
+
+            # Wait completions
+            while (yield dut.dma.status_level.status) != len(descriptors):
+                yield
+            for i, (sector, count, base) in enumerate(descriptors):
+                self.assertEqual((yield dut.dma.status_index.status), i)
+                self.assertEqual((yield dut.dma.status_failed.status), count == 0)
+                yield dut.dma.status_ack.re.eq(1)
+                yield
+                yield dut.dma.status_ack.re.eq(0)
+                yield
+
+            # Check memory
+            for sector, count, base in descriptors:
+                data = []
+                for i in range(count*logical_sector_size*8//bus_dw):
+                    word = (yield dut.mem.mem[base*8//bus_dw + i])
+                    data += [(word >> 32*n) & 0xffffffff for n in range(bus_dw//32)]
+                self.assertEqual(data, hdd.read(sector, count))
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd = HDD(
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                self.submodules.core     = LiteSATACore(self.hdd.phy)
+                self.submodules.crossbar = LiteSATACrossbar(self.core)
+
+                bus = wishbone.Interface(data_width=bus_dw)
+                self.submodules.mem = wishbone.SRAM(0x2000, bus=bus)
+                self.submodules.dma = LiteSATABlock2MemScatterGatherDMA(self.crossbar.get_port(), bus)
+
+        dut = DUT()
+        generators = {
+            "sys" :   [generator(dut),
+                       dut.hdd.link.generator(),
+                       dut.hdd.phy.rx.generator(),
+                       dut.hdd.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
+
+    def test_mem2block_dma(self):
+        bus_dw = 128
+        descriptors = [
+            # sector, count, base
+            (2, 2, 0x0000),
+            (8, 1, 0x1000),
+            (4, 3, 0x0400),
+            (12, 0, 0x1400), # Not executed: failed.
+        ]
+        mem_init = [sum(seed_to_data(i*bus_dw//32 + n) << 32*n for n in range(bus_dw//32))
+            for i in range(0x2000*8//bus_dw)]
+
+        def get_mem_data(base, count):
+            data = []
+            for i in range(count*logical_sector_size*8//bus_dw):
+                word = mem_init[base*8//bus_dw + i]
+                data += [(word >> 32*n) & 0xffffffff for n in range(bus_dw//32)]
+            return data
+
+        def generator(dut):
+            hdd = dut.hdd
+            hdd.malloc(0, 64)
+
+            # Push descriptors
+            for sector, count, base in descriptors:
+                yield dut.dma.desc_sector.storage.eq(sector)
+                yield dut.dma.desc_count.storage.eq(count)
+                yield dut.dma.desc_base.storage.eq(base)
+                yield dut.dma.desc_we.re.eq(1)
+                yield
+                yield dut.dma.desc_we.re.eq(0)
+                yield
+
+            # Wait completions
+            while (yield dut.dma.status_level.status) != len(descriptors):
+                yield
+            for i, (sector, count, base) in enumerate(descriptors):
+                self.assertEqual((yield dut.dma.status_index.status), i)
+                self.assertEqual((yield dut.dma.status_failed.status), count == 0)
+                yield dut.dma.status_ack.re.eq(1)
+                yield
+                yield dut.dma.status_ack.re.eq(0)
+                yield
+
+            # Check HDD
+            for sector, count, base in descriptors:
+                self.assertEqual(hdd.read(sector, count), get_mem_data(base, count))
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd = HDD(
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                self.submodules.core     = LiteSATACore(self.hdd.phy)
+                self.submodules.crossbar = LiteSATACrossbar(self.core)
+
+                bus = wishbone.Interface(data_width=bus_dw)
+                self.submodules.mem = wishbone.SRAM(0x2000, bus=bus, init=mem_init)
+                self.submodules.dma = LiteSATAMem2BlockDMA(self.crossbar.get_port(), bus)
+
+        dut = DUT()
+        generators = {
+            "sys" :   [generator(dut),
+                       dut.hdd.link.generator(),
+                       dut.hdd.phy.rx.generator(),
+                       dut.hdd.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
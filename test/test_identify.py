@@ -0,0 +1,87 @@
+#
+# This file is part of LiteSATA.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+import unittest
+
+from litesata.common import *
+from litesata.core import LiteSATACore
+from litesata.frontend.arbitration import LiteSATACrossbar
+from litesata.frontend.identify import LiteSATAIdentify
+
+from litex.soc.interconnect.stream_sim import *
+
+from test.model.hdd import *
+
+
+class TestIdentify(unittest.TestCase):
+    def test_identify(self):
+        def identify(unit):
+            yield unit.start.eq(1)
+            yield
+            yield unit.start.eq(0)
+            yield
+            while not (yield unit.done):
+                yield
+
+        def generator(dut):
+            # 48 bits LBA, 4KB physical sectors, write cache enabled (32 bits port).
+            yield from identify(dut.identify32)
+            self.assertEqual((yield dut.identify32.valid), 1)
+            self.assertEqual((yield dut.identify32.max_lba), 2**34 - 1)
+            self.assertEqual((yield dut.identify32.gen), 0b111)
+            self.assertEqual((yield dut.identify32.ncq_depth), 32)
+            self.assertEqual((yield dut.identify32.logical_sector_size), 512)
+            self.assertEqual((yield dut.identify32.physical_sector_size), 4096)
+            self.assertEqual((yield dut.identify32.trim), 1)
+            self.assertEqual((yield dut.identify32.write_cache_supported), 1)
+            self.assertEqual((yield dut.identify32.write_cache_enabled), 1)
+
+            # Gen1/Gen2, no NCQ/TRIM, 4KB logical sectors, write cache disabled (64 bits port).
+            dut.hdd.sectors                  = 2**20
+            dut.hdd.gens                     = 0b011
+            dut.hdd.ncq_depth                = 0
+            dut.hdd.logical_sector_words     = 2048
+            dut.hdd.physical_sector_exponent = 0
+            dut.hdd.trim_supported           = False
+            dut.hdd.write_cache              = False
+            yield from identify(dut.identify64)
+            self.assertEqual((yield dut.identify64.valid), 1)
+            self.assertEqual((yield dut.identify64.max_lba), 2**20 - 1)
+            self.assertEqual((yield dut.identify64.gen), 0b011)
+            self.assertEqual((yield dut.identify64.ncq_depth), 0)
+            self.assertEqual((yield dut.identify64.logical_sector_size), 4096)
+            self.assertEqual((yield dut.identify64.physical_sector_size), 4096)
+            self.assertEqual((yield dut.identify64.trim), 0)
+            self.assertEqual((yield dut.identify64.write_cache_enabled), 0)
+
+            # Through a quantum port: identify is forwarded unchanged by the splitter.
+            yield from identify(dut.identify_split)
+            self.assertEqual((yield dut.identify_split.valid), 1)
+            self.assertEqual((yield dut.identify_split.max_lba), 2**20 - 1)
+            self.assertEqual((yield dut.identify_split.logical_sector_size), 4096)
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd = HDD(
+                    link_debug         = False,
+                    link_random_level  = 0,
+                    transport_debug    = False,
+                    transport_loopback = False,
+                    hdd_debug          = False)
+                self.submodules.core       = LiteSATACore(self.hdd.phy)
+                self.submodules.crossbar   = LiteSATACrossbar(self.core)
+                self.submodules.identify32 = LiteSATAIdentify(self.crossbar.get_port())
+                self.submodules.identify64 = LiteSATAIdentify(self.crossbar.get_port(64))
+                self.submodules.identify_split = LiteSATAIdentify(self.crossbar.get_port(max_count=2))
+
+        dut = DUT()
+        generators = {
+            "sys" :   [generator(dut),
+                       dut.hdd.link.generator(),
+                       dut.hdd.phy.rx.generator(),
+                       dut.hdd.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
@@ -13,6 +13,8 @@ from litesata.core.link import LiteSATACRC
 
 from litex.soc.interconnect.stream_sim import *
 
+from test.model.link import compute_crc
+
 class TestLinkCRC(unittest.TestCase):
     def test_link_crc(self):
         def generator(dut):
@@ -50,6 +52,9 @@ class TestLinkCRC(unittest.TestCase):
             self.assertEqual(s, 0)
             self.assertEqual(e, 0)
 
+            # Check Python model
+            self.assertEqual(sim_crc, compute_crc(datas))
+
         class DUT(Module):
             def __init__(self, length, random):
                 self.submodules.crc = LiteSATACRC()
@@ -68,3 +73,20 @@ class TestLinkCRC(unittest.TestCase):
 
         dut = DUT(1024, False)
         run_simulation(dut, generator(dut))
+
+    def test_link_crc_multiword(self):
+        def generator(dut, dw):
+            datas = []
+            yield dut.ce.eq(1)
+            for i in range(256):
+                words = [seed_to_data(i*dw//32 + n) for n in range(dw//32)]
+                datas += words
+                yield dut.data.eq(sum(w << 32*n for n, w in enumerate(words)))
+                yield
+            yield dut.ce.eq(0)
+            yield
+            self.assertEqual((yield dut.value), compute_crc(datas))
+
+        for dw in [64, 128]:
+            dut = LiteSATACRC(dw)
+            run_simulation(dut, generator(dut, dw))
@@ -12,6 +12,8 @@ from litesata.core.link import Scrambler
 
 from litex.soc.interconnect.stream_sim import *
 
+from test.model.link import import_scrambler_datas
+
 
 class TestLinkScrambler(unittest.TestCase):
     def test_link_scrambler(self):
@@ -43,6 +45,9 @@ class TestLinkScrambler(unittest.TestCase):
             self.assertEqual(s, 0)
             self.assertEqual(e, 0)
 
+            # Check Python model
+            self.assertEqual(sim_values, import_scrambler_datas()[:dut.length])
+
         class DUT(Module):
             def __init__(self, length):
                 self.submodules.scrambler = ResetInserter()(Scrambler())
@@ -63,3 +68,18 @@ class TestLinkScrambler(unittest.TestCase):
         }
         clocks = {"sys": 10}
         run_simulation(dut, generators, clocks)
+
+    def test_link_scrambler_multiword(self):
+        def generator(dut, dw):
+            yield dut.ce.eq(1)
+            yield
+            sim_values = []
+            for i in range(256):
+                value = (yield dut.value)
+                sim_values += [(value >> 32*n) & 0xffffffff for n in range(dw//32)]
+                yield
+            self.assertEqual(sim_values, import_scrambler_datas()[:len(sim_values)])
+
+        for dw in [64, 128]:
+            dut = Scrambler(dw)
+            run_simulation(dut, generator(dut, dw))
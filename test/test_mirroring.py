@@ -10,7 +10,7 @@ from litesata.common import *
 from litesata.core import LiteSATACore
 from litesata.frontend.arbitration import LiteSATACrossbar
 from litesata.frontend.bist import LiteSATABISTGenerator, LiteSATABISTChecker
-from litesata.frontend.raid import LiteSATAMirroring
+from litesata.frontend.raid import LiteSATAMirroring, LiteSATAMirroredVolume
 
 from litex.soc.interconnect.stream_sim import *
 
@@ -97,3 +97,365 @@ class TestMirroring(unittest.TestCase):
         }
         clocks = {"sys": 10}
         run_simulation(dut, generators, clocks)
+
+    def test_mirrored_volume(self):
+        stripe_sectors = 2
+        reads = [0, 0]
+        def generator(dut):
+            dut.hdd0.malloc(0, 64)
+            dut.hdd1.malloc(0, 64)
+            sector = 1
+            count  = 6
+
+            # Write data (mirrored)
+            yield dut.generator.sector.eq(sector)
+            yield dut.generator.count.eq(count)
+            yield dut.generator.start.eq(1)
+            yield
+            yield dut.generator.start.eq(0)
+            yield
+            while not (yield dut.generator.done):
+                yield
+            self.assertEqual((yield dut.generator.aborted), 0)
+            self.assertEqual(dut.hdd0.read(sector, count), dut.hdd1.read(sector, count))
+
+            for healthy in [0b11, 0b01]:
+                yield dut.volume.healthy.eq(healthy)
+
+                # Verify data (balanced reads)
+                yield dut.checker.sector.eq(sector)
+                yield dut.checker.count.eq(count)
+                yield dut.checker.start.eq(1)
+                yield
+                yield dut.checker.start.eq(0)
+                yield
+                while not (yield dut.checker.done):
+                    yield
+                errors = (yield dut.checker.errors)
+                print("errors {} / reads {}".format(errors, reads))
+                self.assertEqual((yield dut.checker.aborted), 0)
+                self.assertEqual(errors, 0)
+
+            # 4 chunks: spread on the 2 HDDs, then on hdd0 only.
+            self.assertEqual(reads, [2 + 4, 2])
+
+        @passive
+        def reads_monitor(dut):
+            while True:
+                for i, core in enumerate([dut.core0, dut.core1]):
+                    if ((yield core.sink.valid) and (yield core.sink.ready) and (yield core.sink.read)):
+                        reads[i] += 1
+                yield
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd0 = HDD(n=0,
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                self.submodules.core0 = LiteSATACore(self.hdd0.phy)
+
+                self.submodules.hdd1 = HDD(n=1,
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                self.submodules.core1 = LiteSATACore(self.hdd1.phy)
+
+                self.submodules.volume   = LiteSATAMirroredVolume([self.core0, self.core1], stripe_sectors)
+                self.submodules.crossbar = LiteSATACrossbar(self.volume)
+
+                self.submodules.generator = LiteSATABISTGenerator(self.crossbar.get_port())
+                self.submodules.checker   = LiteSATABISTChecker(self.crossbar.get_port())
+
+        dut = DUT()
+        generators = {
+            "sys" :   [generator(dut),
+                       reads_monitor(dut),
+                       dut.hdd0.link.generator(),
+                       dut.hdd0.phy.rx.generator(),
+                       dut.hdd0.phy.tx.generator(),
+                       dut.hdd1.link.generator(),
+                       dut.hdd1.phy.rx.generator(),
+                       dut.hdd1.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
+
+    def mirroring_write_stall_test(self, with_write_queues):
+        stall = [0]
+        def generator(dut):
+            dut.hdd0.malloc(0, 64)
+            dut.hdd1.malloc(0, 64)
+
+            # Write data to read on port0.
+            yield dut.generator0.sector.eq(16)
+            yield dut.generator0.count.eq(4)
+            yield dut.generator0.start.eq(1)
+            yield
+            yield dut.generator0.start.eq(0)
+            yield
+            while not (yield dut.generator0.done):
+                yield
+
+            # Read on port0 / write on port1 concurrently.
+            yield dut.checker0.sector.eq(16)
+            yield dut.checker0.count.eq(4)
+            yield dut.checker0.start.eq(1)
+            yield
+            yield dut.checker0.start.eq(0)
+            for i in range(64):
+                yield
+            stall[0] = 0
+            yield dut.generator1.sector.eq(0)
+            yield dut.generator1.count.eq(2)
+            yield dut.generator1.start.eq(1)
+            yield
+            yield dut.generator1.start.eq(0)
+            yield
+            while not (yield dut.checker0.done) or not (yield dut.generator1.done):
+                yield
+            self.assertEqual((yield dut.checker0.errors), 0)
+            self.assertEqual((yield dut.generator1.aborted), 0)
+
+            # Verify data on the 2 hdds in //
+            for checker in [dut.checker0, dut.checker1]:
+                yield checker.sector.eq(0)
+                yield checker.count.eq(2)
+                yield checker.start.eq(1)
+            yield
+            for checker in [dut.checker0, dut.checker1]:
+                yield checker.start.eq(0)
+            yield
+            while not (yield dut.checker0.done) or not (yield dut.checker1.done):
+                yield
+            errors = (yield dut.checker0.errors) + (yield dut.checker1.errors)
+            print("errors {} / write stall cycles {}".format(errors, stall[0]))
+            self.assertEqual(errors, 0)
+
+        @passive
+        def stall_monitor(dut):
+            sink = dut.mirroring.ports[1].sink
+            while True:
+                if ((yield sink.valid) and not (yield sink.ready) and (yield sink.write)):
+                    stall[0] += 1
+                yield
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd0 = HDD(n=0,
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                self.submodules.core0 = LiteSATACore(self.hdd0.phy)
+
+                self.submodules.hdd1 = HDD(n=1,
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                self.submodules.core1 = LiteSATACore(self.hdd1.phy)
+
+                self.submodules.mirroring = LiteSATAMirroring([self.core0, self.core1],
+                    with_write_queues=with_write_queues)
+
+                self.submodules.crossbar0  = LiteSATACrossbar(self.mirroring.ports[0])
+                self.submodules.generator0 = LiteSATABISTGenerator(self.crossbar0.get_port())
+                self.submodules.checker0   = LiteSATABISTChecker(self.crossbar0.get_port())
+
+                self.submodules.crossbar1  = LiteSATACrossbar(self.mirroring.ports[1])
+                self.submodules.generator1 = LiteSATABISTGenerator(self.crossbar1.get_port())
+                self.submodules.checker1   = LiteSATABISTChecker(self.crossbar1.get_port())
+
+        dut = DUT()
+        generators = {
+            "sys" :   [generator(dut),
+                       stall_monitor(dut),
+                       dut.hdd0.link.generator(),
+                       dut.hdd0.phy.rx.generator(),
+                       dut.hdd0.phy.tx.generator(),
+                       dut.hdd1.link.generator(),
+                       dut.hdd1.phy.rx.generator(),
+                       dut.hdd1.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
+        return stall[0]
+
+    def test_mirroring_write_queues(self):
+        # A write on port1 during a read on port0 is queued instead of waiting for the read to
+        # complete (and for all the HDDs to be idle).
+        blocking_stall = self.mirroring_write_stall_test(with_write_queues=False)
+        queued_stall   = self.mirroring_write_stall_test(with_write_queues=True)
+        print("write stall cycles: {} (blocking) / {} (write queues)".format(blocking_stall, queued_stall))
+        self.assertLess(queued_stall, blocking_stall)
+
+    def test_mirroring_write_queues_read_after_write(self):
+        write_data = [seed_to_data(i) for i in range(sectors2dwords(1))]
+        read_data  = []
+
+        def command(sink, write, sector, count, data=[0]):
+            for i, d in enumerate(data):
+                yield sink.valid.eq(1)
+                yield sink.write.eq(write)
+                yield sink.read.eq(not write)
+                yield sink.sector.eq(sector)
+                yield sink.count.eq(count)
+                yield sink.last.eq(i == (len(data) - 1))
+                yield sink.data.eq(d)
+                yield
+                while not (yield sink.ready):
+                    yield
+            yield sink.valid.eq(0)
+
+        def generator(dut):
+            dut.hdd0.malloc(0, 64)
+            dut.hdd1.malloc(0, 64)
+            sink = dut.mirroring.ports[1].sink
+
+            # Keep controller1 busy with a read, then write and read the same sector on port1
+            # (without waiting for the write response): the write is queued on controller1.
+            yield from command(sink, 0, 32, 8)
+            yield from command(sink, 1, 0, 1, write_data)
+            self.assertLess(len(read_data), sectors2dwords(8))
+            yield from command(sink, 0, 0, 1)
+            while len(read_data) < sectors2dwords(9):
+                yield
+            self.assertEqual(read_data[sectors2dwords(8):], write_data)
+
+        @passive
+        def read_monitor(dut):
+            source = dut.mirroring.ports[1].source
+            yield source.ready.eq(1)
+            while True:
+                if (yield source.valid) and (yield source.read) and not (yield source.end):
+                    read_data.append((yield source.data))
+                yield
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd0 = HDD(n=0,
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                self.submodules.core0 = LiteSATACore(self.hdd0.phy)
+
+                self.submodules.hdd1 = HDD(n=1,
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                self.submodules.core1 = LiteSATACore(self.hdd1.phy)
+
+                self.submodules.mirroring = LiteSATAMirroring([self.core0, self.core1],
+                    with_write_queues=True)
+
+        dut = DUT()
+        generators = {
+            "sys" :   [generator(dut),
+                       read_monitor(dut),
+                       dut.hdd0.link.generator(),
+                       dut.hdd0.phy.rx.generator(),
+                       dut.hdd0.phy.tx.generator(),
+                       dut.hdd1.link.generator(),
+                       dut.hdd1.phy.rx.generator(),
+                       dut.hdd1.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
+
+    def mirroring_flush_test(self, frontend):
+        responses = []
+
+        def command(port, **fields):
+            yield port.sink.valid.eq(1)
+            yield port.sink.last.eq(1)
+            for name, value in fields.items():
+                yield getattr(port.sink, name).eq(value)
+            yield
+            while not (yield port.sink.ready):
+                yield
+            yield port.sink.valid.eq(0)
+            for name in fields:
+                yield getattr(port.sink, name).eq(0)
+            while len(responses) == 0:
+                yield
+            # Only one (combined) response.
+            for i in range(128):
+                yield
+            self.assertEqual(len(responses), 1)
+            return responses.pop(0)
+
+        def generator(dut):
+            dut.hdd0.malloc(0, 64)
+            dut.hdd1.malloc(0, 64)
+
+            # Flush / write cache control are sent to the 2 hdds.
+            response = yield from command(dut.port, flush=1)
+            self.assertEqual(response, (0, 1, 0))
+            self.assertEqual((dut.hdd0.flushes, dut.hdd1.flushes), (1, 1))
+            response = yield from command(dut.port, set_features=1,
+                features=set_features["DISABLE_WRITE_CACHE"])
+            self.assertEqual(response, (0, 1, 0))
+            self.assertEqual((dut.hdd0.write_cache, dut.hdd1.write_cache), (False, False))
+
+        @passive
+        def response_monitor(port):
+            yield port.source.ready.eq(1)
+            while True:
+                if (yield port.source.valid):
+                    responses.append(((yield port.source.write), (yield port.source.end),
+                        (yield port.source.failed)))
+                yield
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd0 = HDD(n=0,
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                self.submodules.core0 = LiteSATACore(self.hdd0.phy)
+
+                self.submodules.hdd1 = HDD(n=1,
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                self.submodules.core1 = LiteSATACore(self.hdd1.phy)
+
+                self.submodules.frontend = frontend([self.core0, self.core1])
+                self.submodules.crossbar = LiteSATACrossbar(getattr(self.frontend, "ports",
+                    [self.frontend])[0])
+                self.port = self.crossbar.get_port()
+
+        dut = DUT()
+        generators = {
+            "sys" :   [generator(dut),
+                       response_monitor(dut.port),
+                       dut.hdd0.link.generator(),
+                       dut.hdd0.phy.rx.generator(),
+                       dut.hdd0.phy.tx.generator(),
+                       dut.hdd1.link.generator(),
+                       dut.hdd1.phy.rx.generator(),
+                       dut.hdd1.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
+
+    def test_mirroring_flush(self):
+        self.mirroring_flush_test(LiteSATAMirroring)
+        self.mirroring_flush_test(lambda controllers: LiteSATAMirroring(controllers,
+            with_write_queues=True))
+        self.mirroring_flush_test(LiteSATAMirroredVolume)
@@ -0,0 +1,89 @@
+#
+# This file is part of LiteSATA.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+import unittest
+
+from litesata.common import *
+from litesata.core import LiteSATACore
+from litesata.frontend.arbitration import LiteSATACrossbar
+from litesata.frontend.bist import LiteSATABISTGenerator
+from litesata.frontend.monitor import LiteSATALatencyMonitor
+
+from litex.soc.interconnect.stream_sim import *
+
+from test.model.hdd import *
+
+
+class TestMonitor(unittest.TestCase):
+    def test_latency_monitor(self):
+        def main_generator(dut):
+            dut.hdd.malloc(0, 64)
+            latencies = []
+            for i in range(3):
+                yield dut.generator.sector.eq(i)
+                yield dut.generator.count.eq(i + 1)
+                yield dut.generator.start.eq(1)
+                yield
+                yield dut.generator.start.eq(0)
+                yield
+                cycles = 1
+                while not (yield dut.generator.done):
+                    cycles += 1
+                    yield
+                latencies.append(cycles)
+            for i in range(4):
+                yield
+
+            # Check results
+            count   = (yield dut.monitor.count.status)
+            latency = (yield dut.monitor.max.status)
+            buckets = []
+            for i in range(32):
+                yield dut.monitor.bucket.storage.eq(i)
+                yield
+                yield
+                buckets.append((yield dut.monitor.bucket_value.status))
+            self.assertEqual(count, 3)
+            self.assertEqual(sum(buckets), 3)
+            self.assertLessEqual(latency, latencies[-1])
+            self.assertGreater(latency, latencies[-1] - 8)
+            self.assertGreaterEqual(buckets[latency.bit_length() - 1], 1)
+
+            # Clear
+            yield dut.monitor.clear.re.eq(1)
+            yield
+            yield dut.monitor.clear.re.eq(0)
+            for i in range(40):
+                yield
+            self.assertEqual((yield dut.monitor.count.status), 0)
+            for i in range(32):
+                yield dut.monitor.bucket.storage.eq(i)
+                yield
+                yield
+                self.assertEqual((yield dut.monitor.bucket_value.status), 0)
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd = HDD(
+                    link_debug         = False,
+                    link_random_level  = 0,
+                    transport_debug    = False,
+                    transport_loopback = False,
+                    hdd_debug          = False)
+                self.submodules.core      = LiteSATACore(self.hdd.phy)
+                self.submodules.crossbar  = LiteSATACrossbar(self.core)
+                port = self.crossbar.get_port()
+                self.submodules.generator = LiteSATABISTGenerator(port)
+                self.submodules.monitor   = LiteSATALatencyMonitor(port)
+
+        dut = DUT()
+        generators = {
+            "sys" : [main_generator(dut),
+                       dut.hdd.link.generator(),
+                       dut.hdd.phy.rx.generator(),
+                       dut.hdd.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
@@ -0,0 +1,120 @@
+#
+# This file is part of LiteSATA.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+import unittest
+
+from litesata.common import *
+from litesata.core import LiteSATACore
+from litesata.frontend.prefetch import LiteSATAPrefetcher
+
+from litex.soc.interconnect.stream_sim import *
+
+from test.model.hdd import *
+
+
+class TestPrefetch(unittest.TestCase):
+    def test_prefetch(self):
+        def command(dut, sector, count, data=None, trim=0):
+            sink, source = dut.prefetcher.sink, dut.prefetcher.source
+            cycles = 0
+            words  = [None] if data is None else data
+            for i, word in enumerate(words):
+                yield sink.valid.eq(1)
+                yield sink.write.eq(data is not None and not trim)
+                yield sink.trim.eq(trim)
+                yield sink.read.eq(data is None)
+                yield sink.sector.eq(sector)
+                yield sink.count.eq(count)
+                yield sink.data.eq(0 if word is None else word)
+                yield sink.last.eq(i == (len(words) - 1))
+                yield
+                cycles += 1
+                while not (yield sink.ready):
+                    cycles += 1
+                    yield
+            yield sink.valid.eq(0)
+            yield source.ready.eq(1)
+            rd_data = []
+            while True:
+                yield
+                cycles += 1
+                if (yield source.valid):
+                    if (yield source.end):
+                        self.assertEqual((yield source.failed), 0)
+                        break
+                    rd_data.append((yield source.data))
+            yield source.ready.eq(0)
+            yield
+            if data is None:
+                self.assertEqual(rd_data, dut.hdd.read(sector, count))
+            return cycles
+
+        def counters(dut):
+            return ((yield dut.prefetcher.useful.status), (yield dut.prefetcher.wasted.status))
+
+        def generator(dut):
+            dut.hdd.malloc(0, 64)
+            for sector in range(64):
+                dut.hdd.write(sector, [seed_to_data(sector*1024 + i) for i in range(sectors2dwords(1))])
+
+            # Sequential stream of 1-sector reads: 0 is forwarded, 1 is prefetched with 2-16,
+            # 17-32 are read ahead once 16 is served.
+            latencies = []
+            for sector in range(20):
+                latencies.append((yield from command(dut, sector, 1)))
+            print("read latencies: {}".format(latencies))
+            self.assertLess(max(latencies[2:16]), latencies[0])
+            self.assertEqual((yield from counters(dut)), (19, 0))
+
+            # Random read: forwarded, tracked as a new stream.
+            yield from command(dut, 40, 1)
+            self.assertEqual((yield from counters(dut)), (19, 0))
+
+            # Write in the read ahead buffer: 13 prefetched sectors (20-32) are discarded.
+            yield from command(dut, 20, 1, [seed_to_data(i) for i in range(sectors2dwords(1))])
+            self.assertEqual((yield from counters(dut)), (19, 13))
+
+            # Stream continues with the written data.
+            yield from command(dut, 20, 1)
+            yield from command(dut, 21, 2)
+            self.assertEqual((yield from counters(dut)), (22, 13))
+
+            # Hits on a stream are served while the other stream is read ahead.
+            yield from command(dut, 41, 1)  # Sequential: 41-56 prefetched.
+            yield from command(dut, 22, 14) # Consumes 20-35: 36-51 read ahead.
+            blocked = (yield dut.prefetcher.blocked.status)
+            latency = yield from command(dut, 42, 1)
+            self.assertLess(latency, latencies[0])
+            self.assertEqual((yield dut.prefetcher.blocked.status), blocked)
+            yield from command(dut, 36, 1)  # Waits for the read ahead.
+            self.assertGreater((yield dut.prefetcher.blocked.status), blocked)
+            self.assertEqual((yield from counters(dut)), (39, 13))
+
+            # Trim (1 block, range 60-60): all the buffers are discarded (15 + 14 sectors).
+            block = [60, 1 << 16] + [0]*(sectors2dwords(1) - 2)
+            yield from command(dut, 0, 1, block, trim=1)
+            self.assertEqual(dut.hdd.trimmed, [(60, 1)])
+            self.assertEqual((yield from counters(dut)), (39, 42))
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd = HDD(
+                    link_debug         = False,
+                    link_random_level  = 0,
+                    transport_debug    = False,
+                    transport_loopback = False,
+                    hdd_debug          = False)
+                self.submodules.core       = LiteSATACore(self.hdd.phy)
+                self.submodules.prefetcher = LiteSATAPrefetcher(self.core, nstreams=2, prefetch_sectors=16)
+
+        dut = DUT()
+        generators = {
+            "sys" :   [generator(dut),
+                       dut.hdd.link.generator(),
+                       dut.hdd.phy.rx.generator(),
+                       dut.hdd.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
@@ -0,0 +1,175 @@
+#
+# This file is part of LiteSATA.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+import unittest
+
+from litesata.common import *
+from litesata.core import LiteSATACore
+from litesata.frontend.raid import LiteSATARAID5
+
+from litex.soc.interconnect.stream_sim import *
+
+from test.model.hdd import *
+
+
+def send_write(sink, sector, words, dw):
+    count = len(words)//sectors2dwords(1)
+    for i, word in enumerate(words):
+        yield sink.valid.eq(1)
+        yield sink.write.eq(1)
+        yield sink.read.eq(0)
+        yield sink.sector.eq(sector)
+        yield sink.count.eq(count)
+        yield sink.data.eq(sum(w << (k*dw) for k, w in enumerate(word)))
+        yield sink.last.eq(i == (len(words) - 1))
+        yield
+        while not (yield sink.ready):
+            yield
+    yield sink.valid.eq(0)
+
+
+def send_read(sink, sector, count):
+    yield sink.valid.eq(1)
+    yield sink.write.eq(0)
+    yield sink.read.eq(1)
+    yield sink.sector.eq(sector)
+    yield sink.count.eq(count)
+    yield sink.last.eq(1)
+    yield
+    while not (yield sink.ready):
+        yield
+    yield sink.valid.eq(0)
+
+
+def receive(source, nwords, dw, words, failed):
+    yield source.ready.eq(1)
+    while True:
+        yield
+        if (yield source.valid):
+            if (yield source.end):
+                failed.append((yield source.failed))
+                break
+            data = (yield source.data)
+            words.append([(data >> (k*dw)) & (2**dw - 1) for k in range(nwords)])
+    yield source.ready.eq(0)
+
+
+class TestRAID5(unittest.TestCase):
+    def test_raid5(self):
+        n              = 3
+        dw             = 32
+        stripe_sectors = 2
+        sector         = 1
+        count          = 6 # chunks 0 to 3: parity on hdd0, hdd1, hdd2, hdd0.
+        cycles         = [0]
+
+        def generator(dut):
+            for hdd in dut.hdds:
+                hdd.malloc(0, 64)
+
+            def write(words):
+                start = cycles[0]
+                failed = []
+                yield from send_write(dut.raid5.sink, sector, words, dw)
+                yield from receive(dut.raid5.source, n-1, dw, [], failed)
+                self.assertEqual(failed, [0])
+                return cycles[0] - start
+
+            def read():
+                start = cycles[0]
+                words, failed = [], []
+                yield from send_read(dut.raid5.sink, sector, count)
+                yield from receive(dut.raid5.source, n-1, dw, words, failed)
+                self.assertEqual(failed, [0])
+                return words, cycles[0] - start
+
+            words = [[seed_to_data(i*(n-1) + k) for k in range(n-1)]
+                for i in range(count*sectors2dwords(1))]
+
+            # Full-stripe writes
+            write_cycles = yield from write(words)
+
+            # Verify data words and rotating parity on the HDDs.
+            for s in range(count):
+                p = ((sector + s)//stripe_sectors) % n
+                datas = [hdd.read(sector + s, 1) for hdd in dut.hdds[:n]]
+                for j in range(sectors2dwords(1)):
+                    word = words[s*sectors2dwords(1) + j]
+                    for i in range(n):
+                        if i == p:
+                            self.assertEqual(datas[i][j], word[0] ^ word[1])
+                        else:
+                            self.assertEqual(datas[i][j], word[i if i < p else i-1])
+
+            # Reads
+            rd_words, read_cycles = yield from read()
+            self.assertEqual(rd_words, words)
+
+            # Degraded reads (hdd1 excluded): data words of hdd1 are reconstructed.
+            yield dut.raid5.healthy.eq(0b101)
+            rd_words, _ = yield from read()
+            self.assertEqual(rd_words, words)
+
+            # Degraded writes (hdd1 excluded) then reads.
+            words = [[seed_to_data(i*(n-1) + k + 1) for k in range(n-1)]
+                for i in range(count*sectors2dwords(1))]
+            yield from write(words)
+            rd_words, _ = yield from read()
+            self.assertEqual(rd_words, words)
+
+            # Single HDD reference: same sector count (half the data).
+            start = cycles[0]
+            yield from send_write(dut.core.sink, sector, [[w[0]] for w in words], dw)
+            yield from receive(dut.core.source, 1, dw, [], [])
+            single_write_cycles = cycles[0] - start
+            start = cycles[0]
+            yield from send_read(dut.core.sink, sector, count)
+            yield from receive(dut.core.source, 1, dw, [], [])
+            single_read_cycles = cycles[0] - start
+
+            nbytes = count*logical_sector_size
+            raid5_write_rate  = (n-1)*nbytes/write_cycles
+            raid5_read_rate   = (n-1)*nbytes/read_cycles
+            single_write_rate = nbytes/single_write_cycles
+            single_read_rate  = nbytes/single_read_cycles
+            print("writes: {:.2f} bytes/cycle (single HDD: {:.2f})".format(raid5_write_rate, single_write_rate))
+            print("reads:  {:.2f} bytes/cycle (single HDD: {:.2f})".format(raid5_read_rate, single_read_rate))
+            self.assertGreater(raid5_write_rate, single_write_rate)
+            self.assertGreater(raid5_read_rate, single_read_rate)
+
+        @passive
+        def cycles_counter():
+            while True:
+                cycles[0] += 1
+                yield
+
+        class DUT(Module):
+            def __init__(self):
+                self.hdds = []
+                cores     = []
+                for i in range(n + 1):
+                    hdd = HDD(n=i,
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                    core = LiteSATACore(hdd.phy)
+                    self.submodules += hdd, core
+                    self.hdds.append(hdd)
+                    cores.append(core)
+
+                self.submodules.raid5 = LiteSATARAID5(cores[:n], stripe_sectors)
+                self.core = cores[n]
+
+        dut = DUT()
+        generators = {
+            "sys" :   [generator(dut), cycles_counter()] +
+                      [hdd.link.generator()   for hdd in dut.hdds] +
+                      [hdd.phy.rx.generator() for hdd in dut.hdds] +
+                      [hdd.phy.tx.generator() for hdd in dut.hdds]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
@@ -0,0 +1,224 @@
+#
+# This file is part of LiteSATA.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+import unittest
+
+from litesata.common import *
+from litesata.core import LiteSATACore
+from litesata.frontend.arbitration import LiteSATACrossbar
+from litesata.frontend.streaming import LiteSATAStreamRecorder, LiteSATAStreamPlayer
+
+from litex.soc.interconnect import wishbone
+
+from litex.soc.interconnect.stream_sim import *
+
+from test.model.hdd import *
+
+
+class TestStreaming(unittest.TestCase):
+    def test_stream_recorder(self):
+        bus_dw       = 64
+        ring_size    = 4*logical_sector_size
+        sector_start = 4
+        sector_count = 6
+        nsectors     = 8
+        stream_data  = [seed_to_data(i) for i in range(sectors2dwords(nsectors))]
+
+        def generator(dut):
+            hdd = dut.hdd
+            hdd.malloc(0, 64)
+
+            # Start recording
+            yield dut.recorder.sector_start.storage.eq(sector_start)
+            yield dut.recorder.sector_count.storage.eq(sector_count)
+            yield dut.recorder.enable.storage.eq(1)
+            yield dut.recorder.enable.re.eq(1)
+            yield
+            yield dut.recorder.enable.re.eq(0)
+            yield
+
+            # Stream (1 dword every 4 cycles)
+            for data in stream_data:
+                yield dut.recorder.sink.valid.eq(1)
+                yield dut.recorder.sink.data.eq(data)
+                yield
+                while not (yield dut.recorder.sink.ready):
+                    yield
+                yield dut.recorder.sink.valid.eq(0)
+                for i in range(3):
+                    yield
+
+            # Stop recording, wait for the ring to be written.
+            yield dut.recorder.enable.storage.eq(0)
+            yield dut.recorder.enable.re.eq(1)
+            yield
+            yield dut.recorder.enable.re.eq(0)
+            while (yield dut.recorder.bytes_written.status) != nsectors*logical_sector_size:
+                yield
+            self.assertEqual((yield dut.recorder.overflow.status), 0)
+            self.assertEqual((yield dut.recorder.errors.status), 0)
+            high_watermark = (yield dut.recorder.high_watermark.status)
+            print("high watermark: {} bytes".format(high_watermark))
+            self.assertGreater(high_watermark, 0)
+            self.assertLessEqual(high_watermark, ring_size)
+
+            # Check HDD: sectors 0-5 in the window, 6-7 wrapped at its start (over 0-1).
+            for i in range(nsectors - sector_count, nsectors):
+                sector = sector_start + i%sector_count
+                self.assertEqual(hdd.read(sector, 1),
+                    stream_data[sectors2dwords(i):sectors2dwords(i + 1)])
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd = HDD(
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                self.submodules.core     = LiteSATACore(self.hdd.phy)
+                self.submodules.crossbar = LiteSATACrossbar(self.core)
+
+                bus = wishbone.Interface(data_width=bus_dw)
+                self.submodules.mem      = wishbone.SRAM(ring_size, bus=bus)
+                self.submodules.recorder = LiteSATAStreamRecorder(self.crossbar.get_port(), bus,
+                    ring_base = 0,
+                    ring_size = ring_size,
+                    max_count = 2)
+
+        dut = DUT()
+        generators = {
+            "sys" :   [generator(dut),
+                       dut.hdd.link.generator(),
+                       dut.hdd.phy.rx.generator(),
+                       dut.hdd.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
+
+    def test_stream_player(self):
+        bus_dw       = 64
+        ring_size    = 4*logical_sector_size
+        sector_start = 4
+        sector_count = 6
+        period       = 4
+        sectors_data = [seed_to_data(i) for i in range(sectors2dwords(sector_count))]
+
+        def generator(dut):
+            hdd = dut.hdd
+            hdd.malloc(0, 64)
+            hdd.write(sector_start, sectors_data)
+
+            # Start playback
+            yield dut.player.sector_start.storage.eq(sector_start)
+            yield dut.player.sector_count.storage.eq(sector_count)
+            yield dut.player.period.storage.eq(period)
+            yield dut.player.enable.storage.eq(1)
+            yield dut.player.enable.re.eq(1)
+            yield
+            yield dut.player.enable.re.eq(0)
+            yield
+
+            # Receive stream (always ready, paced by the player)
+            yield dut.player.source.ready.eq(1)
+            stream_data = []
+            cycles      = []
+            cycle       = 0
+            while len(stream_data) < len(sectors_data):
+                if (yield dut.player.source.valid):
+                    stream_data.append((yield dut.player.source.data))
+                    cycles.append(cycle)
+                cycle += 1
+                yield
+            yield
+            self.assertEqual(stream_data, sectors_data)
+            self.assertEqual(min(b - a for a, b in zip(cycles[:-1], cycles[1:])), period)
+            self.assertEqual((yield dut.player.underruns.status), 0)
+            self.assertEqual((yield dut.player.errors.status), 0)
+            self.assertEqual((yield dut.player.bytes_read.status), sector_count*logical_sector_size)
+            self.assertEqual((yield dut.player.done.status), 1)
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd = HDD(
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                self.submodules.core     = LiteSATACore(self.hdd.phy)
+                self.submodules.crossbar = LiteSATACrossbar(self.core)
+
+                bus = wishbone.Interface(data_width=bus_dw)
+                self.submodules.mem      = wishbone.SRAM(ring_size, bus=bus)
+                self.submodules.player   = LiteSATAStreamPlayer(self.crossbar.get_port(), bus,
+                    ring_base = 0,
+                    ring_size = ring_size,
+                    max_count = 2)
+
+        dut = DUT()
+        generators = {
+            "sys" :   [generator(dut),
+                       dut.hdd.link.generator(),
+                       dut.hdd.phy.rx.generator(),
+                       dut.hdd.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
+
+    def test_stream_player_errors(self):
+        bus_dw      = 64
+        ring_size   = 4*logical_sector_size
+        max_retries = 2
+
+        def generator(dut):
+            hdd = dut.hdd
+            hdd.malloc(0, 64)
+            hdd.set_data_error_injection(1)
+
+            # Start playback: all the reads fail.
+            yield dut.player.sector_start.storage.eq(4)
+            yield dut.player.sector_count.storage.eq(4)
+            yield dut.player.enable.storage.eq(1)
+            yield dut.player.enable.re.eq(1)
+            yield
+            yield dut.player.enable.re.eq(0)
+            yield dut.player.source.ready.eq(1)
+            yield
+            while not (yield dut.player.done.status):
+                self.assertEqual((yield dut.player.source.valid), 0)
+                yield
+            self.assertEqual((yield dut.player.aborted.status), 1)
+            self.assertEqual((yield dut.player.errors.status), max_retries + 1)
+            self.assertEqual((yield dut.player.bytes_read.status), 0)
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd = HDD(
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                self.submodules.core     = LiteSATACore(self.hdd.phy)
+                self.submodules.crossbar = LiteSATACrossbar(self.core)
+
+                bus = wishbone.Interface(data_width=bus_dw)
+                self.submodules.mem      = wishbone.SRAM(ring_size, bus=bus)
+                self.submodules.player   = LiteSATAStreamPlayer(self.crossbar.get_port(), bus,
+                    ring_base   = 0,
+                    ring_size   = ring_size,
+                    max_count   = 2,
+                    max_retries = max_retries)
+
+        dut = DUT()
+        generators = {
+            "sys" :   [generator(dut),
+                       dut.hdd.link.generator(),
+                       dut.hdd.phy.rx.generator(),
+                       dut.hdd.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
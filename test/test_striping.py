@@ -10,7 +10,8 @@ from litesata.common import *
 from litesata.core import LiteSATACore
 from litesata.frontend.arbitration import LiteSATACrossbar
 from litesata.frontend.bist import LiteSATABISTGenerator, LiteSATABISTChecker
-from litesata.frontend.raid import LiteSATAStriping
+from litesata.frontend.raid import LiteSATAStriping, LiteSATAChunkedStriping
+from litesata.frontend.trim import LiteSATATrim
 
 from litex.soc.interconnect.stream_sim import *
 
@@ -87,3 +88,115 @@ class TestStriping(unittest.TestCase):
         }
         clocks = {"sys": 10}
         run_simulation(dut, generators, clocks)
+
+    def test_chunked_striping(self):
+        stripe_sectors = 4
+        def generator(dut):
+            dut.hdd0.malloc(0, 64)
+            dut.hdd1.malloc(0, 64)
+            # sector, count: chunk boundary crossing, several chunks on a HDD.
+            for sector, count in [(3, 2), (6, 7)]:
+                # Write data
+                yield dut.generator.sector.eq(sector)
+                yield dut.generator.count.eq(count)
+                yield dut.generator.start.eq(1)
+                yield
+                yield dut.generator.start.eq(0)
+                yield
+                while not (yield dut.generator.done):
+                    yield
+                self.assertEqual((yield dut.generator.aborted), 0)
+
+                # Verify data
+                yield dut.checker.sector.eq(sector)
+                yield dut.checker.count.eq(count)
+                yield dut.checker.start.eq(1)
+                yield
+                yield dut.checker.start.eq(0)
+                yield
+                while not (yield dut.checker.done):
+                    yield
+                errors = (yield dut.checker.errors)
+                print("errors {}".format((yield dut.checker.errors)))
+                self.assertEqual((yield dut.checker.aborted), 0)
+                self.assertEqual(errors, 0)
+
+            # Verify placement: sectors [6, 13) are chunks 1 (hdd1), 2 (hdd0) and 3 (hdd1).
+            self.assertNotEqual(dut.hdd1.read(2, 2), [0]*sectors2dwords(2))
+            self.assertNotEqual(dut.hdd0.read(4, 4), [0]*sectors2dwords(4))
+            self.assertNotEqual(dut.hdd1.read(4, 1), [0]*sectors2dwords(1))
+            self.assertEqual(dut.hdd0.read(8, 1), [0]*sectors2dwords(1))
+
+            # Trim: not supported, rejected.
+            yield dut.trim.sink.valid.eq(1)
+            yield dut.trim.sink.sector.eq(0)
+            yield dut.trim.sink.count.eq(4)
+            yield dut.trim.sink.last.eq(1)
+            yield
+            while not (yield dut.trim.sink.ready):
+                yield
+            yield dut.trim.sink.valid.eq(0)
+            while (yield dut.trim.commands.status) != 1:
+                yield
+            self.assertEqual((yield dut.trim.errors.status), 1)
+            self.assertEqual(dut.hdd0.trimmed + dut.hdd1.trimmed, [])
+
+            # Flush: sent to all the HDDs, single response.
+            yield dut.port.source.ready.eq(1)
+            yield dut.port.sink.valid.eq(1)
+            yield dut.port.sink.flush.eq(1)
+            yield dut.port.sink.last.eq(1)
+            yield
+            while not (yield dut.port.sink.ready):
+                yield
+            yield dut.port.sink.valid.eq(0)
+            responses = 0
+            while (dut.hdd0.flushes, dut.hdd1.flushes) != (1, 1) or responses == 0:
+                if (yield dut.port.source.valid) and (yield dut.port.source.end):
+                    self.assertEqual((yield dut.port.source.failed), 0)
+                    responses += 1
+                yield
+            for i in range(128):
+                if (yield dut.port.source.valid):
+                    responses += 1
+                yield
+            self.assertEqual(responses, 1)
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.hdd0 = HDD(n=0,
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                self.submodules.core0 = LiteSATACore(self.hdd0.phy)
+
+                self.submodules.hdd1 = HDD(n=1,
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                self.submodules.core1 = LiteSATACore(self.hdd1.phy)
+
+                self.submodules.striping = LiteSATAChunkedStriping([self.core0, self.core1], stripe_sectors)
+                self.submodules.crossbar = LiteSATACrossbar(self.striping)
+
+                self.submodules.generator = LiteSATABISTGenerator(self.crossbar.get_port())
+                self.submodules.checker   = LiteSATABISTChecker(self.crossbar.get_port())
+                self.submodules.trim      = LiteSATATrim(self.crossbar.get_port())
+                self.port = self.crossbar.get_port()
+
+        dut = DUT()
+        generators = {
+            "sys" :   [generator(dut),
+                       dut.hdd0.link.generator(),
+                       dut.hdd0.phy.rx.generator(),
+                       dut.hdd0.phy.tx.generator(),
+                       dut.hdd1.link.generator(),
+                       dut.hdd1.phy.rx.generator(),
+                       dut.hdd1.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
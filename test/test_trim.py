@@ -0,0 +1,77 @@
+#
+# This file is part of LiteSATA.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+import unittest
+
+from litesata.common import *
+from litesata.core import LiteSATACore
+from litesata.frontend.arbitration import LiteSATACrossbar
+from litesata.frontend.trim import LiteSATATrim
+
+from litex.soc.interconnect.stream_sim import *
+
+from test.model.hdd import *
+
+
+class TestTrim(unittest.TestCase):
+    def trim_test(self, dw=32, max_count=None):
+        # 70 single sector ranges and a range of 65545 sectors (2 entries): 72 entries, packed in
+        # 2 commands of 1 block (64 entries).
+        ranges = [(2*i, 1) for i in range(70)] + [(1024, dsm_max_range_count + 10)]
+
+        def generator(dut):
+            dut.hdd.malloc(0, 1024 + 2**16 + 16)
+            for sector in range(4):
+                dut.hdd.write(sector, [seed_to_data(sector*1024 + i) for i in range(sectors2dwords(1))])
+
+            for i, (sector, count) in enumerate(ranges):
+                yield dut.trim.sink.valid.eq(1)
+                yield dut.trim.sink.sector.eq(sector)
+                yield dut.trim.sink.count.eq(count)
+                yield dut.trim.sink.last.eq(i == (len(ranges) - 1))
+                yield
+                while not (yield dut.trim.sink.ready):
+                    yield
+            yield dut.trim.sink.valid.eq(0)
+            while (yield dut.trim.commands.status) != 2:
+                yield
+            self.assertEqual((yield dut.trim.errors.status), 0)
+
+            # Check trimmed ranges / data.
+            self.assertEqual(dut.hdd.trimmed, ranges[:-1] + [
+                (1024, dsm_max_range_count),
+                (1024 + dsm_max_range_count, 10)])
+            self.assertEqual(dut.hdd.read(0, 1), [0]*sectors2dwords(1))
+            self.assertEqual(dut.hdd.read(1, 1), [seed_to_data(1024 + i) for i in range(sectors2dwords(1))])
+
+        class DUT(Module):
+            def __init__(self, dw, max_count):
+                self.submodules.hdd = HDD(
+                        link_debug         = False,
+                        link_random_level  = 0,
+                        transport_debug    = False,
+                        transport_loopback = False,
+                        hdd_debug          = False)
+                self.submodules.core     = LiteSATACore(self.hdd.phy)
+                self.submodules.crossbar = LiteSATACrossbar(self.core)
+                self.submodules.trim     = LiteSATATrim(self.crossbar.get_port(dw, max_count=max_count),
+                    max_blocks=1)
+
+        dut = DUT(dw, max_count)
+        generators = {
+            "sys" :   [generator(dut),
+                       dut.hdd.link.generator(),
+                       dut.hdd.phy.rx.generator(),
+                       dut.hdd.phy.tx.generator()]
+        }
+        clocks = {"sys": 10}
+        run_simulation(dut, generators, clocks)
+
+    def test_trim(self):
+        self.trim_test(dw=32)
+
+    def test_trim_64_split(self):
+        # 64-bit port, trim forwarded by the splitter of a quantum port.
+        self.trim_test(dw=64, max_count=16)